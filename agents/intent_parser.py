@@ -1,37 +1,62 @@
-import re
-import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from agents.schemas import TermSheetIntent, load_json, response_format, schema_descriptions, validate_fields
+from utils.intent_rules import CONFIDENT, extract_intent, normalize_type
+from utils.llm_cache import LLMResponseCache, invoke_llm, ainvoke_llm
+from utils.metrics import span
+
+# Compact description of each field the LLM may be asked for, from the intent schema
+INTENT_FIELDS = schema_descriptions(TermSheetIntent)
+
+# Fields the templates use for each type of financing, requested when missing
+EQUITY_FIELDS = ["amount", "company_name", "valuation", "liquidation_preference", "participation",
+                 "board_seats", "pro_rata", "anti_dilution", "dividend_rate"]
+FIELDS_BY_TYPE = {
+    "Series A": EQUITY_FIELDS,
+    "Series B": EQUITY_FIELDS,
+    "Series C": EQUITY_FIELDS,
+    "SAFE": ["amount", "company_name", "valuation_cap", "discount", "pro_rata"],
+    "Convertible Note": ["amount", "company_name", "valuation_cap", "discount", "interest_rate", "maturity"],
+}
+
+# Without these fields no template can be filled in meaningfully
+REQUIRED_FIELDS = ("type", "amount")
+
 
 class IntentParsingAgent:
-    """Agent for parsing user intent from natural language prompts."""
+    """Agent for parsing user intent from natural language prompts.
+    
+    Fields are extracted by rules first. The LLM is only consulted when a required
+    field is missing or a field was extracted with low confidence, and then it is
+    only asked for those fields and the other fields the deal type needs.
+    """
     
-    def __init__(self, model_name: str = "gpt-4"):
+    def __init__(self, model_name: str = "gpt-4o-mini", cache: Optional[LLMResponseCache] = None,
+                 llm: Optional[Any] = None, max_repairs: int = 1):
         """Initialize the intent parsing agent.
         
         Args:
-            model_name: The name of the language model to use.
+            model_name: The name of the language model to use; a small, fast model
+                suffices for filling in a few fields.
+            cache: Optional cache of LLM responses shared between agents.
+            llm: Optional pre-built chat model, e.g. one sharing a pooled HTTP client.
+            max_repairs: Maximum number of follow-up requests for fields whose values
+                failed schema validation.
         """
-        self.llm = ChatOpenAI(model=model_name)
+        self.llm = llm or ChatOpenAI(model=model_name, temperature=0.0)
+        self.cache = cache
+        self.max_repairs = max_repairs
         
         # Define the prompt template for extracting structured information
         self.prompt_template = ChatPromptTemplate.from_template(
-            """Extract structured information from the following prompt about a term sheet:
-            
-            {prompt}
+            """Extract these fields from the term sheet request below.
+            Return ONLY a JSON object with exactly these keys, using null for anything not stated:
+            {schema}
             
-            Extract the following information in JSON format:
-            - type: The type of investment (e.g., Series A, Series B, SAFE, Convertible Note)
-            - amount: The investment amount (e.g., $5M, $10M)
-            - discount: Any discount mentioned (e.g., 20%)
-            - liquidation_preference: Liquidation preference multiple (e.g., 1x, 2x)
-            - participation: Whether there's participation (true/false)
-            - valuation_cap: Any valuation cap mentioned (e.g., $20M)
-            - board_seats: Number of board seats for investors
-            - pro_rata: Whether pro rata rights are included (true/false)
-            
-            Return ONLY the JSON object without any additional text.
+            Request: {prompt}
             """
         )
     
@@ -45,16 +70,20 @@ class IntentParsingAgent:
             A dictionary containing the extracted information.
         """
         # First try rule-based parsing
-        intent = self._rule_based_parsing(prompt)
+        with span("intent.rules"):
+            intent, confidence = extract_intent(prompt)
         
-        # If rule-based parsing didn't extract enough information, use LLM
-        if len(intent) < 2:  # Arbitrary threshold
-            intent = self._llm_based_parsing(prompt)
+        # Ask the LLM only for what the rules missed or are unsure about
+        fields = self.fields_to_request(intent, confidence)
+        if fields:
+            with span("intent.llm", fields=len(fields)):
+                extracted = self._llm_based_parsing(prompt, fields)
+            intent = self._merge(intent, confidence, extracted)
         
         return intent
-    
-    def _rule_based_parsing(self, prompt: str) -> Dict[str, Any]:
-        """Use regex and rules to extract information from the prompt.
+
+    async def aparse(self, prompt: str) -> Dict[str, Any]:
+        """Asynchronously parse the user's prompt to extract structured information.
         
         Args:
             prompt: The natural language prompt from the user.
@@ -62,79 +91,152 @@ class IntentParsingAgent:
         Returns:
             A dictionary containing the extracted information.
         """
-        intent = {}
+        with span("intent.rules"):
+            intent, confidence = extract_intent(prompt)
         
-        # Extract type
-        type_patterns = [
-            r"series\s+([a-c])",
-            r"(safe)",
-            r"(convertible\s+note)"
-        ]
+        fields = self.fields_to_request(intent, confidence)
+        if fields:
+            with span("intent.llm", fields=len(fields)):
+                extracted = await self._allm_based_parsing(prompt, fields)
+            intent = self._merge(intent, confidence, extracted)
         
-        for pattern in type_patterns:
-            match = re.search(pattern, prompt.lower())
-            if match:
-                intent["type"] = match.group(1)
-                break
+        return intent
+
+    def fields_to_request(self, intent: Dict[str, Any], confidence: Dict[str, float]) -> List[str]:
+        """Decide which fields to ask the LLM for.
         
-        # Extract amount - improved pattern to handle various formats
-        amount_match = re.search(r"\$(\d+(?:\.\d+)?\s*[KMB])", prompt) or re.search(r"\$(\d+(?:\.\d+)?)\s*([KMB])", prompt)
-        if amount_match:
-            # Handle different regex match groups based on which pattern matched
-            if len(amount_match.groups()) == 1:
-                # First pattern matched
-                amount = amount_match.group(1)
-                if not amount.startswith('$'):
-                    amount = f"${amount}"
-            else:
-                # Second pattern matched
-                amount = f"${amount_match.group(1)}{amount_match.group(2)}"
-            intent["amount"] = amount
-        
-        # Extract discount
-        discount_match = re.search(r"(\d+(?:\.\d+)?)\s*%\s*discount", prompt)
-        if discount_match:
-            intent["discount"] = f"{discount_match.group(1)}%"
-        
-        # Extract liquidation preference
-        liq_pref_match = re.search(r"(\d+(?:\.\d+)?)x\s+(?:non-participating\s+)?liquidation\s+preference", prompt.lower())
-        if liq_pref_match:
-            intent["liquidation_preference"] = f"{liq_pref_match.group(1)}x"
-            intent["participation"] = "non-participating" not in prompt.lower()
-        
-        # Extract valuation cap
-        val_cap_match = re.search(r"\$(\d+(?:\.\d+)?\s*[KMB])\s+valuation\s+cap", prompt.lower())
-        if val_cap_match:
-            intent["valuation_cap"] = f"${val_cap_match.group(1)}"
-        
-        # Extract board seats
-        board_match = re.search(r"(\d+)\s+board\s+seat", prompt.lower())
-        if board_match:
-            intent["board_seats"] = int(board_match.group(1))
-        
-        # Extract pro rata rights
-        if "pro\s+rata" in prompt.lower():
-            intent["pro_rata"] = True
+        Args:
+            intent: The fields extracted by the rules.
+            confidence: The confidence of each extracted field.
+            
+        Returns:
+            The fields to request, or an empty list if the rules' result can be used as is.
+        """
+        uncertain = [field for field, score in confidence.items() if score < CONFIDENT]
+        if not uncertain and all(field in intent for field in REQUIRED_FIELDS):
+            return []
+        
+        # The call is being made anyway, so also ask for the type's other missing fields
+        wanted = list(REQUIRED_FIELDS) + FIELDS_BY_TYPE.get(intent.get("type"), [])
+        missing = [field for field in wanted if field not in intent]
+        return list(dict.fromkeys(uncertain + missing))
+
+    def _merge(self, intent: Dict[str, Any], confidence: Dict[str, float],
+               extracted: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill missing and low-confidence fields with the values the LLM extracted.
         
-        return intent
+        Args:
+            intent: The fields extracted by the rules.
+            confidence: The confidence of each rule-extracted field.
+            extracted: The fields extracted by the LLM.
+            
+        Returns:
+            The merged intent.
+        """
+        merged = dict(intent)
+        for field, value in extracted.items():
+            if value is None or value == "":
+                continue
+            if field not in merged or confidence.get(field, 0.0) < CONFIDENT:
+                merged[field] = normalize_type(value) if field == "type" else value
+        return merged
     
-    def _llm_based_parsing(self, prompt: str) -> Dict[str, Any]:
+    def _llm_based_parsing(self, prompt: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """Use LLM to extract information from the prompt.
         
+        Fields whose values fail schema validation are requested again, on their own,
+        up to ``max_repairs`` times.
+        
         Args:
             prompt: The natural language prompt from the user.
+            fields: The fields to extract (all known fields if None).
             
         Returns:
-            A dictionary containing the extracted information.
+            A dictionary containing the valid extracted fields that the prompt states.
+        """
+        messages = self._format_prompt(prompt, fields or list(INTENT_FIELDS))
+        failed = fields or list(INTENT_FIELDS)
+        values: Dict[str, Any] = {}
+        for _ in range(self.max_repairs + 1):
+            content = invoke_llm(self.llm, messages, self.cache, **self._call_options(failed))
+            extracted, errors = self._parse_llm_response(content, failed)
+            values.update(extracted)
+            if not errors:
+                break
+            failed = list(errors)
+            messages = self._repair_messages(messages, content, errors)
+        return values
+    
+    async def _allm_based_parsing(self, prompt: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Asynchronously use LLM to extract information from the prompt.
+        
+        Args:
+            prompt: The natural language prompt from the user.
+            fields: The fields to extract (all known fields if None).
+            
+        Returns:
+            A dictionary containing the valid extracted fields that the prompt states.
+        """
+        messages = self._format_prompt(prompt, fields or list(INTENT_FIELDS))
+        failed = fields or list(INTENT_FIELDS)
+        values: Dict[str, Any] = {}
+        for _ in range(self.max_repairs + 1):
+            content = await ainvoke_llm(self.llm, messages, self.cache, **self._call_options(failed))
+            extracted, errors = self._parse_llm_response(content, failed)
+            values.update(extracted)
+            if not errors:
+                break
+            failed = list(errors)
+            messages = self._repair_messages(messages, content, errors)
+        return values
+    
+    def _format_prompt(self, prompt: str, fields: List[str]) -> List[BaseMessage]:
+        """Format the extraction prompt for the requested fields."""
+        schema = "\n".join(f'"{field}": {INTENT_FIELDS[field]}' for field in fields)
+        return self.prompt_template.format_messages(schema=schema, prompt=prompt)
+    
+    def _call_options(self, fields: List[str]) -> Dict[str, Any]:
+        """Return the structured-output options for a request of the given fields."""
+        model_name = getattr(self.llm, "model_name", "") or ""
+        options = response_format(model_name, "term_sheet_intent", TermSheetIntent, fields)
+        return {"response_format": options} if options else {}
+    
+    def _repair_messages(self, messages: List[BaseMessage], content: str,
+                         errors: Dict[str, str]) -> List[BaseMessage]:
+        """Build a follow-up request for only the fields that failed validation.
+        
+        Args:
+            messages: The messages of the failed request.
+            content: The response to the failed request.
+            errors: The validation error of each failed field.
+            
+        Returns:
+            The messages of the repair request.
         """
-        chain = self.prompt_template | self.llm
-        response = chain.invoke({"prompt": prompt})
+        problems = "; ".join(f"{field}: {error}" for field, error in errors.items())
+        return messages + [
+            AIMessage(content=content),
+            HumanMessage(content=(
+                f"These values were invalid ({problems}). Return ONLY a JSON object with the keys "
+                f"{', '.join(errors)}, following the schema above and using null for anything not stated."
+            )),
+        ]
+    
+    def _parse_llm_response(self, content: str, fields: List[str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Convert the LLM response into validated intent fields.
         
+        Args:
+            content: The text returned by the language model.
+            fields: The fields that were requested.
+            
+        Returns:
+            A tuple of the valid requested fields that have a value, and the
+            validation error of each requested field that failed.
+        """
         try:
-            # Extract JSON from the response
-            json_str = response.content
-            intent = json.loads(json_str)
-            return intent
-        except (json.JSONDecodeError, AttributeError):
-            # Fallback to minimal intent if JSON parsing fails
-            return {"type": "series_a"}  # Default to Series A
\ No newline at end of file
+            data = load_json(content)
+        except ValueError as e:
+            return {}, {field: str(e) for field in fields}
+        if not isinstance(data, dict):
+            return {}, {field: "expected a JSON object" for field in fields}
+        return validate_fields(data, fields)
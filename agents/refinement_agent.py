@@ -3,44 +3,60 @@
 This agent polishes and enhances the generated term sheet content.
 """
 
-from typing import Dict, Any, Optional
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import BaseMessage
+
+from utils.completeness import check_completeness, relevant_fields, summary_section_index
+from utils.llm_cache import LLMResponseCache, invoke_llm, ainvoke_llm, stream_llm
+from utils.scheduler import context_map
+from utils.sections import split_sections, join_sections, replace_section_body
 
 
 class RefinementAgent:
     """Agent that refines and polishes the generated term sheet content."""
 
-    def __init__(self, model_name: str = "gpt-4", temperature: float = 0.2):
+    def __init__(self, model_name: str = "gpt-4", temperature: float = 0.2,
+                 cache: Optional[LLMResponseCache] = None, llm: Optional[Any] = None,
+                 fast_path: bool = True, max_concurrency: int = 8):
         """Initialize the Refinement Agent.
 
         Args:
             model_name: The name of the language model to use
             temperature: The temperature parameter for the language model
+            cache: Optional cache of LLM responses shared between agents
+            llm: Optional pre-built chat model, e.g. one sharing a pooled HTTP client
+            fast_path: Whether to skip the LLM for drafts that already reflect the
+                intent and to refine only the affected sections otherwise
+            max_concurrency: Maximum number of sections refined at once
         """
-        self.llm = ChatOpenAI(model_name=model_name, temperature=temperature)
-        self.prompt_template = ChatPromptTemplate.from_template(
+        self.llm = llm or ChatOpenAI(model_name=model_name, temperature=temperature)
+        self.cache = cache
+        self.fast_path = fast_path
+        self.max_concurrency = max_concurrency
+        self.section_prompt_template = ChatPromptTemplate.from_template(
             """You are an expert legal document editor specializing in term sheets for startup financing.
             
-            I will provide you with a draft term sheet and the original structured intent. Your task is to:
-            
-            1. Ensure all terms from the intent are properly reflected in the document
-            2. Improve the language for clarity and professionalism
-            3. Add appropriate section headers and formatting
-            4. Ensure the document follows standard term sheet conventions
-            5. Make sure the document is complete and coherent
+            Below is one section of a draft term sheet and the original structured intent.
+            Revise only this section so that every term from the intent that belongs in it is
+            reflected accurately, and fill in placeholders such as [AMOUNT] whose values are
+            given in the intent. Keep the section header, the Markdown formatting and all
+            other wording unchanged.
             
             Original intent: {intent}
             
-            Draft term sheet:
-            {draft_content}
+            Draft section:
+            {section}
             
-            Please provide the refined term sheet:
+            Return only the revised section:
             """
         )
 
     def refine(self, draft_content: str, intent: Dict[str, Any]) -> str:
-        """Refine the draft term sheet content.
+        """Refine every section of the draft term sheet content.
 
         Args:
             draft_content: The draft term sheet content
@@ -49,47 +65,136 @@ class RefinementAgent:
         Returns:
             The refined term sheet content
         """
-        # Convert intent to a readable string format for the prompt
-        intent_str = ", ".join([f"{k}: {v}" for k, v in intent.items()])
-        
-        formatted_prompt = self.prompt_template.format_messages(
-            intent=intent_str,
-            draft_content=draft_content
-        )
-        
-        response = self.llm(formatted_prompt)
-        return response.content.strip()
+        return self.refine_sections(draft_content, intent)
+
+    async def arefine(self, draft_content: str, intent: Dict[str, Any]) -> str:
+        """Asynchronously refine every section of the draft term sheet content.
+
+        Args:
+            draft_content: The draft term sheet content
+            intent: The original structured intent
+
+        Returns:
+            The refined term sheet content
+        """
+        return await self.arefine_sections(draft_content, intent)
 
-    def add_headers_and_formatting(self, content: str) -> str:
-        """Add headers and improve formatting of the term sheet.
+    def plan_refinement(self, draft_content: str, intent: Dict[str, Any]) -> Optional[List[int]]:
+        """Decide which sections of the draft need LLM refinement.
 
         Args:
-            content: The term sheet content
+            draft_content: The draft term sheet content
+            intent: The original structured intent
 
         Returns:
-            The formatted term sheet content
+            The indices of the sections to refine (empty when the draft is already
+            complete), or None when every section should be refined
         """
-        # This is a simpler version that could be used without LLM
-        # In practice, the refine method above handles this more comprehensively
+        if not self.fast_path:
+            return None
+        report = check_completeness(draft_content, intent)
+        if report["complete"]:
+            return []
+        return report["sections"]
+
+    def refine_sections(self, draft_content: str, intent: Dict[str, Any],
+                        section_indices: Optional[List[int]] = None) -> str:
+        """Refine sections of the draft in parallel and keep the rest unchanged.
+
+        Each section is sent with only the intent fields that concern it, so its
+        cached refinement is reused until the section or those fields change.
+
+        Args:
+            draft_content: The draft term sheet content
+            intent: The original structured intent
+            section_indices: Indices of the ``split_sections`` sections to refine
+                (all sections if None)
+
+        Returns:
+            The term sheet with the selected sections refined
+        """
+        sections = split_sections(draft_content)
+        prompts = self._section_prompts(sections, intent, section_indices)
+        if not prompts:
+            return draft_content
         
-        lines = content.split("\n")
-        formatted_lines = []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+            refined_sections = context_map(
+                executor,
+                lambda formatted_prompt: invoke_llm(self.llm, formatted_prompt, self.cache),
+                prompts.values()
+            )
+        return self._merge_sections(sections, dict(zip(prompts, refined_sections)))
+
+    async def arefine_sections(self, draft_content: str, intent: Dict[str, Any],
+                               section_indices: Optional[List[int]] = None) -> str:
+        """Asynchronously refine sections of the draft, all at once.
+
+        Args:
+            draft_content: The draft term sheet content
+            intent: The original structured intent
+            section_indices: Indices of the ``split_sections`` sections to refine
+                (all sections if None)
+
+        Returns:
+            The term sheet with the selected sections refined
+        """
+        sections = split_sections(draft_content)
+        prompts = self._section_prompts(sections, intent, section_indices)
+        refined_sections = await asyncio.gather(*(
+            ainvoke_llm(self.llm, formatted_prompt, self.cache)
+            for formatted_prompt in prompts.values()
+        ))
+        return self._merge_sections(sections, dict(zip(prompts, refined_sections)))
+
+    def _section_prompts(self, sections: List[str], intent: Dict[str, Any],
+                         section_indices: Optional[List[int]]) -> Dict[int, List[BaseMessage]]:
+        """Build the refinement prompt of every selected section.
+
+        Args:
+            sections: The sections produced by ``split_sections``
+            intent: The original structured intent
+            section_indices: Indices of the sections to refine (all sections if None)
+
+        Returns:
+            A dictionary mapping section indices to their prompt messages
+        """
+        if section_indices is None:
+            section_indices = [i for i, section in enumerate(sections) if section.strip()]
         
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if not line:
-                formatted_lines.append(line)
-                continue
-                
-            # Identify potential headers (short lines that don't end with punctuation)
-            if len(line) < 50 and not line[-1] in [".", ":", ",", ";"]:
-                # Make it uppercase and add underline
-                formatted_lines.append(line.upper())
-                formatted_lines.append("="*len(line))
-            else:
-                formatted_lines.append(line)
+        # Terms the template has no place for are added to the financing summary
+        report = check_completeness(join_sections(sections), intent)
+        summary_index = summary_section_index(sections)
+        unlocated = {field: intent[field] for field in report["unlocated_fields"]}
         
-        return "\n".join(formatted_lines)
+        prompts = {}
+        for index in section_indices:
+            section_intent = relevant_fields(sections[index], intent)
+            if index == summary_index:
+                section_intent.update(unlocated)
+            prompts[index] = self._format_section_prompt(sections[index], section_intent)
+        return prompts
+
+    def _merge_sections(self, sections: List[str], refined_sections: Dict[int, str]) -> str:
+        """Replace sections with their refined versions, keeping originals for empty responses."""
+        sections = list(sections)
+        for index, refined in refined_sections.items():
+            if refined.strip():
+                sections[index] = replace_section_body(sections[index], refined.strip())
+        return join_sections(sections)
+
+    def _format_section_prompt(self, section: str, intent: Dict[str, Any]) -> List[BaseMessage]:
+        """Build the prompt messages for refining a single section.
+
+        Args:
+            section: The draft section
+            intent: The intent fields relevant to the section
+
+        Returns:
+            The formatted prompt messages
+        """
+        intent_str = ", ".join([f"{k}: {v}" for k, v in intent.items()]) or "none"
+        return self.section_prompt_template.format_messages(intent=intent_str, section=section)
 
     def process(self, draft_content: str, intent: Dict[str, Any]) -> str:
         """Process the draft content with the refinement agent.
@@ -101,14 +206,67 @@ class RefinementAgent:
         Returns:
             The refined term sheet content
         """
-        # First use the LLM to refine the content
-        refined_content = self.refine(draft_content, intent)
+        # Templates that already reflect the intent need no LLM call, and
+        # incomplete ones only need their affected sections refined
+        plan = self.plan_refinement(draft_content, intent)
+        if plan == []:
+            return draft_content
+        return self.refine_sections(draft_content, intent, plan)
+
+    def stream(self, draft_content: str, intent: Dict[str, Any]) -> Iterator[str]:
+        """Process the draft content with the refinement agent, streaming the result.
+
+        Sections are emitted in document order: unchanged ones as-is and refined
+        ones as the model produces them, with the surrounding whitespace trimmed
+        as ``process`` does, so the streamed text equals its result.
+
+        Args:
+            draft_content: The draft term sheet content
+            intent: The original structured intent
+
+        Yields:
+            Chunks of the refined term sheet content
+        """
+        plan = self.plan_refinement(draft_content, intent)
+        sections = split_sections(draft_content)
+        prompts = self._section_prompts(sections, intent, plan) if plan != [] else {}
         
-        # If the LLM refinement fails or is unavailable, fall back to basic formatting
-        if not refined_content or refined_content == draft_content:
-            refined_content = self.add_headers_and_formatting(draft_content)
-            
-        return refined_content
+        for index, section in enumerate(sections):
+            if index not in prompts:
+                yield section
+                continue
+            streamed = False
+            # Whitespace is held back until text follows it, so the section ends
+            # with its own trailing whitespace rather than the model's
+            held = ""
+            for chunk in stream_llm(self.llm, prompts[index], self.cache):
+                if not streamed:
+                    chunk = chunk.lstrip()
+                    streamed = bool(chunk)
+                text = held + chunk
+                body = text.rstrip()
+                held = text[len(body):]
+                if body:
+                    yield body
+            if streamed:
+                yield section[len(section.rstrip()):] or "\n"
+            else:
+                yield section
+
+    async def aprocess(self, draft_content: str, intent: Dict[str, Any]) -> str:
+        """Asynchronously process the draft content with the refinement agent.
+
+        Args:
+            draft_content: The draft term sheet content
+            intent: The original structured intent
+
+        Returns:
+            The refined term sheet content
+        """
+        plan = self.plan_refinement(draft_content, intent)
+        if plan == []:
+            return draft_content
+        return await self.arefine_sections(draft_content, intent, plan)
 
 
 # Example usage
@@ -0,0 +1,202 @@
+"""Agent Output Schemas
+
+This module defines the typed schemas of the structured data the agents ask the
+language model for: the term sheet intent and validation issues. Responses are
+validated field by field (or issue by issue), so a malformed value only costs a
+repair request for that value instead of a re-run of the whole pipeline.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+from utils.intent_rules import normalize_type
+
+
+# Models that accept a JSON schema as ``response_format`` (structured outputs)
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+
+class TermSheetIntent(BaseModel):
+    """The structured intent of a term sheet request."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    type: Optional[str] = Field(None, description="Series A, Series B, Series C, SAFE or Convertible Note")
+    amount: Optional[str] = Field(None, description="investment amount, e.g. $5M")
+    company_name: Optional[str] = Field(None, description="e.g. Acme, Inc.")
+    valuation: Optional[str] = Field(None, description="pre-money valuation, e.g. $20M")
+    post_money_valuation: Optional[str] = Field(None, description="e.g. $25M")
+    valuation_cap: Optional[str] = Field(None, description="e.g. $10M")
+    discount: Optional[str] = Field(None, description="e.g. 20%")
+    liquidation_preference: Optional[str] = Field(None, description="multiple, e.g. 1x")
+    participation: Optional[bool] = Field(None, description="true if the preferred is participating")
+    board_seats: Optional[int] = Field(None, description="number of investor board seats")
+    pro_rata: Optional[bool] = Field(None, description="true if investors get pro rata rights")
+    interest_rate: Optional[str] = Field(None, description="e.g. 6%")
+    maturity: Optional[str] = Field(None, description="e.g. 24 months")
+    anti_dilution: Optional[str] = Field(None, description="e.g. broad-based weighted average")
+    dividend_rate: Optional[str] = Field(None, description="e.g. 8%")
+
+    @field_validator("type", mode="before")
+    @classmethod
+    def _normalize_type(cls, value: Any) -> Any:
+        return normalize_type(value) if isinstance(value, str) and value.strip() else value
+
+    @field_validator("amount", "valuation", "post_money_valuation", "valuation_cap", mode="before")
+    @classmethod
+    def _format_money(cls, value: Any) -> Any:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return f"${value:,.0f}"
+        return value
+
+    @field_validator("discount", "interest_rate", "dividend_rate", mode="before")
+    @classmethod
+    def _format_percent(cls, value: Any) -> Any:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            # Fractions such as 0.2 mean 20%
+            percent = value * 100 if 0 < value < 1 else value
+            return f"{percent:g}%"
+        return value
+
+    @field_validator("liquidation_preference", mode="before")
+    @classmethod
+    def _format_multiple(cls, value: Any) -> Any:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return f"{value:g}x"
+        return value
+
+
+class ValidationIssue(BaseModel):
+    """A problematic clause found in a term sheet."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    clause: str = Field(min_length=1, description="the problematic clause or text")
+    issue: str = Field(min_length=1, description="why it is problematic")
+    suggestion: str = Field("", description="a suggested improvement or alternative")
+
+
+class ValidationReview(BaseModel):
+    """The issues found in one reviewed section."""
+
+    issues: List[ValidationIssue] = Field(default_factory=list)
+
+
+def load_json(content: str) -> Any:
+    """Parse JSON from a model response, tolerating Markdown code fences.
+
+    Args:
+        content: The response text
+
+    Returns:
+        The parsed value
+
+    Raises:
+        ValueError: If the response contains no valid JSON
+    """
+    text = content.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"invalid JSON: {e}") from e
+
+
+def validate_fields(data: Dict[str, Any], fields: List[str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """Validate requested intent fields one at a time.
+
+    Args:
+        data: The JSON object returned by the model
+        fields: The requested fields
+
+    Returns:
+        A tuple of the valid fields that have a value, and an error message for
+        each field that failed validation
+    """
+    values = {}
+    errors = {}
+    for field in fields:
+        if data.get(field) is None:
+            continue
+        try:
+            intent = TermSheetIntent.model_validate({field: data[field]})
+        except ValidationError as e:
+            errors[field] = e.errors()[0]["msg"]
+            continue
+        values[field] = getattr(intent, field)
+    return values, errors
+
+
+def validate_issues(data: Any) -> Tuple[List[Dict[str, str]], List[str]]:
+    """Validate the issues of a review response one at a time.
+
+    Args:
+        data: The parsed response, either ``{"issues": [...]}`` or a bare list
+
+    Returns:
+        A tuple of the valid issues and an error message for each invalid one
+
+    Raises:
+        ValueError: If the response is not a list of issues at all
+    """
+    items = data.get("issues") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON object with an \"issues\" array")
+
+    issues = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            issues.append(ValidationIssue.model_validate(item).model_dump())
+        except ValidationError as e:
+            errors.append(f"issue {index}: {e.errors()[0]['msg']}")
+    return issues, errors
+
+
+def schema_descriptions(schema_model: Type[BaseModel]) -> Dict[str, str]:
+    """Describe each field of a schema compactly for a prompt, e.g. ``string (e.g. 20%)``.
+
+    Args:
+        schema_model: The pydantic model
+
+    Returns:
+        A dictionary mapping field names to their descriptions, in schema order
+    """
+    descriptions = {}
+    for name, prop in schema_model.model_json_schema()["properties"].items():
+        types = [option.get("type") for option in prop.get("anyOf", [prop])]
+        json_type = next((t for t in types if t and t != "null"), "string")
+        descriptions[name] = f"{json_type} ({prop.get('description', name)})"
+    return descriptions
+
+
+def supports_structured_output(model_name: str) -> bool:
+    """Whether a model accepts a JSON schema as its response format."""
+    return model_name.startswith(STRUCTURED_OUTPUT_MODELS)
+
+
+def response_format(model_name: str, name: str, schema_model: Type[BaseModel],
+                    fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Build the ``response_format`` option for a structured-output call.
+
+    Args:
+        model_name: The name of the model that will be called
+        name: The name of the schema
+        schema_model: The pydantic model describing the response
+        fields: Restrict the schema to these top-level properties (all if None)
+
+    Returns:
+        The response format, or None if the model does not support structured outputs
+    """
+    if not supports_structured_output(model_name):
+        return None
+    schema = schema_model.model_json_schema()
+    if fields is not None:
+        schema["properties"] = {field: schema["properties"][field] for field in fields}
+        schema.pop("required", None)
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": False}}
@@ -5,29 +5,106 @@ This agent selects and populates appropriate templates based on structured inten
 
 import os
 import json
-from typing import Dict, Any, Optional
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import threading
+from typing import Dict, Any, Optional, Tuple
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, select_autoescape
 
 
-class TemplateAgent:
-    """Agent that selects and populates templates based on structured intent."""
+class TemplateRegistry:
+    """Process-wide store of compiled templates for one templates directory.
 
-    def __init__(self, templates_dir: str = "templates"):
-        """Initialize the Template Agent.
+    All templates are compiled once when the registry is created. The underlying
+    Jinja environment keeps every compiled template in memory and checks the
+    source file's modification time on lookup, so only templates that changed on
+    disk are recompiled.
+    """
+
+    def __init__(self, templates_dir: str = "templates", bytecode_cache_dir: Optional[str] = None):
+        """Initialize the Template Registry.
 
         Args:
             templates_dir: Directory containing the templates
+            bytecode_cache_dir: Optional directory for Jinja's on-disk bytecode cache,
+                which lets new processes skip compiling unchanged templates
         """
         self.templates_dir = templates_dir
+        
+        # Ensure templates directory exists
+        os.makedirs(templates_dir, exist_ok=True)
+        
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        
         self.env = Environment(
             loader=FileSystemLoader(templates_dir),
             autoescape=select_autoescape(['html', 'xml']),
             trim_blocks=True,
-            lstrip_blocks=True
+            lstrip_blocks=True,
+            auto_reload=True,
+            cache_size=-1,
+            bytecode_cache=bytecode_cache
         )
-        
-        # Ensure templates directory exists
-        os.makedirs(templates_dir, exist_ok=True)
+        self.preload()
+
+    def preload(self) -> None:
+        """Compile every template in the templates directory."""
+        for template_name in self.env.list_templates():
+            try:
+                self.env.get_template(template_name)
+            except Exception as e:
+                print(f"Error compiling template {template_name}: {e}")
+
+    def get_template(self, template_name: str) -> Template:
+        """Return a compiled template, recompiling it only if its file changed.
+
+        Args:
+            template_name: The name of the template
+
+        Returns:
+            The compiled template
+        """
+        return self.env.get_template(template_name)
+
+
+_registries: Dict[Tuple[str, Optional[str]], TemplateRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_template_registry(templates_dir: str = "templates",
+                          bytecode_cache_dir: Optional[str] = None) -> TemplateRegistry:
+    """Return the shared registry for a templates directory, creating it on first use.
+
+    Args:
+        templates_dir: Directory containing the templates
+        bytecode_cache_dir: Optional directory for Jinja's on-disk bytecode cache
+
+    Returns:
+        The TemplateRegistry for the directory
+    """
+    key = (os.path.abspath(templates_dir), bytecode_cache_dir)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = TemplateRegistry(templates_dir, bytecode_cache_dir)
+            _registries[key] = registry
+        return registry
+
+
+class TemplateAgent:
+    """Agent that selects and populates templates based on structured intent."""
+
+    def __init__(self, templates_dir: str = "templates", bytecode_cache_dir: Optional[str] = None):
+        """Initialize the Template Agent.
+
+        Args:
+            templates_dir: Directory containing the templates
+            bytecode_cache_dir: Optional directory for Jinja's on-disk bytecode cache
+        """
+        self.templates_dir = templates_dir
+        self.registry = get_template_registry(templates_dir, bytecode_cache_dir)
+        self.env = self.registry.env
 
     def select_template(self, intent: Dict[str, Any]) -> str:
         """Select the appropriate template based on the intent.
@@ -64,7 +141,7 @@ class TemplateAgent:
             The populated template as a string
         """
         try:
-            template = self.env.get_template(template_name)
+            template = self.registry.get_template(template_name)
             return template.render(**intent)
         except Exception as e:
             # If template doesn't exist or there's an error, use fallback template
@@ -81,7 +158,31 @@ class TemplateAgent:
             The populated template as a string
         """
         template_name = self.select_template(intent)
-        return self.populate_template(template_name, intent)
+        return self.populate_template(template_name, self._build_context(intent))
+
+    def _build_context(self, intent: Dict[str, Any]) -> Dict[str, Any]:
+        """Map intent fields onto the variable names the templates use.
+
+        Args:
+            intent: The structured intent
+
+        Returns:
+            The template context
+        """
+        context = dict(intent)
+        
+        # The templates render a combined "liquidation" term
+        if "liquidation" not in context and context.get("liquidation_preference"):
+            liquidation = str(context["liquidation_preference"])
+            if "participation" in context:
+                liquidation += " participating" if context["participation"] else " non-participating"
+            context["liquidation"] = liquidation
+        
+        # Series B/C templates test for pro_rata == 'yes', Series A for truthiness
+        if context.get("pro_rata") is True:
+            context["pro_rata"] = "yes"
+        
+        return context
 
     def _generate_fallback_template(self, intent: Dict[str, Any]) -> str:
         """Generate a fallback template if the selected template is not available.
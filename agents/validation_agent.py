@@ -3,27 +3,57 @@
 This agent flags high-risk clauses and potential issues in the term sheet.
 """
 
-import re
-from typing import Dict, Any, List, Tuple
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from agents.schemas import ValidationReview, load_json, response_format, validate_issues
+from utils.llm_cache import LLMResponseCache, invoke_llm, ainvoke_llm
+from utils.metrics import span, traced
+from utils.dedupe import merge_duplicates
+from utils.risk import score_sections
+from utils.scheduler import context_map
+from utils.validation_rules import get_rule_scanner
 
 
 class ValidationAgent:
     """Agent that validates term sheets and flags high-risk clauses."""
 
-    def __init__(self, model_name: str = "gpt-4", temperature: float = 0.0):
+    def __init__(self, model_name: str = "gpt-4", temperature: float = 0.0,
+                 cache: Optional[LLMResponseCache] = None, llm: Optional[Any] = None,
+                 max_concurrency: int = 8, max_repairs: int = 1,
+                 rule_pack: Optional[str] = None, llm_review: bool = True,
+                 min_risk: float = 1.0):
         """Initialize the Validation Agent.
 
         Args:
             model_name: The name of the language model to use
             temperature: The temperature parameter for the language model
+            cache: Optional cache of LLM responses shared between agents
+            llm: Optional pre-built chat model, e.g. one sharing a pooled HTTP client
+            max_concurrency: Maximum number of sections reviewed at once
+            max_repairs: Maximum number of follow-up requests for a section whose
+                review was malformed
+            rule_pack: Path of the JSON rule pack (the bundled rules if None)
+            llm_review: Whether the LLM reviews the term sheet in addition to the
+                rules; without it validation makes no LLM calls
+            min_risk: Minimum risk score for a section to be reviewed by the LLM; every
+                changed clause adds 1, plus 1-3 per rule finding in it by severity
         """
-        self.llm = ChatOpenAI(model_name=model_name, temperature=temperature)
+        self.llm = llm or ChatOpenAI(model_name=model_name, temperature=temperature)
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.max_repairs = max_repairs
+        self.rule_scanner = get_rule_scanner(rule_pack)
+        self.llm_review = llm_review
+        self.min_risk = min_risk
         self.prompt_template = ChatPromptTemplate.from_template(
             """You are an expert legal advisor specializing in venture capital term sheets.
             
-            Review the following term sheet and identify any high-risk clauses or issues that should be flagged.
+            Review the following term sheet section and identify any high-risk clauses or issues that should be flagged.
             Focus on identifying the following types of problematic clauses:
             
             1. Uncapped indemnity clauses
@@ -40,114 +70,238 @@ class ValidationAgent:
             2. Why it's problematic
             3. A suggested improvement or alternative
             
-            Term sheet to review:
+            Term sheet section to review:
             {term_sheet}
             
-            Format your response as a JSON array of objects, each with "clause", "issue", and "suggestion" fields.
-            If no issues are found, return an empty array.
+            Format your response as a JSON object with an "issues" array of objects, each with "clause",
+            "issue", and "suggestion" fields. If no issues are found, return {{"issues": []}}.
             """
         )
 
-    def validate(self, term_sheet: str) -> List[Dict[str, str]]:
+    def validate(self, term_sheet: str, baseline: Optional[str] = None) -> List[Dict[str, str]]:
         """Validate the term sheet and identify high-risk clauses.
 
+        The rule pack runs first. The LLM then only reviews the sections whose risk
+        score reaches ``min_risk``, and only their clauses that differ from the
+        baseline; when nothing differs, no LLM call is made.
+
         Args:
             term_sheet: The term sheet content to validate
+            baseline: The known-safe draft the term sheet was refined from, if any
+                (without it every clause is reviewed)
 
         Returns:
             A list of identified issues with the term sheet
         """
-        # First try rule-based validation for common issues
-        issues = self._rule_based_validation(term_sheet)
+        issues = traced("validate.rules", self._rule_based_validation, term_sheet)
+        if not self.llm_review:
+            return issues
         
-        # Then use LLM for more comprehensive validation
-        llm_issues = self._llm_based_validation(term_sheet)
+        excerpts = self._review_excerpts(term_sheet, baseline, issues)
+        if not excerpts:
+            return issues
+        with span("validate.llm", sections=len(excerpts)):
+            llm_issues = self._llm_based_validation(excerpts)
+        return self._merge_issues(issues, llm_issues, term_sheet)
+
+    async def avalidate(self, term_sheet: str, baseline: Optional[str] = None) -> List[Dict[str, str]]:
+        """Asynchronously validate the term sheet and identify high-risk clauses.
+
+        Args:
+            term_sheet: The term sheet content to validate
+            baseline: The known-safe draft the term sheet was refined from, if any
+                (without it every clause is reviewed)
+
+        Returns:
+            A list of identified issues with the term sheet
+        """
+        issues = await asyncio.to_thread(traced, "validate.rules", self._rule_based_validation, term_sheet)
+        if not self.llm_review:
+            return issues
         
-        # Combine issues, avoiding duplicates
-        seen_clauses = {issue["clause"] for issue in issues}
-        for issue in llm_issues:
-            if issue["clause"] not in seen_clauses:
-                issues.append(issue)
-                seen_clauses.add(issue["clause"])
-                
-        return issues
+        excerpts = self._review_excerpts(term_sheet, baseline, issues)
+        if not excerpts:
+            return issues
+        with span("validate.llm", sections=len(excerpts)):
+            llm_issues = await self._allm_based_validation(excerpts)
+        return self._merge_issues(issues, llm_issues, term_sheet)
+
+    def _review_excerpts(self, term_sheet: str, baseline: Optional[str],
+                         issues: List[Dict[str, Any]]) -> List[str]:
+        """Select what the LLM needs to review.
+
+        Args:
+            term_sheet: The term sheet content to validate
+            baseline: The known-safe draft the term sheet was refined from, if any
+            issues: The rule findings, which raise the risk score of changed clauses
+
+        Returns:
+            The changed clauses of each section scoring at least ``min_risk``, with
+            the section header, in document order
+        """
+        return [
+            section["excerpt"]
+            for section in score_sections(term_sheet, baseline, issues)
+            if section["changed"] and section["score"] >= self.min_risk
+        ]
+
+    def _merge_issues(self, issues: List[Dict[str, str]], llm_issues: List[Dict[str, str]],
+                      term_sheet: Optional[str] = None) -> List[Dict[str, str]]:
+        """Combine rule-based and LLM issues, folding near-duplicates together.
+
+        An LLM issue that quotes the clause of a rule finding, or describes it in
+        similar words, is merged into the rule finding.
+
+        Args:
+            issues: The issues found by the rule-based validation
+            llm_issues: The issues found by the LLM validation
+            term_sheet: The validated term sheet, used to locate quoted clauses
+
+        Returns:
+            The combined list of issues
+        """
+        return merge_duplicates(issues + llm_issues, document=term_sheet)
 
     def _rule_based_validation(self, term_sheet: str) -> List[Dict[str, str]]:
-        """Use regex and rules to identify common issues.
+        """Use the compiled rule pack to identify common issues.
 
         Args:
             term_sheet: The term sheet content to validate
 
         Returns:
-            A list of identified issues
+            A list of identified issues, each with the line and character span
+            where it was found
         """
-        issues = []
-        
-        # Check for uncapped indemnity
-        if re.search(r"indemnify.*without limitation|unlimited indemnity|uncapped indemnity", 
-                    term_sheet, re.IGNORECASE | re.DOTALL):
-            issues.append({
-                "clause": "Uncapped Indemnity",
-                "issue": "The term sheet contains uncapped indemnity provisions, which create unlimited liability.",
-                "suggestion": "Add a cap on indemnity obligations, typically tied to the investment amount."
-            })
-        
-        # Check for unusual liquidation preferences
-        match = re.search(r"(\d+(?:\.\d+)?)\s*[xX]\s*(?:participating|liquidation)", term_sheet)
-        if match and float(match.group(1)) > 1.5:
-            issues.append({
-                "clause": f"{match.group(1)}x Liquidation Preference",
-                "issue": f"A {match.group(1)}x liquidation preference is higher than the standard 1x preference.",
-                "suggestion": "Consider negotiating down to a 1x non-participating liquidation preference, which is industry standard."
-            })
-        
-        # Check for full-ratchet anti-dilution
-        if re.search(r"full.?ratchet|full.?ratchet\s+anti.?dilution", term_sheet, re.IGNORECASE):
-            issues.append({
-                "clause": "Full-Ratchet Anti-dilution",
-                "issue": "Full-ratchet anti-dilution provisions are aggressive and can severely impact common shareholders.",
-                "suggestion": "Consider a more balanced weighted average anti-dilution provision."
-            })
-        
-        # Check for unusual vesting terms
-        if re.search(r"vesting.{1,50}(5|6|7|8|9|10)\s+years", term_sheet, re.IGNORECASE):
-            issues.append({
-                "clause": "Extended Vesting Schedule",
-                "issue": "The vesting schedule appears to be longer than the industry standard of 4 years.",
-                "suggestion": "Consider a standard 4-year vesting schedule with a 1-year cliff."
-            })
-        
-        return issues
+        return self.rule_scanner.scan(term_sheet)
 
-    def _llm_based_validation(self, term_sheet: str) -> List[Dict[str, str]]:
+    def _llm_based_validation(self, sections: List[str]) -> List[Dict[str, str]]:
         """Use LLM to identify issues in the term sheet.
 
+        Each section is reviewed separately and in parallel, so the cached review
+        of a section is reused until that section changes.
+
         Args:
-            term_sheet: The term sheet content to validate
+            sections: The sections (or excerpts of sections) to review
 
         Returns:
-            A list of identified issues
+            A list of identified issues, in document order
         """
-        import json
-        
-        formatted_prompt = self.prompt_template.format_messages(term_sheet=term_sheet)
-        response = self.llm(formatted_prompt)
+        prompts = self._section_prompts(sections)
+        if not prompts:
+            return []
         
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(prompts))) as executor:
+            reviews = context_map(executor, self._review_section, prompts)
+            return [issue for issues in reviews for issue in issues]
+
+    async def _allm_based_validation(self, sections: List[str]) -> List[Dict[str, str]]:
+        """Asynchronously use LLM to identify issues in the term sheet, section by section.
+
+        Args:
+            sections: The sections (or excerpts of sections) to review
+
+        Returns:
+            A list of identified issues, in document order
+        """
+        reviews = await asyncio.gather(*(
+            self._areview_section(formatted_prompt)
+            for formatted_prompt in self._section_prompts(sections)
+        ))
+        return [issue for issues in reviews for issue in issues]
+
+    def _review_section(self, messages: List[BaseMessage]) -> List[Dict[str, str]]:
+        """Review one section, re-requesting it if the response is malformed.
+
+        Args:
+            messages: The review prompt of the section
+
+        Returns:
+            The valid issues found in the section
+        """
+        options = self._call_options()
+        issues: List[Dict[str, str]] = []
+        for _ in range(self.max_repairs + 1):
+            content = invoke_llm(self.llm, messages, self.cache, **options)
+            issues, errors = self._parse_llm_issues(content)
+            if not errors:
+                break
+            messages = self._repair_messages(messages, content, errors)
+        return issues
+
+    async def _areview_section(self, messages: List[BaseMessage]) -> List[Dict[str, str]]:
+        """Asynchronously review one section, re-requesting it if the response is malformed.
+
+        Args:
+            messages: The review prompt of the section
+
+        Returns:
+            The valid issues found in the section
+        """
+        options = self._call_options()
+        issues: List[Dict[str, str]] = []
+        for _ in range(self.max_repairs + 1):
+            content = await ainvoke_llm(self.llm, messages, self.cache, **options)
+            issues, errors = self._parse_llm_issues(content)
+            if not errors:
+                break
+            messages = self._repair_messages(messages, content, errors)
+        return issues
+
+    def _call_options(self) -> Dict[str, Any]:
+        """Return the structured-output options for a section review."""
+        model_name = getattr(self.llm, "model_name", "") or ""
+        options = response_format(model_name, "term_sheet_review", ValidationReview)
+        return {"response_format": options} if options else {}
+
+    def _repair_messages(self, messages: List[BaseMessage], content: str,
+                         errors: List[str]) -> List[BaseMessage]:
+        """Build a follow-up request for a section whose review was malformed.
+
+        Args:
+            messages: The messages of the failed request
+            content: The response to the failed request
+            errors: What was wrong with the response
+
+        Returns:
+            The messages of the repair request
+        """
+        return messages + [
+            AIMessage(content=content),
+            HumanMessage(content=(
+                f"That response was invalid ({'; '.join(errors)}). Return ONLY a JSON object with an "
+                '"issues" array of objects with non-empty "clause" and "issue" fields and a "suggestion" field.'
+            )),
+        ]
+
+    def _section_prompts(self, sections: List[str]) -> List[List[BaseMessage]]:
+        """Build the review prompt of every non-empty section.
+
+        Args:
+            sections: The sections to review
+
+        Returns:
+            The formatted prompt messages, in document order
+        """
+        return [
+            self.prompt_template.format_messages(term_sheet=section)
+            for section in sections
+            if section.strip()
+        ]
+
+    def _parse_llm_issues(self, content: str) -> Tuple[List[Dict[str, str]], List[str]]:
+        """Convert the LLM response into a list of issues.
+
+        Args:
+            content: The text returned by the language model
+
+        Returns:
+            A tuple of the valid issues and a description of each problem with the
+            response (empty if it was well-formed)
+        """
         try:
-            # Extract JSON from the response
-            json_str = response.content.strip()
-            # Handle case where the model might include markdown code block formatting
-            if json_str.startswith("```json"):
-                json_str = json_str.split("```json")[1]
-            if json_str.endswith("```"):
-                json_str = json_str.split("```")[0]
-                
-            issues = json.loads(json_str)
-            return issues
-        except (json.JSONDecodeError, AttributeError) as e:
-            print(f"Error parsing LLM response for validation: {e}")
-            # Return empty list if parsing fails
-            return []
+            return validate_issues(load_json(content))
+        except ValueError as e:
+            return [], [str(e)]
 
     def format_issues_report(self, issues: List[Dict[str, str]]) -> str:
         """Format the identified issues into a readable report.
@@ -166,22 +320,40 @@ class ValidationAgent:
         
         for i, issue in enumerate(issues, 1):
             report += f"## Issue {i}: {issue['clause']}\n\n"
+            if "line" in issue:
+                report += f"**Location:** line {issue['line']}\n\n"
             report += f"**Problem:** {issue['issue']}\n\n"
             report += f"**Suggestion:** {issue['suggestion']}\n\n"
             report += "---\n\n"
         
         return report
 
-    def process(self, term_sheet: str) -> Tuple[List[Dict[str, str]], str]:
+    def process(self, term_sheet: str, baseline: Optional[str] = None) -> Tuple[List[Dict[str, str]], str]:
         """Process the term sheet with the validation agent.
 
         Args:
             term_sheet: The term sheet content to validate
+            baseline: The known-safe draft the term sheet was refined from, if any
+
+        Returns:
+            A tuple containing the list of issues and a formatted report
+        """
+        issues = self.validate(term_sheet, baseline)
+        report = self.format_issues_report(issues)
+        return issues, report
+
+    async def aprocess(self, term_sheet: str,
+                       baseline: Optional[str] = None) -> Tuple[List[Dict[str, str]], str]:
+        """Asynchronously process the term sheet with the validation agent.
+
+        Args:
+            term_sheet: The term sheet content to validate
+            baseline: The known-safe draft the term sheet was refined from, if any
 
         Returns:
             A tuple containing the list of issues and a formatted report
         """
-        issues = self.validate(term_sheet)
+        issues = await self.avalidate(term_sheet, baseline)
         report = self.format_issues_report(issues)
         return issues, report
 
@@ -0,0 +1,70 @@
+"""Template Rendering Benchmark
+
+Compares the per-render cost of building a fresh Jinja environment for every
+request (the previous TemplateAgent behaviour) with rendering through the shared
+TemplateRegistry.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_templates
+"""
+
+import argparse
+import timeit
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from agents.template_agent import TemplateAgent
+
+
+INTENTS = [
+    {"type": "Series A", "amount": "$5M", "discount": "20%", "board_seats": 1, "pro_rata": True},
+    {"type": "Series B", "amount": "$20M", "valuation": "$80M"},
+    {"type": "SAFE", "amount": "$500K", "valuation_cap": "$10M", "discount": "20%"},
+    {"type": "Convertible Note", "amount": "$1M", "company_name": "Example, Inc."},
+]
+
+
+def render_uncached(intent):
+    """Render the way TemplateAgent did before the registry: new environment per call."""
+    env = Environment(
+        loader=FileSystemLoader("templates"),
+        autoescape=select_autoescape(['html', 'xml']),
+        trim_blocks=True,
+        lstrip_blocks=True
+    )
+    agent = TemplateAgent()
+    return env.get_template(agent.select_template(intent)).render(**intent)
+
+
+def render_cached(intent):
+    """Render through a new TemplateAgent backed by the shared registry."""
+    return TemplateAgent().process(intent)
+
+
+def measure(func, repeat: int) -> float:
+    """Return the mean cost of one render in microseconds."""
+    def run():
+        for intent in INTENTS:
+            func(intent)
+    seconds = min(timeit.repeat(run, number=repeat, repeat=3))
+    return seconds / (repeat * len(INTENTS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark template rendering")
+    parser.add_argument("--repeat", type=int, default=50, help="Renders per intent per round")
+    args = parser.parse_args()
+
+    # Warm the shared registry so the measurement reflects steady state
+    render_cached(INTENTS[0])
+
+    before = measure(render_uncached, args.repeat)
+    after = measure(render_cached, args.repeat)
+    print(f"Fresh environment per render: {before:10.1f} us/render")
+    print(f"Shared template registry:     {after:10.1f} us/render")
+    print(f"Speed-up:                     {before / after:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark Corpus
+
+This module provides the representative prompts and term sheet documents the
+benchmarks run over: the sample prompt and output shipped in ``output/``, a few
+prompts for the other deal types, and larger documents generated from the
+sample output.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+
+SAMPLE_INPUT_PATH = os.path.join("output", "sample_input.txt")
+SAMPLE_OUTPUT_PATH = os.path.join("output", "sample_output.txt")
+
+EXTRA_PROMPTS = [
+    "Draft a $20M Series B term sheet at an $80M pre-money valuation with a 1x participating "
+    "liquidation preference, 2 board seats for investors and broad-based weighted average anti-dilution.",
+    "Create a SAFE for $500K with a $10M valuation cap and 20% discount for Example Labs, Inc.",
+    "Draft a $1M convertible note with 6% interest, a 24 month maturity, a $12M valuation cap "
+    "and 15% discount.",
+]
+
+
+def load_prompts() -> List[str]:
+    """Return the benchmark prompts, starting with the sample input.
+
+    Returns:
+        The list of prompts
+    """
+    prompts = []
+    if os.path.exists(SAMPLE_INPUT_PATH):
+        with open(SAMPLE_INPUT_PATH, "r", encoding="utf-8") as f:
+            prompts.append(f.read().strip())
+    return prompts + EXTRA_PROMPTS
+
+
+def load_sample_document() -> str:
+    """Return the sample term sheet from ``output/sample_output.txt``."""
+    with open(SAMPLE_OUTPUT_PATH, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def generate_document(pages: int, base: Optional[str] = None) -> str:
+    """Generate a long term sheet by repeating the sections of the sample output.
+
+    Each copy of a section gets a numbered header, so the document has as many
+    distinct sections as a long agreement. One page is taken to be about 3,000
+    characters.
+
+    Args:
+        pages: Approximate length of the document in pages
+        base: The document whose sections are repeated (the sample output if None)
+
+    Returns:
+        The generated document
+    """
+    base = base if base is not None else load_sample_document()
+    title, _, body = base.partition("\n## ")
+    sections = ["## " + section for section in body.split("\n## ")] if body else [base]
+
+    target = pages * 3000
+    parts = [title.rstrip() + "\n\n"]
+    length = len(parts[0])
+    copy = 0
+    while length < target:
+        copy += 1
+        for section in sections:
+            numbered = re.sub(r"^## (.*)", lambda m: f"## {m.group(1)} ({copy})", section, count=1)
+            parts.append(numbered.rstrip() + "\n\n")
+            length += len(parts[-1])
+    return "".join(parts)
+
+
+LIST_SECTION = """## CLOSING CONDITIONS
+
+- Completion of customary legal due diligence by the Investors,
+  including review of material contracts and intellectual property
+- Delivery of a customary management rights letter
+  to each Investor requesting one
+  - Satisfactory to the Investors in form and substance
+- Filing of the Amended and Restated Certificate of Incorporation
+(1) Qualification of the shares under applicable securities laws
+"""
+
+
+def generate_list_document(pages: int) -> str:
+    """Generate a long term sheet made of list items with continuation lines.
+
+    Args:
+        pages: Approximate length of the document in pages
+
+    Returns:
+        The generated document
+    """
+    return generate_document(pages, base="# CLOSING CHECKLIST\n\n" + LIST_SECTION)
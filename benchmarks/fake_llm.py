@@ -0,0 +1,133 @@
+"""Fake Chat Model
+
+This module provides a deterministic stand-in for the OpenAI chat models so the
+pipeline can be benchmarked without network calls. Responses are derived from
+the prompt the agents send: intent extraction returns a canned JSON intent,
+refinement echoes the draft back unchanged, and validation reports no issues.
+A fixed latency (plus an optional per-token delay) simulates the API.
+"""
+
+import re
+import json
+import time
+import asyncio
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+DEFAULT_INTENT = {
+    "type": "Series A",
+    "amount": "$5M",
+    "discount": "20%",
+    "liquidation_preference": "1x",
+    "participation": False,
+    "valuation_cap": "$20M",
+    "board_seats": 1,
+    "pro_rata": True,
+}
+
+SECTION_PATTERN = re.compile(r"Draft section:\s*\n(.*?)\n\s*Return only the revised section:", re.DOTALL)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers the agents' prompts deterministically."""
+
+    model_name: str = "fake-gpt"
+    temperature: Optional[float] = None
+    latency: float = 0.0
+    seconds_per_token: float = 0.0
+    intent: Dict[str, Any] = DEFAULT_INTENT
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def respond(self, prompt: str) -> str:
+        """Return the canned response for a prompt.
+
+        Args:
+            prompt: The text of the last prompt message
+
+        Returns:
+            The response text
+        """
+        if "Extract" in prompt and "JSON" in prompt:
+            return json.dumps(self.intent)
+        match = SECTION_PATTERN.search(prompt)
+        if match:
+            return match.group(1).strip()
+        if '"issues"' in prompt:
+            return '{"issues": []}'
+        if "JSON array" in prompt:
+            return "[]"
+        return ""
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        self.calls += 1
+        return self.respond(messages[-1].content)
+
+    def _delay(self, text: str) -> float:
+        return self.latency + self.seconds_per_token * _count_tokens(text)
+
+    def _message(self, messages: List[BaseMessage], content: str) -> AIMessage:
+        return AIMessage(content=content, usage_metadata=_usage(messages, content))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        content = self._reply(messages)
+        time.sleep(self._delay(content))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        content = self._reply(messages)
+        await asyncio.sleep(self._delay(content))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        content = self._reply(messages)
+        time.sleep(self.latency)
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            time.sleep(self.seconds_per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=_usage(messages, content)))
+
+
+def fake_llm_factory(latency: float = 0.0, seconds_per_token: float = 0.0,
+                     intent: Optional[Dict[str, Any]] = None) -> Callable[[str, Optional[float]], FakeChatModel]:
+    """Return an ``llm_factory`` for ``TermSheetPipeline`` that builds fake models.
+
+    Args:
+        latency: Seconds each call waits before responding
+        seconds_per_token: Additional seconds per response token
+        intent: The intent returned for extraction prompts (DEFAULT_INTENT if None)
+
+    Returns:
+        A callable taking a model name and temperature
+    """
+    def factory(model_name: str, temperature: Optional[float] = None) -> FakeChatModel:
+        return FakeChatModel(
+            model_name=model_name,
+            temperature=temperature,
+            latency=latency,
+            seconds_per_token=seconds_per_token,
+            intent=dict(intent or DEFAULT_INTENT)
+        )
+    return factory
+
+
+def _count_tokens(text: str) -> int:
+    # Roughly four characters per token, as for OpenAI's tokenizers on English text
+    return max(1, len(text) // 4)
+
+
+def _usage(messages: List[BaseMessage], content: str) -> Dict[str, int]:
+    input_tokens = sum(_count_tokens(str(message.content)) for message in messages)
+    output_tokens = _count_tokens(content)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens}
@@ -0,0 +1,386 @@
+"""Pipeline Benchmark Suite
+
+Runs the full pipeline, each agent and DOCX generation over a corpus of
+representative prompts and documents, using the deterministic fake chat model
+from ``benchmarks.fake_llm`` instead of the OpenAI API. For every benchmark it
+reports throughput, p50/p95 latency and peak traced memory, and compares them
+against a stored baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.run                    # compare against benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline  # record a new baseline
+    python -m benchmarks.run --only docx        # run the benchmarks whose name contains "docx"
+
+The exit status is 1 when any benchmark regresses beyond the tolerance, or when
+the baseline was recorded with other settings than the run's.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from agents.intent_parser import IntentParsingAgent
+from agents.template_agent import TemplateAgent
+from agents.refinement_agent import RefinementAgent
+from agents.validation_agent import ValidationAgent
+from benchmarks.corpus import generate_document, generate_list_document, load_prompts, load_sample_document
+from benchmarks.fake_llm import fake_llm_factory
+from pipeline import TermSheetPipeline
+from utils.docx_generator import create_docx_from_text
+from utils.markdown import parse, render_html, render_text
+from utils.rate_limit import RateLimiter
+
+
+DEFAULT_BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+
+# Metrics where a higher value is worse, and the one where a lower value is worse
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "peak_kb")
+LOWER_IS_WORSE = ("throughput",)
+
+# A metric only regresses when it is worse by more than the tolerance and by more
+# than this absolute amount (throughput by its time per operation, in ms), so
+# scheduler noise on sub-millisecond benchmarks is not reported
+ABSOLUTE_FLOORS = {"p50_ms": 2.0, "p95_ms": 5.0, "throughput": 2.0, "peak_kb": 256.0}
+
+# p95 of a few iterations is close to their maximum, and so noisier than p50;
+# its tolerance is this many times the relative tolerance
+TOLERANCE_SCALES = {"p95_ms": 2.0}
+
+
+def build_benchmarks(latency: float, workdir: str) -> Dict[str, Callable[[], List[Callable[[], Any]]]]:
+    """Return the benchmarks, keyed by name.
+
+    Each benchmark is a setup function returning the list of operations to time;
+    one iteration runs every operation once.
+
+    Args:
+        latency: Seconds each fake LLM call takes
+        workdir: Directory for files written by the benchmarks
+
+    Returns:
+        A dictionary mapping benchmark names to setup functions
+    """
+    factory = fake_llm_factory(latency=latency)
+    prompts = load_prompts()
+    documents = {
+        # A one-line document, so the per-document setup dominates
+        "title_only": "# TERM SHEET\n",
+        "sample": load_sample_document(),
+        "20_pages": generate_document(20),
+        "100_pages": generate_document(100),
+        "100_pages_lists": generate_list_document(100),
+    }
+
+    def drafts():
+        template_agent = TemplateAgent()
+        intent_agent = IntentParsingAgent(llm=factory("fake-gpt", None))
+        intents = [intent_agent.parse(prompt) for prompt in prompts]
+        return [(template_agent.process(intent), intent) for intent in intents]
+
+    def pipeline_process():
+        pipeline = TermSheetPipeline(model_name="fake-gpt", use_cache=False, llm_factory=factory).open()
+        return [
+            lambda prompt=prompt, index=index: pipeline.process(
+                prompt, output_dir=os.path.join(workdir, "pipeline", str(index)), verbose=False
+            )
+            for index, prompt in enumerate(prompts)
+        ]
+
+    def pipeline_generate():
+        # Outputs are rendered in memory only, as when they are served as downloads
+        pipeline = TermSheetPipeline(model_name="fake-gpt", use_cache=False, llm_factory=factory).open()
+        return [lambda prompt=prompt: pipeline.generate(prompt, verbose=False) for prompt in prompts]
+
+    def intent_parse():
+        agent = IntentParsingAgent(llm=factory("fake-gpt", None))
+        return [lambda prompt=prompt: agent.parse(prompt) for prompt in prompts]
+
+    def template_process():
+        agent = TemplateAgent()
+        intent_agent = IntentParsingAgent(llm=factory("fake-gpt", None))
+        intents = [intent_agent.parse(prompt) for prompt in prompts]
+        return [lambda intent=intent: agent.process(intent) for intent in intents]
+
+    def refine_process():
+        agent = RefinementAgent(llm=factory("fake-gpt", 0.2))
+        return [lambda draft=draft, intent=intent: agent.process(draft, intent)
+                for draft, intent in drafts()]
+
+    def refine_full_document(name):
+        def setup():
+            agent = RefinementAgent(llm=factory("fake-gpt", 0.2), fast_path=False)
+            return [lambda: agent.process(documents[name], {"type": "Series A"})]
+        return setup
+
+    def validate_process(name):
+        def setup():
+            agent = ValidationAgent(llm=factory("fake-gpt", 0.0))
+            return [lambda: agent.process(documents[name])]
+        return setup
+
+    def validate_one_change(name):
+        def setup():
+            # A refined document that departs from its template draft in a single clause
+            agent = ValidationAgent(llm=factory("fake-gpt", 0.0))
+            changed = documents[name] + "\n**Termination:** The Investors may terminate at any time.\n"
+            return [lambda: agent.process(changed, baseline=documents[name])]
+        return setup
+
+    def validate_rules(name):
+        def setup():
+            agent = ValidationAgent(llm=factory("fake-gpt", 0.0), llm_review=False)
+            return [lambda: agent.process(documents[name])]
+        return setup
+
+    def docx_create(name):
+        def setup():
+            path = os.path.join(workdir, f"{name}.docx")
+            return [lambda: create_docx_from_text(documents[name], path)]
+        return setup
+
+    def markdown_parse(name):
+        def setup():
+            return [lambda: parse(documents[name])]
+        return setup
+
+    def markdown_render(name, render):
+        def setup():
+            # Rendering reuses one parsed tree
+            document = parse(documents[name])
+            return [lambda: render(document)]
+        return setup
+
+    def rate_limit_acquire():
+        # Limits high enough never to wait, so only the bookkeeping of every call is timed
+        limiter = RateLimiter(requests_per_minute=10 ** 9, tokens_per_minute=10 ** 12)
+
+        def acquire():
+            for _ in range(1000):
+                limiter.acquire(1500)
+                limiter.settle(1500, 1200)
+        return [acquire]
+
+    return {
+        "pipeline.process": pipeline_process,
+        "pipeline.generate": pipeline_generate,
+        "intent.parse": intent_parse,
+        "template.process": template_process,
+        "refine.process": refine_process,
+        "refine.sample_all_sections": refine_full_document("sample"),
+        "validate.sample": validate_process("sample"),
+        "validate.20_pages": validate_process("20_pages"),
+        "validate.sample_one_change": validate_one_change("sample"),
+        "validate.rules_100_pages": validate_rules("100_pages"),
+        "docx.title_only": docx_create("title_only"),
+        "docx.sample": docx_create("sample"),
+        "docx.20_pages": docx_create("20_pages"),
+        "docx.100_pages": docx_create("100_pages"),
+        "docx.100_pages_lists": docx_create("100_pages_lists"),
+        "markdown.parse_100_pages": markdown_parse("100_pages"),
+        "markdown.parse_100_pages_lists": markdown_parse("100_pages_lists"),
+        "markdown.html_100_pages": markdown_render("100_pages", render_html),
+        "markdown.text_100_pages": markdown_render("100_pages", render_text),
+        "rate_limit.acquire_1000": rate_limit_acquire,
+    }
+
+
+def measure(operations: Sequence[Callable[[], Any]], iterations: int, warmup: int = 1) -> Dict[str, float]:
+    """Time a benchmark's operations and measure their peak memory.
+
+    Latencies are measured without tracing; peak memory is measured in a
+    separate traced iteration, since tracemalloc slows allocation down.
+
+    Args:
+        operations: The operations to run
+        iterations: Number of timed iterations over all operations
+        warmup: Number of untimed iterations run first
+
+    Returns:
+        A dictionary with ``throughput`` (operations per second), ``p50_ms``,
+        ``p95_ms`` and ``peak_kb``
+    """
+    for _ in range(warmup):
+        for operation in operations:
+            operation()
+
+    # Start from a clean heap, so garbage left by earlier benchmarks is not collected
+    # during this one
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for operation in operations:
+            start = time.perf_counter()
+            operation()
+            latencies.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for operation in operations:
+            operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "throughput": round(len(latencies) / elapsed, 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Return a percentile of a list of values, interpolating between ranks.
+
+    Args:
+        values: The values
+        percent: The percentile, between 0 and 100
+
+    Returns:
+        The percentile value
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Compare results against a baseline.
+
+    A metric regresses when it is worse than the baseline by more than its
+    tolerance (``tolerance`` scaled by ``TOLERANCE_SCALES``) and by more than its
+    ``ABSOLUTE_FLOORS`` amount.
+
+    Args:
+        results: The measured results, keyed by benchmark name
+        baseline: The baseline results, keyed by benchmark name
+        tolerance: Allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        A description of every regression (empty if there are none)
+    """
+    regressions = []
+    for name, measured in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if metric not in expected:
+                continue
+            limit = 1 + tolerance * TOLERANCE_SCALES.get(metric, 1.0)
+            if (measured[metric] > expected[metric] * limit
+                    and measured[metric] - expected[metric] > ABSOLUTE_FLOORS[metric]):
+                regressions.append(f"{name}: {metric} {measured[metric]} > baseline {expected[metric]}")
+        for metric in LOWER_IS_WORSE:
+            if metric not in expected or not measured[metric] or not expected[metric]:
+                continue
+            limit = 1 + tolerance * TOLERANCE_SCALES.get(metric, 1.0)
+            slowdown_ms = 1000 / measured[metric] - 1000 / expected[metric]
+            if measured[metric] < expected[metric] / limit and slowdown_ms > ABSOLUTE_FLOORS[metric]:
+                regressions.append(f"{name}: {metric} {measured[metric]} < baseline {expected[metric]}")
+    return regressions
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    """Load a stored baseline, or return None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_results(results: Dict[str, Dict[str, float]],
+                  baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    """Print a results table, with the change against the baseline p95 if available."""
+    print(f"{'benchmark':<28}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>11}{'p95 vs base':>13}")
+    for name, measured in results.items():
+        change = ""
+        expected = (baseline or {}).get(name)
+        if expected and expected.get("p95_ms"):
+            change = f"{(measured['p95_ms'] / expected['p95_ms'] - 1) * 100:+.0f}%"
+        print(f"{name:<28}{measured['throughput']:>10.1f}{measured['p50_ms']:>10.2f}"
+              f"{measured['p95_ms']:>10.2f}{measured['peak_kb']:>11.1f}{change:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the term sheet pipeline with a fake LLM")
+    parser.add_argument("--iterations", "-n", type=int, default=5, help="Timed iterations per benchmark")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds each fake LLM call takes")
+    parser.add_argument("--only", help="Run only benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="Path of the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative regression (0.5 = 50%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args()
+
+    # The fake model has no rate limits, and throttling it would only measure the limiter
+    os.environ.setdefault("TERM_SHEET_LLM_RPM", "0")
+    os.environ.setdefault("TERM_SHEET_LLM_TPM", "0")
+
+    stored = load_baseline(args.baseline)
+    baseline = (stored or {}).get("benchmarks", {})
+    settings = {"iterations": args.iterations, "latency": args.latency}
+    if stored and stored.get("settings") != settings:
+        # Results measured with other settings are not comparable, and would mix
+        # into the baseline if only some benchmarks were re-recorded
+        if not args.update_baseline:
+            print(f"Baseline was recorded with {stored.get('settings')}, running with {settings}; "
+                  f"run with the baseline's settings, or re-record it with --update-baseline")
+            sys.exit(1)
+        if args.only:
+            print(f"Baseline was recorded with {stored.get('settings')}; re-record every benchmark "
+                  f"(without --only) to change the settings")
+            sys.exit(1)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        benchmarks = build_benchmarks(args.latency, workdir)
+        for name, setup in benchmarks.items():
+            if args.only and args.only not in name:
+                continue
+            results[name] = measure(setup(), args.iterations)
+
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "settings": settings,
+                "machine": f"{platform.python_implementation()} {platform.python_version()} on {platform.machine()}",
+                "benchmarks": baseline,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if stored is None:
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to record one")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSION: {len(regressions)} metric(s) worse than the baseline "
+              f"by more than {args.tolerance:.0%}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
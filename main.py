@@ -7,19 +7,20 @@ based on a natural language prompt.
 
 import os
 import sys
+import csv
 import json
+import logging
+import functools
 import argparse
-from typing import Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 
-# Import agents
-from agents.intent_parser import IntentParsingAgent
-from agents.template_agent import TemplateAgent
-from agents.refinement_agent import RefinementAgent
-from agents.validation_agent import ValidationAgent
-
-# Import utilities
-from utils.docx_generator import text_to_docx
+from pipeline import TermSheetPipeline, get_pipeline
+from utils.metrics import RunMetrics
+from utils.rate_limit import BATCH, llm_priority
+from utils.scheduler import submit_in_context
+from utils.workspace import get_workspace, run_name
 
 
 def setup_environment() -> None:
@@ -34,69 +35,266 @@ def setup_environment() -> None:
 
 def process_prompt(prompt: str, model_name: str = "gpt-4", 
                   generate_docx: bool = True, 
-                  validate: bool = True) -> Tuple[str, Optional[str], Optional[str]]:
+                  validate: bool = True,
+                  output_dir: Optional[str] = "output",
+                  verbose: bool = True,
+                  use_cache: bool = True,
+                  metrics: Optional[RunMetrics] = None) -> Tuple[str, Optional[str], Optional[str]]:
     """Process a natural language prompt to generate a term sheet.
 
+    Runs on the shared pipeline for the model, so agents and HTTP connections
+    are reused across calls.
+
     Args:
         prompt: The natural language prompt
         model_name: The name of the language model to use
         generate_docx: Whether to generate a DOCX document
         validate: Whether to validate the term sheet
+        output_dir: Workspace directory; each run writes its term sheet, report and
+            DOCX to a directory of its own in it (nothing is written if None)
+        verbose: Whether to print progress messages
+        use_cache: Whether to reuse cached LLM responses for identical prompts
+        metrics: Collects the run's stage timings and LLM usage (a new RunMetrics if None)
 
     Returns:
         A tuple containing the term sheet text, validation report (if any), and path to DOCX (if generated)
     """
-    print(f"\n[1/4] Parsing intent from prompt: '{prompt}'")
-    intent_agent = IntentParsingAgent(model_name=model_name)
-    structured_intent = intent_agent.parse(prompt)
-    print(f"Extracted intent: {json.dumps(structured_intent, indent=2)}")
-    
-    print("\n[2/4] Selecting and populating template")
-    template_agent = TemplateAgent()
-    draft_content = template_agent.process(structured_intent)
-    print(f"Template selected and populated with {len(draft_content)} characters")
-    
-    print("\n[3/4] Refining content")
-    refinement_agent = RefinementAgent(model_name=model_name)
-    refined_content = refinement_agent.process(draft_content, structured_intent)
-    print(f"Content refined with {len(refined_content)} characters")
-    
-    validation_report = None
-    if validate:
-        print("\n[4/4] Validating term sheet")
-        validation_agent = ValidationAgent(model_name=model_name)
-        issues, validation_report = validation_agent.process(refined_content)
-        if issues:
-            print(f"Found {len(issues)} potential issues in the term sheet")
+    pipeline = get_pipeline(model_name, use_cache)
+    return pipeline.process(prompt, generate_docx=generate_docx, validate=validate,
+                            output_dir=output_dir, verbose=verbose, metrics=metrics)
+
+
+def stream_prompt(prompt: str, model_name: str = "gpt-4",
+                  generate_docx: bool = True,
+                  validate: bool = True,
+                  output_dir: Optional[str] = "output",
+                  verbose: bool = True,
+                  use_cache: bool = True,
+                  metrics: Optional[RunMetrics] = None) -> Iterator[Dict[str, Any]]:
+    """Process a natural language prompt, streaming the refined term sheet as it is generated.
+
+    Args:
+        prompt: The natural language prompt
+        model_name: The name of the language model to use
+        generate_docx: Whether to generate a DOCX document
+        validate: Whether to validate the term sheet
+        output_dir: Workspace directory; each run writes its term sheet, report and
+            DOCX to a directory of its own in it (nothing is written if None)
+        verbose: Whether to print progress messages
+        use_cache: Whether to reuse cached LLM responses for identical prompts
+        metrics: Collects the run's stage timings and LLM usage (a new RunMetrics if None)
+
+    Yields:
+        ``{"type": "stage", ...}`` events as each stage starts,
+        ``{"type": "chunk", "content": ...}`` events while the term sheet is being
+        refined, and a single ``{"type": "result", ...}`` event
+    """
+    pipeline = get_pipeline(model_name, use_cache)
+    return pipeline.stream(prompt, generate_docx=generate_docx, validate=validate,
+                           output_dir=output_dir, verbose=verbose, metrics=metrics)
+
+
+async def aprocess_prompt(prompt: str, model_name: str = "gpt-4",
+                          generate_docx: bool = True,
+                          validate: bool = True,
+                          output_dir: Optional[str] = "output",
+                          verbose: bool = True,
+                          use_cache: bool = True,
+                          metrics: Optional[RunMetrics] = None) -> Tuple[str, Optional[str], Optional[str]]:
+    """Asynchronously process a natural language prompt to generate a term sheet.
+
+    Args:
+        prompt: The natural language prompt
+        model_name: The name of the language model to use
+        generate_docx: Whether to generate a DOCX document
+        validate: Whether to validate the term sheet
+        output_dir: Workspace directory; each run writes its term sheet, report and
+            DOCX to a directory of its own in it (nothing is written if None)
+        verbose: Whether to print progress messages
+        use_cache: Whether to reuse cached LLM responses for identical prompts
+        metrics: Collects the run's stage timings and LLM usage (a new RunMetrics if None)
+
+    Returns:
+        A tuple containing the term sheet text, validation report (if any), and path to DOCX (if generated)
+    """
+    pipeline = get_pipeline(model_name, use_cache)
+    return await pipeline.aprocess(prompt, generate_docx=generate_docx, validate=validate,
+                                   output_dir=output_dir, verbose=verbose, metrics=metrics)
+
+
+def iter_batch_prompts(input_path: str) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """Stream ``(id, prompt, error)`` items from a batch input file.
+
+    Supported formats are CSV with a ``prompt`` column (and optional ``id``
+    column), JSONL with ``prompt`` (and optional ``id``) keys, and plain text
+    with one prompt per line. Items without an id are numbered by position, and
+    an id already used by an earlier item (or naming the same output directory)
+    gets the item's position appended, so every item has an id of its own.
+
+    A JSONL line that is not valid JSON or not a JSON object does not stop the
+    batch: it is yielded as an item with the id ``line-<number>``, no prompt and
+    an error naming the line.
+
+    Args:
+        input_path: Path to the batch input file
+
+    Yields:
+        Tuples of item id, prompt text (None for a bad line) and error (None for a prompt)
+    """
+    extension = os.path.splitext(input_path)[1].lower()
+    with open(input_path, "r", encoding="utf-8", newline="") as f:
+        if extension == ".csv":
+            reader = csv.DictReader(f)
+            records = ((reader.line_num, record) for record in reader)
+        elif extension in (".jsonl", ".ndjson"):
+            # Lines are parsed in the loop below, so a bad line only fails its own item
+            records = ((number, line) for number, line in enumerate(f, 1) if line.strip())
         else:
-            print("No issues found in the term sheet")
-    else:
-        print("\n[4/4] Validation skipped")
-    
-    # Save the term sheet as a text file
-    output_dir = "output"
+            records = ((number, {"prompt": line}) for number, line in enumerate(f, 1))
+
+        seen = set()
+
+        def claim(item_id: str, index: int) -> str:
+            while run_name(item_id) in seen:
+                item_id = f"{item_id}-{index}"
+            seen.add(run_name(item_id))
+            return item_id
+
+        for index, (number, record) in enumerate(records, 1):
+            if isinstance(record, str):
+                try:
+                    record = json.loads(record)
+                except ValueError as e:
+                    yield claim(f"line-{number}", index), None, f"Line {number} is not valid JSON: {e}"
+                    continue
+                if not isinstance(record, dict):
+                    yield claim(f"line-{number}", index), None, f"Line {number} is not a JSON object"
+                    continue
+            prompt = str(record.get("prompt") or "").strip()
+            if not prompt:
+                continue
+            item_id = str(record.get("id") if record.get("id") is not None else "").strip() or str(index)
+            yield claim(item_id, index), prompt, None
+
+
+def process_batch(input_path: str, output_dir: str = os.path.join("output", "batch"),
+                  model_name: str = "gpt-4", max_workers: int = 4,
+                  generate_docx: bool = True, validate: bool = True,
+                  use_cache: bool = True, llm_validation: bool = True) -> Dict[str, Any]:
+    """Generate term sheets for every prompt in a batch file.
+
+    Prompts are streamed from the input file and processed by a bounded pool of
+    workers sharing one pipeline, so at most ``2 * max_workers`` prompts are in flight at once. Each
+    item is written to its own ``output_dir/<id>/`` directory (with a suffix if that
+    name is already taken) and recorded in
+    ``output_dir/manifest.jsonl``, together with its metrics totals, as soon as
+    it finishes; an input line that cannot be read is recorded as a failed item
+    naming the line, and the rest of the batch carries on. Their LLM calls wait in the batch lane of the rate limiter, so
+    interactive generations in the same process go first.
+
+    Args:
+        input_path: Path to a CSV, JSONL or plain text file of prompts
+        output_dir: Directory the per-item outputs and the manifest are written to
+        model_name: The name of the language model to use
+        max_workers: Maximum number of prompts processed concurrently
+        generate_docx: Whether to generate a DOCX document for each item
+        validate: Whether to validate each term sheet
+        use_cache: Whether to reuse cached LLM responses for identical prompts
+        llm_validation: Whether validation asks the LLM in addition to the rule pack
+
+    Returns:
+        A summary with the total, succeeded and failed counts and the manifest path
+    """
     os.makedirs(output_dir, exist_ok=True)
-    
-    text_output_path = os.path.join(output_dir, "term_sheet.txt")
-    with open(text_output_path, "w", encoding="utf-8") as f:
-        f.write(refined_content)
-    print(f"\nTerm sheet saved to {text_output_path}")
-    
-    # Save validation report if available
-    if validation_report:
-        validation_path = os.path.join(output_dir, "validation_report.md")
-        with open(validation_path, "w", encoding="utf-8") as f:
-            f.write(validation_report)
-        print(f"Validation report saved to {validation_path}")
-    
-    # Generate DOCX if requested
-    docx_path = None
-    if generate_docx:
-        docx_path = os.path.join(output_dir, "term_sheet.docx")
-        text_to_docx(refined_content, docx_path)
-        print(f"DOCX document generated at {docx_path}")
-    
-    return refined_content, validation_report, docx_path
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    summary = {"total": 0, "succeeded": 0, "failed": 0, "manifest": manifest_path}
+    max_in_flight = max(1, max_workers) * 2
+
+    pipeline = TermSheetPipeline(model_name=model_name, use_cache=use_cache, llm_validation=llm_validation)
+    with pipeline, ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor, \
+            open(manifest_path, "w", encoding="utf-8") as manifest, llm_priority(BATCH):
+        pending = {}
+
+        def record_item(record: Dict[str, Any]) -> None:
+            summary["succeeded" if record["status"] == "ok" else "failed"] += 1
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            print(f"[{record['status']}] {record['id']}")
+
+        def collect(return_when: str) -> None:
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                item_id, metrics = pending.pop(future)
+                record = {"id": item_id}
+                try:
+                    outputs = future.result()
+                    record["status"] = "ok"
+                    # The run directory gets a suffix if an earlier run took its name
+                    record["output_dir"] = os.path.dirname(outputs["paths"]["text"])
+                    record["text_path"] = outputs["paths"]["text"]
+                    record["docx_path"] = outputs["docx_path"]
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = str(e)
+                record["metrics"] = metrics.to_dict()["totals"]
+                record_item(record)
+
+        for item_id, prompt, error in iter_batch_prompts(input_path):
+            summary["total"] += 1
+            if error is not None:
+                # A line that could not be read fails on its own; the batch carries on
+                record_item({"id": item_id, "status": "error", "error": error})
+                continue
+            if len(pending) >= max_in_flight:
+                collect(FIRST_COMPLETED)
+            metrics = RunMetrics(run_id=item_id)
+            # Items run in a copy of this context, and so in the batch lane
+            future = submit_in_context(executor, functools.partial(
+                pipeline.generate,
+                prompt,
+                generate_docx=generate_docx,
+                validate=validate,
+                output_dir=output_dir,
+                verbose=False,
+                metrics=metrics
+            ))
+            pending[future] = (item_id, metrics)
+
+        while pending:
+            collect(FIRST_COMPLETED)
+
+    return summary
+
+
+def _generate(pipeline: TermSheetPipeline, prompt: str, args: argparse.Namespace) -> None:
+    """Generate a single term sheet using the command line options.
+
+    Args:
+        pipeline: The open pipeline to run the prompt on
+        prompt: The natural language prompt
+        args: The parsed command line arguments
+    """
+    options = {
+        "generate_docx": not args.no_docx,
+        "validate": not args.no_validation,
+        "output_dir": args.output_dir or "output",
+    }
+    if args.stream:
+        for event in pipeline.stream(prompt, **options):
+            if event["type"] == "chunk":
+                print(event["content"], end="", flush=True)
+    else:
+        pipeline.process(prompt, **options)
+
+
+def _enable_metrics_logging() -> None:
+    """Print the JSON metrics of every run to stderr."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    metrics_logger = logging.getLogger("termsheet.metrics")
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
 
 
 def main():
@@ -106,29 +304,59 @@ def main():
     parser.add_argument("--model", "-m", default="gpt-4", help="Language model to use")
     parser.add_argument("--no-docx", action="store_true", help="Skip DOCX generation")
     parser.add_argument("--no-validation", action="store_true", help="Skip validation")
+    parser.add_argument("--rules-only", action="store_true", help="Validate with the rule pack only, without an LLM review")
     parser.add_argument("--interactive", "-i", action="store_true", help="Run in interactive mode")
+    parser.add_argument("--stream", "-s", action="store_true", help="Print the term sheet as it is generated")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the language model instead of reusing cached responses")
+    parser.add_argument("--batch", "-b", metavar="FILE", help="Generate term sheets for every prompt in a CSV, JSONL or text file")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Number of prompts processed concurrently in batch mode")
+    parser.add_argument("--output-dir", "-o", help="Workspace for generated files, with a directory per run (default: output, or output/batch in batch mode)")
+    parser.add_argument("--metrics", action="store_true", help="Print per-run timing, token and cost metrics as JSON to stderr")
     
     args = parser.parse_args()
     
+    if args.metrics:
+        _enable_metrics_logging()
+    
     # Set up the environment
     setup_environment()
     
-    if args.interactive:
+    if args.batch:
+        print("=== Term Sheet Drafting Assistant (Batch Mode) ===")
+        try:
+            summary = process_batch(
+                args.batch,
+                output_dir=args.output_dir or os.path.join("output", "batch"),
+                model_name=args.model,
+                max_workers=args.workers,
+                generate_docx=not args.no_docx,
+                validate=not args.no_validation,
+                use_cache=not args.no_cache,
+                llm_validation=not args.rules_only
+            )
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            sys.exit(1)
+        print(f"\nProcessed {summary['total']} prompts: {summary['succeeded']} succeeded, "
+              f"{summary['failed']} failed. Manifest written to {summary['manifest']}")
+        if summary["failed"]:
+            sys.exit(1)
+    elif args.interactive:
         print("=== Term Sheet Drafting Assistant (Interactive Mode) ===")
-        while True:
-            prompt = input("\nEnter your prompt (or 'exit' to quit): ")
-            if prompt.lower() in ["exit", "quit", "q"]:
-                break
-                
-            try:
-                process_prompt(
-                    prompt, 
-                    model_name=args.model, 
-                    generate_docx=not args.no_docx,
-                    validate=not args.no_validation
-                )
-            except Exception as e:
-                print(f"Error processing prompt: {e}")
+        # Runs accumulate over a long session, so old ones are evicted in the background
+        get_workspace(args.output_dir or "output").start_janitor()
+        # One pipeline serves the whole session, so agents and connections are reused
+        with TermSheetPipeline(model_name=args.model, use_cache=not args.no_cache,
+                               llm_validation=not args.rules_only) as pipeline:
+            while True:
+                prompt = input("\nEnter your prompt (or 'exit' to quit): ")
+                if prompt.lower() in ["exit", "quit", "q"]:
+                    break
+                    
+                try:
+                    _generate(pipeline, prompt, args)
+                except Exception as e:
+                    print(f"Error processing prompt: {e}")
     else:
         if not args.prompt:
             parser.print_help()
@@ -136,12 +364,9 @@ def main():
             
         print("=== Term Sheet Drafting Assistant ===")
         try:
-            process_prompt(
-                args.prompt, 
-                model_name=args.model, 
-                generate_docx=not args.no_docx,
-                validate=not args.no_validation
-            )
+            with TermSheetPipeline(model_name=args.model, use_cache=not args.no_cache,
+                                   llm_validation=not args.rules_only) as pipeline:
+                _generate(pipeline, args.prompt, args)
         except Exception as e:
             print(f"Error processing prompt: {e}")
             sys.exit(1)
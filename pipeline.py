@@ -0,0 +1,606 @@
+"""Term Sheet Pipeline
+
+This module holds the long-lived pipeline that orchestrates the agents. A
+pipeline builds its agents and a shared keep-alive HTTP client once, and reuses
+them for every prompt it processes until it is closed.
+"""
+
+import os
+import json
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Import agents
+from agents.intent_parser import IntentParsingAgent
+from agents.template_agent import TemplateAgent
+from agents.refinement_agent import RefinementAgent
+from agents.validation_agent import ValidationAgent
+
+# Import utilities
+from utils.docx_generator import create_docx_bytes, extract_company_name
+from utils.llm_cache import LLMResponseCache, get_default_cache
+from utils.llm_client import LLMClientPool
+from utils.metrics import RunMetrics, metrics_context, span, traced, use_metrics
+from utils.scheduler import StageScheduler
+from utils.workspace import atomic_write, get_workspace
+
+
+# The step of each stage reported by ``stream``; the last step validates and
+# exports the term sheet, or only exports it when validation is skipped
+STAGES = {"intent": 1, "template": 2, "refine": 3, "validate": 4, "export": 4}
+STAGE_COUNT = 4
+
+
+class TermSheetPipeline:
+    """Reusable pipeline that turns prompts into term sheets.
+
+    Call ``open()`` (or use the pipeline as a context manager) before processing
+    prompts and ``close()`` when done. A pipeline is safe to share between threads.
+    """
+
+    def __init__(self, model_name: str = "gpt-4", use_cache: bool = True,
+                 cache: Optional[LLMResponseCache] = None, templates_dir: str = "templates",
+                 llm_factory: Optional[Callable[[str, Optional[float]], Any]] = None,
+                 intent_model_name: Optional[str] = "gpt-4o-mini", llm_validation: bool = True):
+        """Initialize the pipeline.
+
+        Args:
+            model_name: The name of the language model to use
+            use_cache: Whether to reuse cached LLM responses for identical prompts
+            cache: The response cache to use (the process-wide cache if None)
+            templates_dir: Directory containing the templates
+            llm_factory: Optional callable returning a chat model for a model name and
+                temperature; defaults to OpenAI models sharing one HTTP client pool
+            intent_model_name: The smaller model asked for the intent fields the rules
+                could not extract (``model_name`` if None)
+            llm_validation: Whether validation asks the LLM to review the term sheet
+                in addition to running the rule pack
+        """
+        self.model_name = model_name
+        self.intent_model_name = intent_model_name or model_name
+        self.cache = (cache or get_default_cache()) if use_cache else None
+        self.templates_dir = templates_dir
+        self.llm_factory = llm_factory
+        self.llm_validation = llm_validation
+        self.client_pool: Optional[LLMClientPool] = None
+        self.intent_agent: Optional[IntentParsingAgent] = None
+        self.template_agent: Optional[TemplateAgent] = None
+        self.refinement_agent: Optional[RefinementAgent] = None
+        self.validation_agent: Optional[ValidationAgent] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether the pipeline's agents have been created."""
+        return self.intent_agent is not None
+
+    def open(self) -> "TermSheetPipeline":
+        """Create the HTTP client pool and the agents.
+
+        Returns:
+            The pipeline itself, to allow ``pipeline = TermSheetPipeline().open()``
+        """
+        with self._lock:
+            if self.is_open:
+                return self
+
+            llm_factory = self.llm_factory
+            if llm_factory is None:
+                self.client_pool = LLMClientPool()
+                llm_factory = self.client_pool.chat_model
+
+            self.intent_agent = IntentParsingAgent(
+                model_name=self.intent_model_name, cache=self.cache,
+                llm=llm_factory(self.intent_model_name, 0.0)
+            )
+            self.template_agent = TemplateAgent(self.templates_dir)
+            self.refinement_agent = RefinementAgent(
+                model_name=self.model_name, cache=self.cache,
+                llm=llm_factory(self.model_name, 0.2)
+            )
+            self.validation_agent = ValidationAgent(
+                model_name=self.model_name, cache=self.cache,
+                llm=llm_factory(self.model_name, 0.0), llm_review=self.llm_validation
+            )
+            return self
+
+    def close(self) -> None:
+        """Release the agents and close the HTTP client pool."""
+        with self._lock:
+            if self.client_pool is not None:
+                self.client_pool.close()
+            self._reset()
+
+    async def aclose(self) -> None:
+        """Release the agents and close the HTTP client pool, including async connections."""
+        client_pool = self.client_pool
+        if client_pool is not None:
+            await client_pool.aclose()
+        with self._lock:
+            self._reset()
+
+    def __enter__(self) -> "TermSheetPipeline":
+        return self.open()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "TermSheetPipeline":
+        return self.open()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def process(self, prompt: str, generate_docx: bool = True, validate: bool = True,
+                output_dir: Optional[str] = "output", verbose: bool = True,
+                metrics: Optional[RunMetrics] = None) -> Tuple[str, Optional[str], Optional[str]]:
+        """Process a natural language prompt to generate a term sheet.
+
+        Args:
+            prompt: The natural language prompt
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            output_dir: Workspace directory; the term sheet, report and DOCX are written
+                to a directory of their own in it, named after the metrics' run id
+                (nothing is written if None)
+            verbose: Whether to print progress messages
+            metrics: Collects the run's stage timings and LLM usage (a new RunMetrics
+                if None); it is logged on the ``termsheet.metrics`` logger when the run ends
+
+        Returns:
+            A tuple containing the term sheet text, validation report (if any), and path to DOCX (if written)
+        """
+        result = self.generate(prompt, generate_docx=generate_docx, validate=validate,
+                               output_dir=output_dir, verbose=verbose, metrics=metrics)
+        return result["term_sheet"], result["validation_report"], result["docx_path"]
+
+    def generate(self, prompt: str, generate_docx: bool = True, validate: bool = True,
+                 output_dir: Optional[str] = None, verbose: bool = True,
+                 metrics: Optional[RunMetrics] = None) -> Dict[str, Any]:
+        """Generate a term sheet and its exports in memory.
+
+        Files are only written when ``output_dir`` is given, so callers that serve
+        the results directly (downloads, HTTP responses) never touch the disk.
+
+        Args:
+            prompt: The natural language prompt
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            output_dir: Workspace directory; the term sheet, report and DOCX are also
+                written to a directory of their own in it, named after the metrics' run
+                id (nothing is written if None)
+            verbose: Whether to print progress messages
+            metrics: Collects the run's stage timings and LLM usage (a new RunMetrics
+                if None); it is logged on the ``termsheet.metrics`` logger when the run ends
+
+        Returns:
+            A dictionary with the ``term_sheet``, the validation ``issues`` and
+            ``validation_report`` (None if not validated), the ``docx`` bytes (None if
+            not generated), the ``paths`` of the files written and the ``docx_path``
+        """
+        self.open()
+        log = _progress_printer(verbose)
+        metrics = metrics or RunMetrics()
+
+        try:
+            with use_metrics(metrics):
+                structured_intent, draft_content = self._parse_and_render(prompt, log)
+
+                log("\n[3/4] Refining content")
+                with span("refine"):
+                    refined_content = self.refinement_agent.process(draft_content, structured_intent)
+                log(f"Content refined with {len(refined_content)} characters")
+
+                outputs = self._validate_and_export(
+                    refined_content, generate_docx, validate, _run_directory(output_dir, metrics.run_id),
+                    log, baseline=draft_content
+                )
+        finally:
+            metrics.emit()
+
+        return dict(outputs, term_sheet=refined_content)
+
+    def stream(self, prompt: str, generate_docx: bool = True, validate: bool = True,
+               output_dir: Optional[str] = "output", verbose: bool = True,
+               metrics: Optional[RunMetrics] = None) -> Iterator[Dict[str, Any]]:
+        """Process a natural language prompt, streaming the refined term sheet as it is generated.
+
+        Args:
+            prompt: The natural language prompt
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            output_dir: Workspace directory; the term sheet, report and DOCX are written
+                to a directory of their own in it, named after the metrics' run id
+                (nothing is written if None)
+            verbose: Whether to print progress messages
+            metrics: Collects the run's stage timings and LLM usage (a new RunMetrics
+                if None); it is logged on the ``termsheet.metrics`` logger when the run ends
+
+        Yields:
+            A ``{"type": "stage", "stage": ..., "step": ..., "total": ...}`` event as
+            each stage starts, ``{"type": "chunk", "content": ...}`` events while the
+            term sheet is being refined, and a single ``{"type": "result", ...}``
+            event once validation and export have finished, with the keys returned by
+            ``generate`` and the run's ``metrics``
+        """
+        self.open()
+        metrics = metrics or RunMetrics()
+        # The stream advances in the consumer's context, so each step runs in a
+        # context of its own in which the run's metrics are active
+        context = metrics_context(metrics)
+        events = self._stream_events(prompt, generate_docx, validate,
+                                     _run_directory(output_dir, metrics.run_id), verbose)
+        emitted = False
+        try:
+            for event in iter(lambda: context.run(next, events, None), None):
+                if event["type"] == "result":
+                    metrics.emit()
+                    emitted = True
+                    event["metrics"] = metrics.to_dict()
+                yield event
+        finally:
+            context.run(events.close)
+            if not emitted:
+                metrics.emit()
+
+    def _stream_events(self, prompt: str, generate_docx: bool, validate: bool,
+                       run_dir: Optional[str], verbose: bool) -> Iterator[Dict[str, Any]]:
+        """Generate the events of ``stream``, without metrics handling."""
+        log = _progress_printer(verbose)
+
+        yield _stage_event("intent")
+        structured_intent = self._parse_intent(prompt, log)
+        yield _stage_event("template")
+        draft_content = self._render_template(structured_intent, log)
+
+        yield _stage_event("refine")
+        log("\n[3/4] Refining content")
+        chunks = []
+        with span("refine"):
+            for chunk in self.refinement_agent.stream(draft_content, structured_intent):
+                chunks.append(chunk)
+                yield {"type": "chunk", "content": chunk}
+        refined_content = "".join(chunks).strip()
+        log(f"\nContent refined with {len(refined_content)} characters")
+
+        yield _stage_event("validate" if validate else "export")
+        outputs = self._validate_and_export(
+            refined_content, generate_docx, validate, run_dir, log, baseline=draft_content
+        )
+
+        yield dict(outputs, type="result", term_sheet=refined_content)
+
+    async def aprocess(self, prompt: str, generate_docx: bool = True, validate: bool = True,
+                       output_dir: Optional[str] = "output", verbose: bool = True,
+                       metrics: Optional[RunMetrics] = None) -> Tuple[str, Optional[str], Optional[str]]:
+        """Asynchronously process a natural language prompt to generate a term sheet.
+
+        Args:
+            prompt: The natural language prompt
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            output_dir: Workspace directory; the term sheet, report and DOCX are written
+                to a directory of their own in it, named after the metrics' run id
+                (nothing is written if None)
+            verbose: Whether to print progress messages
+            metrics: Collects the run's stage timings and LLM usage (a new RunMetrics
+                if None); it is logged on the ``termsheet.metrics`` logger when the run ends
+
+        Returns:
+            A tuple containing the term sheet text, validation report (if any), and path to DOCX (if written)
+        """
+        result = await self.agenerate(prompt, generate_docx=generate_docx, validate=validate,
+                                      output_dir=output_dir, verbose=verbose, metrics=metrics)
+        return result["term_sheet"], result["validation_report"], result["docx_path"]
+
+    async def agenerate(self, prompt: str, generate_docx: bool = True, validate: bool = True,
+                        output_dir: Optional[str] = None, verbose: bool = True,
+                        metrics: Optional[RunMetrics] = None) -> Dict[str, Any]:
+        """Asynchronously generate a term sheet and its exports in memory.
+
+        LLM calls use the agents' async interfaces, and rendering and file output
+        run in worker threads, so a single event loop can serve many generations
+        concurrently.
+
+        Args:
+            prompt: The natural language prompt
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            output_dir: Workspace directory; the term sheet, report and DOCX are also
+                written to a directory of their own in it, named after the metrics' run
+                id (nothing is written if None)
+            verbose: Whether to print progress messages
+            metrics: Collects the run's stage timings and LLM usage (a new RunMetrics
+                if None); it is logged on the ``termsheet.metrics`` logger when the run ends
+
+        Returns:
+            The same dictionary as ``generate``
+        """
+        self.open()
+        log = _progress_printer(verbose)
+        metrics = metrics or RunMetrics()
+
+        try:
+            with use_metrics(metrics):
+                log(f"\n[1/4] Parsing intent from prompt: '{prompt}'")
+                with span("intent"):
+                    structured_intent = await self.intent_agent.aparse(prompt)
+                log(f"Extracted intent: {json.dumps(structured_intent, indent=2)}")
+
+                log("\n[2/4] Selecting and populating template")
+                with span("template"):
+                    draft_content = self.template_agent.process(structured_intent)
+                log(f"Template selected and populated with {len(draft_content)} characters")
+
+                log("\n[3/4] Refining content")
+                with span("refine"):
+                    refined_content = await self.refinement_agent.aprocess(draft_content, structured_intent)
+                log(f"Content refined with {len(refined_content)} characters")
+
+                # Validation, the text file and the DOCX run concurrently
+                run_dir = _run_directory(output_dir, metrics.run_id)
+                paths = _output_paths(run_dir) if run_dir else {}
+                stages = {}
+                if paths:
+                    stages["text"] = asyncio.to_thread(
+                        traced, "export.text", atomic_write, paths["text"], refined_content
+                    )
+                if validate:
+                    log("\n[4/4] Validating term sheet")
+                    stages["validate"] = self._avalidate_and_save(refined_content, paths.get("report"), draft_content)
+                else:
+                    log("\n[4/4] Validation skipped")
+                if generate_docx:
+                    stages["docx"] = self._arender_and_save(refined_content, paths.get("docx"))
+
+                results = dict(zip(stages, await asyncio.gather(*stages.values())))
+        finally:
+            metrics.emit()
+
+        outputs = _outputs(results, paths)
+        _log_outputs(log, outputs)
+        return dict(outputs, term_sheet=refined_content)
+
+    def _parse_and_render(self, prompt: str, log) -> Tuple[Dict[str, Any], str]:
+        """Parse the prompt into a structured intent and render the draft term sheet.
+
+        Args:
+            prompt: The natural language prompt
+            log: Function used to report progress messages
+
+        Returns:
+            A tuple containing the structured intent and the draft content
+        """
+        structured_intent = self._parse_intent(prompt, log)
+        return structured_intent, self._render_template(structured_intent, log)
+
+    def _parse_intent(self, prompt: str, log) -> Dict[str, Any]:
+        """Parse the prompt into a structured intent."""
+        log(f"\n[1/4] Parsing intent from prompt: '{prompt}'")
+        with span("intent"):
+            structured_intent = self.intent_agent.parse(prompt)
+        log(f"Extracted intent: {json.dumps(structured_intent, indent=2)}")
+        return structured_intent
+
+    def _render_template(self, structured_intent: Dict[str, Any], log) -> str:
+        """Select and populate the template for a structured intent."""
+        log("\n[2/4] Selecting and populating template")
+        with span("template"):
+            draft_content = self.template_agent.process(structured_intent)
+        log(f"Template selected and populated with {len(draft_content)} characters")
+        return draft_content
+
+    def _validate_and_export(self, refined_content: str, generate_docx: bool, validate: bool,
+                             run_dir: Optional[str], log,
+                             baseline: Optional[str] = None) -> Dict[str, Any]:
+        """Validate the refined term sheet, render its DOCX and write the output files.
+
+        Validation, the DOCX and the text file only depend on the refined content,
+        so they run concurrently. The DOCX is rendered in memory and written to a
+        file only when there is an output directory.
+
+        Args:
+            refined_content: The final term sheet content
+            generate_docx: Whether to generate a DOCX document
+            validate: Whether to validate the term sheet
+            run_dir: Directory of the run the files are written to (nothing is written if None)
+            log: Function used to report progress messages
+            baseline: The template draft the content was refined from; validation only
+                asks the LLM about clauses that differ from it
+
+        Returns:
+            A dictionary with the validation ``issues`` and ``validation_report``, the
+            ``docx`` bytes, the ``paths`` of the files written and the ``docx_path``
+        """
+        paths = _output_paths(run_dir) if run_dir else {}
+        scheduler = StageScheduler()
+        if paths:
+            scheduler.add_stage("text", lambda: traced("export.text", atomic_write, paths["text"], refined_content))
+        if validate:
+            log("\n[4/4] Validating term sheet")
+            scheduler.add_stage("validate", lambda: traced("validate", self.validation_agent.process, refined_content, baseline))
+            if paths:
+                scheduler.add_stage(
+                    "report",
+                    lambda validation: traced("export.report", atomic_write, paths["report"], validation[1]),
+                    depends_on=["validate"]
+                )
+        else:
+            log("\n[4/4] Validation skipped")
+        if generate_docx:
+            scheduler.add_stage("docx", lambda: traced("export.docx", _render_docx, refined_content))
+            if paths:
+                scheduler.add_stage(
+                    "docx_file",
+                    lambda docx: traced("save.docx", atomic_write, paths["docx"], docx),
+                    depends_on=["docx"]
+                )
+
+        outputs = _outputs(scheduler.run(), paths)
+        _log_outputs(log, outputs)
+        return outputs
+
+    async def _avalidate_and_save(self, term_sheet: str, report_path: Optional[str],
+                                  baseline: Optional[str] = None) -> Tuple[List[Dict[str, str]], str]:
+        """Validate the term sheet and save the report without blocking the event loop."""
+        with span("validate"):
+            issues, validation_report = await self.validation_agent.aprocess(term_sheet, baseline)
+        if report_path:
+            await asyncio.to_thread(traced, "export.report", atomic_write, report_path, validation_report)
+        return issues, validation_report
+
+    async def _arender_and_save(self, term_sheet: str, docx_path: Optional[str]) -> bytes:
+        """Render the DOCX in a worker thread and save it if there is a path."""
+        docx = await asyncio.to_thread(traced, "export.docx", _render_docx, term_sheet)
+        if docx_path:
+            await asyncio.to_thread(traced, "save.docx", atomic_write, docx_path, docx)
+        return docx
+
+    def _reset(self) -> None:
+        self.client_pool = None
+        self.intent_agent = None
+        self.template_agent = None
+        self.refinement_agent = None
+        self.validation_agent = None
+
+
+_pipelines: Dict[Tuple[str, bool], TermSheetPipeline] = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_pipeline(model_name: str = "gpt-4", use_cache: bool = True) -> TermSheetPipeline:
+    """Return the shared open pipeline for a model, creating it on first use.
+
+    Args:
+        model_name: The name of the language model to use
+        use_cache: Whether to reuse cached LLM responses for identical prompts
+
+    Returns:
+        An open TermSheetPipeline
+    """
+    key = (model_name, use_cache)
+    with _pipelines_lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is None:
+            pipeline = TermSheetPipeline(model_name=model_name, use_cache=use_cache)
+            _pipelines[key] = pipeline
+    return pipeline.open()
+
+
+def close_pipelines() -> None:
+    """Close all shared pipelines created by ``get_pipeline``."""
+    with _pipelines_lock:
+        pipelines = list(_pipelines.values())
+        _pipelines.clear()
+    for pipeline in pipelines:
+        pipeline.close()
+
+
+def _progress_printer(verbose: bool):
+    """Return the function used to report progress messages.
+
+    Args:
+        verbose: Whether progress messages should be printed
+
+    Returns:
+        ``print`` when verbose, otherwise a function that discards its arguments
+    """
+    if verbose:
+        return print
+    return lambda *args, **kwargs: None
+
+
+def _stage_event(stage: str) -> Dict[str, Any]:
+    """Return the ``stream`` event announcing the start of a stage.
+
+    Args:
+        stage: The name of the stage, one of ``STAGES``
+
+    Returns:
+        The event, with the stage's 1-based ``step`` and the ``total`` number of stages
+    """
+    return {"type": "stage", "stage": stage, "step": STAGES[stage], "total": STAGE_COUNT}
+
+
+def _run_directory(output_dir: Optional[str], run_id: str) -> Optional[str]:
+    """Create the directory of a run in a workspace.
+
+    Args:
+        output_dir: The workspace directory (no run directory if None)
+        run_id: Identifier of the run
+
+    Returns:
+        The path of the run directory, or None
+    """
+    if output_dir is None:
+        return None
+    return get_workspace(output_dir).new_run(run_id)
+
+
+def _output_paths(run_dir: str) -> Dict[str, str]:
+    """Return the paths of the files generated in a run directory.
+
+    Args:
+        run_dir: Directory of the run
+
+    Returns:
+        A dictionary with the text, report and DOCX paths
+    """
+    return {
+        "text": os.path.join(run_dir, "term_sheet.txt"),
+        "report": os.path.join(run_dir, "validation_report.md"),
+        "docx": os.path.join(run_dir, "term_sheet.docx"),
+    }
+
+
+def _render_docx(term_sheet: str) -> bytes:
+    """Render a term sheet as DOCX bytes, with its company name in the page header."""
+    return create_docx_bytes(term_sheet, extract_company_name(term_sheet))
+
+
+def _outputs(results: Dict[str, Any], paths: Dict[str, str]) -> Dict[str, Any]:
+    """Collect the outputs of the validation and export stages.
+
+    Args:
+        results: The stage results, keyed by stage name
+        paths: The output paths returned by ``_output_paths`` (empty if nothing is written)
+
+    Returns:
+        A dictionary with the validation ``issues`` and ``validation_report``, the
+        ``docx`` bytes, the ``paths`` of the files written and the ``docx_path``
+    """
+    issues, validation_report = results.get("validate", (None, None))
+    docx = results.get("docx")
+    written = {name: path for name, path in paths.items()
+               if name == "text" or (name == "report" and validation_report is not None)
+               or (name == "docx" and docx is not None)}
+    return {
+        "issues": issues,
+        "validation_report": validation_report,
+        "docx": docx,
+        "paths": written,
+        "docx_path": written.get("docx"),
+    }
+
+
+def _log_outputs(log, outputs: Dict[str, Any]) -> None:
+    """Report the validation outcome and the generated files.
+
+    Args:
+        log: Function used to report progress messages
+        outputs: The outputs returned by ``_outputs``
+    """
+    if outputs["validation_report"] is not None:
+        if outputs["issues"]:
+            log(f"Found {len(outputs['issues'])} potential issues in the term sheet")
+        else:
+            log("No issues found in the term sheet")
+
+    paths = outputs["paths"]
+    if "text" in paths:
+        log(f"\nTerm sheet saved to {paths['text']}")
+    if "report" in paths:
+        log(f"Validation report saved to {paths['report']}")
+    if "docx" in paths:
+        log(f"DOCX document generated at {paths['docx']}")
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""Term Sheet HTTP API
+
+This script serves the term sheet pipeline over HTTP (ASGI, with Starlette) so
+other tools can generate, validate and render term sheets. Generation and
+validation call the LLM, so they run as jobs on a bounded queue with a fixed
+number of workers: a request queues a job and returns its id at once, and the
+caller polls the job until it finishes. When the queue is full, requests are
+refused with a 429 status and a ``Retry-After`` header. Rendering a DOCX does
+not call the LLM and is answered directly.
+
+Endpoints:
+
+- ``POST /generate``: queue a term sheet generation for a ``prompt``
+- ``POST /validate``: queue the validation of a ``term_sheet``
+- ``POST /render/docx``: render a ``term_sheet`` to a DOCX document
+- ``GET /jobs/{id}``: poll a job; ``?wait=<seconds>`` waits for it to finish
+- ``GET /jobs/{id}/docx``: download the DOCX of a finished generation
+- ``GET /health``: queue statistics
+"""
+
+import os
+import math
+import uuid
+import asyncio
+import argparse
+import contextlib
+from typing import Any, Dict, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from main import setup_environment
+from pipeline import TermSheetPipeline
+from utils.docx_generator import create_docx_bytes
+from utils.jobs import DEFAULT_MAX_QUEUED, DEFAULT_MAX_RETAINED, SUCCEEDED, JobQueue, QueueFullError
+from utils.metrics import RunMetrics
+from utils.rate_limit import get_rate_limiter
+from utils.workspace import get_workspace
+
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Longest a poll may wait for a job to finish, in seconds
+MAX_POLL_WAIT = 30.0
+
+# Typical duration and tokens of an LLM call of a generation, from which the
+# number of workers the model's rate limits sustain is derived
+SECONDS_PER_CALL = 15.0
+TOKENS_PER_CALL = 3000
+MAX_DEFAULT_CONCURRENCY = 16
+
+
+def create_app(pipeline: Optional[TermSheetPipeline] = None,
+               max_concurrency: Optional[int] = None,
+               max_queued: Optional[int] = None,
+               max_retained: Optional[int] = None,
+               output_dir: Optional[str] = None) -> Starlette:
+    """Create the API application.
+
+    Args:
+        pipeline: The pipeline serving the requests (a pipeline for the
+            ``TERM_SHEET_MODEL`` environment variable, or gpt-4, if None); it is
+            opened when the application starts and closed when it stops
+        max_concurrency: Number of jobs calling the LLM at once (the
+            ``TERM_SHEET_MAX_CONCURRENCY`` environment variable if None, or else as
+            many as the model's rate limits sustain)
+        max_queued: Number of jobs waiting for a worker before requests are refused
+            (the ``TERM_SHEET_MAX_QUEUED`` environment variable if None)
+        max_retained: Number of finished jobs, with their results, kept for polling;
+            the oldest are forgotten first (the ``TERM_SHEET_MAX_RETAINED``
+            environment variable if None)
+        output_dir: Workspace the outputs of every generation are also written to,
+            with old runs evicted in the background (nothing is written if None)
+
+    Returns:
+        The ASGI application
+    """
+    if pipeline is None:
+        pipeline = TermSheetPipeline(model_name=os.environ.get("TERM_SHEET_MODEL", "gpt-4"))
+    if max_concurrency is None:
+        max_concurrency = int(os.environ.get("TERM_SHEET_MAX_CONCURRENCY", 0)) or min(
+            MAX_DEFAULT_CONCURRENCY,
+            get_rate_limiter(pipeline.model_name).sustainable_concurrency(SECONDS_PER_CALL, TOKENS_PER_CALL)
+        )
+    if max_queued is None:
+        max_queued = int(os.environ.get("TERM_SHEET_MAX_QUEUED", DEFAULT_MAX_QUEUED))
+    if max_retained is None:
+        max_retained = int(os.environ.get("TERM_SHEET_MAX_RETAINED", DEFAULT_MAX_RETAINED))
+    jobs = JobQueue(max_concurrency=max_concurrency, max_queued=max_queued, max_retained=max_retained)
+
+    async def generate_job(job_id: str, prompt: str, generate_docx: bool, validate: bool) -> Dict[str, Any]:
+        return await pipeline.agenerate(prompt, generate_docx=generate_docx, validate=validate,
+                                        output_dir=output_dir, verbose=False,
+                                        metrics=RunMetrics(run_id=job_id))
+
+    async def validate_job(term_sheet: str, baseline: Optional[str]) -> Dict[str, Any]:
+        issues, validation_report = await pipeline.validation_agent.aprocess(term_sheet, baseline)
+        return {"issues": issues, "validation_report": validation_report}
+
+    async def generate(request: Request) -> Response:
+        body = await _read_body(request)
+        prompt = _string_field(body, "prompt", required=True).strip()
+        if not prompt:
+            return _error(400, "A non-empty 'prompt' is required")
+        generate_docx = _boolean_field(body, "generate_docx", True)
+        validate = _boolean_field(body, "validate", True)
+        job_id = uuid.uuid4().hex
+        return _submit(jobs, "generate", generate_job, job_id, prompt, generate_docx, validate,
+                       job_id=job_id)
+
+    async def validate(request: Request) -> Response:
+        body = await _read_body(request)
+        term_sheet = _string_field(body, "term_sheet", required=True)
+        return _submit(jobs, "validate", validate_job, term_sheet, _string_field(body, "baseline"))
+
+    async def render_docx(request: Request) -> Response:
+        body = await _read_body(request)
+        term_sheet = _string_field(body, "term_sheet", required=True)
+        company_name = _string_field(body, "company_name")
+        docx = await asyncio.to_thread(create_docx_bytes, term_sheet, company_name)
+        return Response(docx, media_type=DOCX_MEDIA_TYPE,
+                        headers={"Content-Disposition": 'attachment; filename="term_sheet.docx"'})
+
+    async def get_job(request: Request) -> Response:
+        try:
+            wait = float(request.query_params.get("wait", 0))
+        except ValueError:
+            wait = math.nan
+        if not math.isfinite(wait) or wait < 0:
+            return _error(400, "'wait' must be a non-negative number of seconds")
+        wait = min(wait, MAX_POLL_WAIT)
+        job = await jobs.wait(request.path_params["job_id"], wait)
+        if job is None:
+            return _error(404, "Unknown job")
+        return JSONResponse(_job_view(job))
+
+    async def get_job_docx(request: Request) -> Response:
+        job = jobs.get(request.path_params["job_id"])
+        if job is None or job["kind"] != "generate":
+            return _error(404, "Unknown generation job")
+        if job["status"] != SUCCEEDED:
+            return _error(409, f"The job is {job['status']}")
+        if not job["result"].get("docx"):
+            return _error(404, "The job did not generate a DOCX document")
+        return Response(job["result"]["docx"], media_type=DOCX_MEDIA_TYPE,
+                        headers={"Content-Disposition": 'attachment; filename="term_sheet.docx"'})
+
+    async def health(request: Request) -> Response:
+        return JSONResponse(dict(jobs.stats(), status="ok"))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: Starlette):
+        pipeline.open()
+        if output_dir:
+            get_workspace(output_dir).start_janitor()
+        await jobs.start()
+        try:
+            yield
+        finally:
+            await jobs.stop()
+            await pipeline.aclose()
+
+    app = Starlette(
+        routes=[
+            Route("/generate", generate, methods=["POST"]),
+            Route("/validate", validate, methods=["POST"]),
+            Route("/render/docx", render_docx, methods=["POST"]),
+            Route("/jobs/{job_id}", get_job, methods=["GET"]),
+            Route("/jobs/{job_id}/docx", get_job_docx, methods=["GET"]),
+            Route("/health", health, methods=["GET"]),
+        ],
+        exception_handlers={_BadRequest: _bad_request},
+        lifespan=lifespan,
+    )
+    app.state.jobs = jobs
+    app.state.pipeline = pipeline
+    return app
+
+
+class _BadRequest(Exception):
+    """Raised when a request body is not a JSON object or has an invalid field."""
+
+
+async def _read_body(request: Request) -> Dict[str, Any]:
+    """Parse the JSON object in a request body."""
+    try:
+        body = await request.json()
+    except ValueError:
+        raise _BadRequest("The request body must be JSON")
+    if not isinstance(body, dict):
+        raise _BadRequest("The request body must be a JSON object")
+    return body
+
+
+def _string_field(body: Dict[str, Any], name: str, required: bool = False) -> Optional[str]:
+    """Return a string field of a request body, which must be non-empty when required."""
+    value = body.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str) or (required and not value):
+        raise _BadRequest(f"'{name}' must be a non-empty string" if required else f"'{name}' must be a string")
+    return value
+
+
+def _boolean_field(body: Dict[str, Any], name: str, default: bool) -> bool:
+    """Return a boolean field of a request body; strings such as "false" are rejected."""
+    value = body.get(name, default)
+    if not isinstance(value, bool):
+        raise _BadRequest(f"'{name}' must be true or false")
+    return value
+
+
+def _submit(jobs: JobQueue, kind: str, func, *args: Any, job_id: Optional[str] = None) -> Response:
+    """Queue a job and answer 202 with its state, or 429 when the queue is full."""
+    try:
+        job = jobs.submit(kind, func, *args, job_id=job_id)
+    except QueueFullError as e:
+        return JSONResponse({"error": str(e), "retry_after": e.retry_after}, status_code=429,
+                            headers={"Retry-After": str(e.retry_after)})
+    location = f"/jobs/{job['id']}"
+    return JSONResponse(_job_view(job), status_code=202, headers={"Location": location})
+
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the JSON representation of a job; DOCX bytes are replaced by their URL."""
+    view = {key: value for key, value in job.items() if key != "result"}
+    result = job["result"]
+    if result is not None:
+        result = {key: value for key, value in result.items() if key != "docx"}
+        if job["result"].get("docx"):
+            result["docx_url"] = f"/jobs/{job['id']}/docx"
+    view["result"] = result
+    return view
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+async def _bad_request(request: Request, exc: _BadRequest) -> Response:
+    return _error(400, str(exc))
+
+
+def main():
+    """Run the API server with uvicorn."""
+    parser = argparse.ArgumentParser(description="Term Sheet HTTP API")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", "-p", type=int, default=8000, help="Port to listen on")
+    parser.add_argument("--model", "-m", default="gpt-4", help="Language model to use")
+    parser.add_argument("--workers", "-w", type=int, help="Number of jobs calling the LLM at once")
+    parser.add_argument("--max-queued", type=int, help="Number of waiting jobs before requests are refused with 429")
+    parser.add_argument("--max-retained", type=int, help="Number of finished jobs kept for polling before the oldest are forgotten")
+    parser.add_argument("--output-dir", "-o", help="Workspace to also write every generation to (default: nothing is written)")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the language model instead of reusing cached responses")
+
+    args = parser.parse_args()
+
+    setup_environment()
+    app = create_app(TermSheetPipeline(model_name=args.model, use_cache=not args.no_cache),
+                     max_concurrency=args.workers, max_queued=args.max_queued,
+                     max_retained=args.max_retained,
+                     output_dir=args.output_dir)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,22 @@
 import streamlit as st
-import os
-import base64
-from main import setup_environment, process_prompt
+from concurrent.futures import ThreadPoolExecutor
+from main import setup_environment
+from pipeline import STAGE_COUNT, TermSheetPipeline
+
+# Generations of all sessions share one pool of background workers
+GENERATION_WORKERS = 4
+# Seconds between progress updates while a generation is running
+POLL_INTERVAL = 0.5
+# Finished results kept per session, for the most recent input parameters
+MAX_SESSION_RESULTS = 10
+
+STAGE_LABELS = {
+    "intent": "Parsing your requirements",
+    "template": "Selecting and populating the template",
+    "refine": "Refining the term sheet",
+    "validate": "Validating and exporting",
+    "export": "Exporting",
+}
 
 # Setup page configuration
 st.set_page_config(
@@ -10,22 +25,129 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize environment
-setup_environment()
+# Initialize environment once per server process rather than on every rerun
+@st.cache_resource
+def init_environment():
+    setup_environment()
+
+init_environment()
+
+# The pipeline (agents and pooled HTTP connections) is shared by all sessions
+@st.cache_resource
+def load_pipeline(model_name):
+    return TermSheetPipeline(model_name=model_name).open()
+
+@st.cache_resource
+def load_executor():
+    return ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="termsheet-generate")
+
+
+class GenerationJob:
+    """A term sheet generation running on the background executor.
+
+    The worker only updates the job's attributes; every rerun of the script reads
+    them, so reruns never wait for the pipeline.
+    """
+
+    def __init__(self, model_name, prompt, generate_docx, validate):
+        self.stage = None
+        self.step = 0
+        self.content = ""
+        self.result = None
+        self.future = load_executor().submit(self._run, load_pipeline(model_name), prompt,
+                                              generate_docx, validate)
+
+    def done(self):
+        return self.future.done()
+
+    def error(self):
+        return self.future.exception() if self.future.done() else None
+
+    def _run(self, pipeline, prompt, generate_docx, validate):
+        # Nothing is written to disk; the downloads are served from memory
+        for event in pipeline.stream(prompt=prompt, generate_docx=generate_docx, validate=validate,
+                                     output_dir=None, verbose=False):
+            if event["type"] == "stage":
+                self.stage, self.step = event["stage"], event["step"]
+            elif event["type"] == "chunk":
+                self.content += event["content"]
+            else:
+                self.result = event
+
+
+def start_job(key, model_name, prompt, generate_docx, validate):
+    """Start a generation for the input parameters, unless one is running or done."""
+    jobs = st.session_state.jobs
+    job = jobs.get(key)
+    if job is not None and not job.error():
+        return job
+    jobs.pop(key, None)
+    jobs[key] = GenerationJob(model_name, prompt, generate_docx, validate)
+    # Forget the oldest finished results beyond the session limit
+    finished = [other for other, job in jobs.items() if job.done() and other != key]
+    for other in finished[:max(0, len(jobs) - MAX_SESSION_RESULTS)]:
+        del jobs[other]
+    return jobs[key]
 
-# Function to get binary file content for download
-def get_binary_file_downloader_html(file_path, file_label='File'):
-    with open(file_path, 'rb') as f:
-        data = f.read()
-    b64 = base64.b64encode(data).decode()
-    return f'<a href="data:application/octet-stream;base64,{b64}" download="{os.path.basename(file_path)}">{file_label}</a>'
 
-# Function to get text file content for download
-def get_text_file_downloader_html(file_path, file_label='File'):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = f.read()
-    b64 = base64.b64encode(data.encode()).decode()
-    return f'<a href="data:text/plain;base64,{b64}" download="{os.path.basename(file_path)}">{file_label}</a>'
+@st.fragment(run_every=POLL_INTERVAL)
+def show_progress(job):
+    """Show the stage and streamed content of a running job, refreshing on its own."""
+    if job.done():
+        # Rerun the whole page to show the result and download options
+        st.rerun()
+    label = STAGE_LABELS.get(job.stage, "Starting")
+    st.progress(job.step / STAGE_COUNT, text=f"Step {job.step}/{STAGE_COUNT}: {label}...")
+    if job.content:
+        st.subheader("Generated Term Sheet")
+        st.markdown(job.content)
+
+
+def show_result(job, generate_docx):
+    """Show the term sheet, download options and validation report of a finished job."""
+    error = job.error()
+    if error is not None:
+        st.error(f"An error occurred: {str(error)}")
+        return
+
+    result = job.result
+    term_sheet = result["term_sheet"]
+    validation_report = result["validation_report"]
+    docx = result["docx"]
+
+    # Display the term sheet
+    st.subheader("Generated Term Sheet")
+    st.text_area("Term Sheet Content", term_sheet, height=400)
+
+    # Display success message
+    st.success("Term sheet generated successfully!")
+
+    # Download options
+    st.subheader("Download Options")
+    col1, col2 = st.columns(2)
+
+    # Text download option
+    with col1:
+        st.download_button("Download as Text", term_sheet, file_name="term_sheet.txt",
+                           mime="text/plain")
+
+    # DOCX download option (if generated)
+    if generate_docx and docx:
+        with col2:
+            st.download_button(
+                "Download as DOCX", docx, file_name="term_sheet.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
+
+    # Display validation report if available
+    if validation_report:
+        st.subheader("Validation Report")
+        st.markdown(validation_report)
+
+
+# Generations of this session, by their input parameters
+if "jobs" not in st.session_state:
+    st.session_state.jobs = {}
 
 # App title and description
 st.title("Term Sheet Generator")
@@ -62,50 +184,23 @@ model_name = st.selectbox(
     index=0
 )
 
+key = (prompt, generate_docx, validate, model_name)
+
 # Generate button
 if st.button("Generate Term Sheet", type="primary"):
     if not prompt:
         st.error("Please enter your requirements before generating a term sheet.")
     else:
-        with st.spinner("Generating your term sheet..."):
-            try:
-                # Process the prompt
-                term_sheet, validation_report, docx_path = process_prompt(
-                    prompt=prompt,
-                    model_name=model_name,
-                    generate_docx=generate_docx,
-                    validate=validate
-                )
-                
-                # Display success message
-                st.success("Term sheet generated successfully!")
-                
-                # Display the term sheet
-                st.subheader("Generated Term Sheet")
-                st.text_area("Term Sheet Content", term_sheet, height=400)
-                
-                # Download options
-                st.subheader("Download Options")
-                col1, col2 = st.columns(2)
-                
-                # Text download option
-                with col1:
-                    text_path = os.path.join("output", "term_sheet.txt")
-                    st.markdown(get_text_file_downloader_html(text_path, "Download as Text"), unsafe_allow_html=True)
-                
-                # DOCX download option (if generated)
-                if generate_docx and docx_path:
-                    with col2:
-                        st.markdown(get_binary_file_downloader_html(docx_path, "Download as DOCX"), unsafe_allow_html=True)
-                
-                # Display validation report if available
-                if validation_report:
-                    st.subheader("Validation Report")
-                    st.markdown(validation_report)
-            
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+        start_job(key, model_name, prompt, generate_docx, validate)
+
+# Show the generation for the current input parameters, running or finished
+job = st.session_state.jobs.get(key)
+if job is not None:
+    if job.done():
+        show_result(job, generate_docx)
+    else:
+        show_progress(job)
 
 # Footer
 st.markdown("---")
-st.markdown("© 2025 Term Sheet Generator | Powered by AI")
\ No newline at end of file
+st.markdown("© 2025 Term Sheet Generator | Powered by AI")
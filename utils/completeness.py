@@ -0,0 +1,184 @@
+"""Term Sheet Completeness Checks
+
+This module decides whether a rendered template already reflects the structured
+intent, in which case the document can skip LLM refinement entirely. When it
+does not, it reports which sections need attention so only those are refined.
+"""
+
+import re
+from typing import Any, Dict, List
+
+from utils.sections import split_sections
+
+
+# Template placeholders that stay in the document when the field is not rendered
+FIELD_PLACEHOLDERS = {
+    "company_name": ("[COMPANY NAME]",),
+    "amount": ("[AMOUNT]",),
+    "valuation_cap": ("[VALUATION CAP]", "[VALUATION]"),
+    "valuation": ("[VALUATION]",),
+    "discount": ("[DISCOUNT]",),
+}
+
+# Term labels whose lines are expected to carry the field's value
+FIELD_LABELS = {
+    "amount": ("Investment Amount", "Amount of Financing", "Purchase Amount", "Principal Amount"),
+    "valuation_cap": ("Valuation Cap", "Pre-Money Valuation"),
+    "valuation": ("Pre-Money Valuation", "Valuation"),
+    "pre_money_valuation": ("Pre-Money Valuation",),
+    "post_money_valuation": ("Post-Money Valuation",),
+    "discount": ("Discount",),
+    "liquidation_preference": ("Liquidation Preference",),
+    "board_seats": ("Board of Directors",),
+    "interest_rate": ("Interest",),
+    "maturity": ("Maturity",),
+    "anti_dilution": ("Anti-dilution",),
+    "dividend_rate": ("Dividend",),
+    "pro_rata": ("Pro Rata",),
+    "participation": ("Liquidation Preference", "Participation"),
+    "company_name": (),
+}
+
+# Fields that select the template rather than appear in it
+IGNORED_FIELDS = {"type"}
+
+
+def check_completeness(content: str, intent: Dict[str, Any]) -> Dict[str, Any]:
+    """Check whether a rendered term sheet reflects every field of the intent.
+
+    A placeholder only counts as unresolved when the intent has a value for its
+    field: placeholders for terms the user never specified (such as
+    ``[INVESTOR NAME]``) are expected in a draft and cannot be filled by the LLM
+    either.
+
+    Missing fields that cannot be located by their term label are attributed to
+    the first ``##`` section (the financing summary in all templates), which is
+    where a refinement pass should add them.
+
+    Args:
+        content: The rendered term sheet
+        intent: The structured intent
+
+    Returns:
+        A dictionary with ``complete`` (bool), ``unresolved_placeholders``,
+        ``missing_fields`` and ``unlocated_fields`` (lists), and ``sections``: the
+        sorted indices of the ``split_sections`` sections that need refinement
+    """
+    sections = split_sections(content)
+    unresolved = []
+    missing = []
+    unlocated = []
+    affected = set()
+
+    for field, value in intent.items():
+        if field in IGNORED_FIELDS or value is None or value == "":
+            continue
+
+        placeholder_indices = set()
+        for placeholder in FIELD_PLACEHOLDERS.get(field, ()):
+            indices = [i for i, section in enumerate(sections) if placeholder in section]
+            if indices:
+                unresolved.append(placeholder)
+                placeholder_indices.update(indices)
+        affected.update(placeholder_indices)
+
+        if not _field_present(content, field, value):
+            missing.append(field)
+            indices = _labelled_sections(sections, FIELD_LABELS.get(field, ()))
+            if indices:
+                affected.update(indices)
+            elif not placeholder_indices:
+                unlocated.append(field)
+                affected.add(summary_section_index(sections))
+
+    complete = not unresolved and not missing
+    return {
+        "complete": complete,
+        "unresolved_placeholders": unresolved,
+        "missing_fields": missing,
+        "unlocated_fields": unlocated,
+        "sections": sorted(affected),
+    }
+
+
+def summary_section_index(sections: List[str]) -> int:
+    """Return the index of the first ``##`` section, or 0 if there is none.
+
+    Args:
+        sections: The sections produced by ``split_sections``
+
+    Returns:
+        The section index
+    """
+    for index, section in enumerate(sections):
+        if section.startswith("## "):
+            return index
+    return 0
+
+
+def relevant_fields(section: str, intent: Dict[str, Any]) -> Dict[str, Any]:
+    """Select the intent fields that concern a section.
+
+    A field is relevant when its term label or placeholder appears in the
+    section, or, for text values, when the value itself does. Keeping section
+    prompts to these fields means a change to one term only alters the prompts
+    (and cache keys) of the sections that mention it.
+
+    Args:
+        section: A section produced by ``split_sections``
+        intent: The structured intent
+
+    Returns:
+        The subset of the intent relevant to the section
+    """
+    lowered = section.lower()
+    relevant = {}
+    for field, value in intent.items():
+        if field in IGNORED_FIELDS or value is None or value == "":
+            continue
+        labels = FIELD_LABELS.get(field, ())
+        if (any(label.lower() in lowered for label in labels)
+                or any(placeholder in section for placeholder in FIELD_PLACEHOLDERS.get(field, ()))
+                or (isinstance(value, str) and _normalize(value) in _normalize(section))):
+            relevant[field] = value
+    return relevant
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _field_present(content: str, field: str, value: Any) -> bool:
+    """Whether the value of an intent field is reflected in the content."""
+    lowered = content.lower()
+
+    if isinstance(value, bool):
+        if field == "pro_rata":
+            return not value or "pro rata rights" in lowered
+        if field == "participation":
+            # "non-participating" also contains "participating"
+            participating = re.search(r"(?<!non-)participat", lowered) is not None
+            return ("non-participating" in lowered) if not value else participating
+        return True
+
+    if isinstance(value, (int, float)):
+        lines = _labelled_lines(content, FIELD_LABELS.get(field, ())) or [content]
+        pattern = re.compile(rf"(?<![\d.]){re.escape(str(value))}(?![\d.])")
+        return any(pattern.search(line) for line in lines)
+
+    if isinstance(value, str):
+        return _normalize(value) in _normalize(content)
+
+    return True
+
+
+def _labelled_lines(content: str, labels) -> List[str]:
+    lowered_labels = [label.lower() for label in labels]
+    return [line for line in content.split("\n")
+            if any(label in line.lower() for label in lowered_labels)]
+
+
+def _labelled_sections(sections: List[str], labels) -> List[int]:
+    lowered_labels = [label.lower() for label in labels]
+    return [i for i, section in enumerate(sections)
+            if any(label in section.lower() for label in lowered_labels)]
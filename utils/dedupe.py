@@ -0,0 +1,218 @@
+"""Near-Duplicate Issue Merging
+
+This module folds validation issues that describe the same finding into one, for
+example the rule finding "Uncapped Indemnity" and the indemnity sentence an LLM
+quotes for the same clause. Two issues are treated as duplicates when
+
+- their locations in the document overlap (LLM issues are located by finding the
+  clause they quote), or
+- their clauses (or the document text a rule matched) have similar normalized
+  tokens: tokens are lowercased, stripped of stop words and cut to a short
+  stem, and candidate pairs are found with MinHash signatures and
+  locality-sensitive hashing before their Jaccard similarity is checked exactly.
+
+Both checks look issues up in hash buckets instead of comparing every pair, so
+merging stays near-linear in the number of issues, including when one
+``IssueDeduplicator`` collects the issues of a whole batch.
+"""
+
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the their this "
+    "to was which will with any all such may".split()
+)
+# Tokens are cut to this many characters, so "indemnify", "indemnity" and
+# "indemnification" share a stem
+STEM_LENGTH = 6
+
+# MinHash signatures are split into bands; issues sharing any band are candidates.
+# With 8 bands of 4 rows, pairs above a Jaccard similarity of about 0.6 are found.
+BANDS = 8
+ROWS = 4
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_PARAMETERS = [(2 * index + 1) * 0x9E3779B97F4A7C15 % MERSENNE_PRIME for index in range(BANDS * ROWS)]
+
+DEFAULT_THRESHOLD = 0.5
+
+# Document spans are bucketed by this many characters to find overlapping spans
+SPAN_BUCKET = 512
+
+# Quoted clauses shorter than this are too unspecific to locate in the document
+MIN_QUOTE_LENGTH = 12
+
+
+class IssueDeduplicator:
+    """Collects issues, folding each new issue into an earlier near-duplicate."""
+
+    def __init__(self, document: Optional[str] = None, threshold: float = DEFAULT_THRESHOLD):
+        """Initialize the deduplicator.
+
+        Args:
+            document: The document the issues refer to, used to locate quoted clauses
+                and compare locations (locations are ignored if None)
+            threshold: Minimum Jaccard similarity of the normalized tokens for two
+                issues to be merged
+        """
+        self.document = document
+        self.threshold = threshold
+        self.issues: List[Dict[str, Any]] = []
+        self._tokens: Dict[int, List[Set[str]]] = {}
+        self._bands: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self._spans: Dict[int, List[int]] = {}
+        self._lowered: Optional[str] = None
+
+    def add(self, issue: Dict[str, Any]) -> bool:
+        """Add an issue, unless it duplicates one already collected.
+
+        A duplicate is folded into the earlier issue, which keeps its own text and
+        gains the duplicate's location if it had none.
+
+        Args:
+            issue: The issue to add
+
+        Returns:
+            True if the issue was added, False if it was merged into an earlier one
+        """
+        issue = dict(issue)
+        span = self._locate(issue)
+        token_sets = [tokens for tokens in map(normalize_tokens, issue_texts(issue)) if tokens]
+        bands = [_bands(tokens) for tokens in token_sets]
+
+        match = self._find_duplicate(issue, span, token_sets, bands)
+        if match is not None:
+            kept = self.issues[match]
+            if span is not None and "span" not in kept:
+                kept["span"] = span
+                self._index_span(match, span)
+            _fold(kept, issue)
+            return False
+
+        index = len(self.issues)
+        if span is not None and "span" not in issue:
+            issue["span"] = span
+        self.issues.append(issue)
+        self._tokens[index] = token_sets
+        for band in {band for signature in bands for band in signature}:
+            self._bands.setdefault(band, []).append(index)
+        if span is not None:
+            self._index_span(index, span)
+        return True
+
+    def extend(self, issues: List[Dict[str, Any]]) -> None:
+        """Add several issues in order.
+
+        Args:
+            issues: The issues to add
+        """
+        for issue in issues:
+            self.add(issue)
+
+    def _find_duplicate(self, issue: Dict[str, Any], span: Optional[Tuple[int, int]],
+                        token_sets: List[Set[str]],
+                        bands: List[List[Tuple[int, Tuple[int, ...]]]]) -> Optional[int]:
+        if span is not None:
+            for bucket in _span_buckets(span):
+                for index in self._spans.get(bucket, ()):
+                    other = self.issues[index]["span"]
+                    if span[0] < other[1] and other[0] < span[1] and _compatible(issue, self.issues[index]):
+                        return index
+
+        candidates = sorted({index for signature in bands for band in signature
+                             for index in self._bands.get(band, ())})
+        for index in candidates:
+            similarity = max(jaccard(tokens, other) for tokens in token_sets for other in self._tokens[index])
+            if similarity >= self.threshold and _compatible(issue, self.issues[index]):
+                return index
+        return None
+
+    def _index_span(self, index: int, span: Tuple[int, int]) -> None:
+        for bucket in _span_buckets(span):
+            self._spans.setdefault(bucket, []).append(index)
+
+    def _locate(self, issue: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """Return the document span of an issue, locating its quoted clause if needed."""
+        if "span" in issue:
+            return tuple(issue["span"])
+        if self.document is None:
+            return None
+        quote = issue.get("clause", "").strip().strip("\"'“”‘’").rstrip(".…").strip()
+        if len(quote) < MIN_QUOTE_LENGTH:
+            return None
+        start = self.document.find(quote)
+        if start < 0:
+            if self._lowered is None:
+                self._lowered = self.document.lower()
+            start = self._lowered.find(quote.lower())
+        if start < 0:
+            return None
+        return start, start + len(quote)
+
+
+def merge_duplicates(issues: List[Dict[str, Any]], document: Optional[str] = None,
+                     threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """Fold near-duplicate issues together, keeping the first of each group.
+
+    Args:
+        issues: The issues, in order of preference
+        document: The document the issues refer to, if any
+        threshold: Minimum Jaccard similarity of the normalized tokens for two
+            issues to be merged
+
+    Returns:
+        The merged issues, in their original order
+    """
+    deduplicator = IssueDeduplicator(document, threshold)
+    deduplicator.extend(issues)
+    return deduplicator.issues
+
+
+def issue_texts(issue: Dict[str, Any]) -> List[str]:
+    """Return the texts an issue is compared by: its clause and any matched document text."""
+    return [text for text in (issue.get("clause", ""), issue.get("text", "")) if text]
+
+
+def normalize_tokens(text: str) -> Set[str]:
+    """Normalize text to a set of stemmed tokens without stop words.
+
+    Args:
+        text: The text to normalize
+
+    Returns:
+        The set of tokens
+    """
+    return {token[:STEM_LENGTH] for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS}
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    """Return the Jaccard similarity of two token sets."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _bands(tokens: Set[str]) -> List[Tuple[int, Tuple[int, ...]]]:
+    hashes = [zlib.crc32(token.encode("utf-8")) for token in tokens]
+    signature = [min((multiplier * value + 1) % MERSENNE_PRIME for value in hashes)
+                 for multiplier in HASH_PARAMETERS]
+    return [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _span_buckets(span: Tuple[int, int]) -> range:
+    return range(span[0] // SPAN_BUCKET, (max(span[1] - 1, span[0])) // SPAN_BUCKET + 1)
+
+
+def _compatible(issue: Dict[str, Any], other: Dict[str, Any]) -> bool:
+    # Findings of two different rules are distinct checks, even where they overlap
+    return issue.get("rule") is None or other.get("rule") is None or issue["rule"] == other["rule"]
+
+
+def _fold(kept: Dict[str, Any], duplicate: Dict[str, Any]) -> None:
+    for key in ("line", "locations"):
+        if key not in kept and key in duplicate:
+            kept[key] = duplicate[key]
+    kept["duplicates"] = kept.get("duplicates", 0) + 1
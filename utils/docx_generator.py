@@ -1,128 +1,108 @@
 """Document Generation Utilities
 
 This module provides utilities for generating DOCX documents from text content.
+The text is parsed as Markdown by ``utils.markdown``; a document that is
+exported to several formats can be parsed once and the tree passed in instead.
+Documents can be written to a file or rendered in memory, for serving them
+without a round trip through the disk.
 """
 
+import io
 import os
-from typing import Optional
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from typing import Iterable, Optional, Union
 
+from utils.docx_writer import DocxStreamWriter
+from utils.markdown import Node, parse, render_docx
+from utils.workspace import atomic_output
 
-def create_docx_from_text(text_content: str, output_path: str, company_name: Optional[str] = None) -> str:
+
+def create_docx_from_text(text_content: Union[str, Node], output_path: str,
+                          company_name: Optional[str] = None) -> str:
     """Create a DOCX document from text content.
 
     Args:
-        text_content: The text content to convert to DOCX
+        text_content: The text content to convert to DOCX, or its parsed Markdown tree
+        output_path: The path to save the DOCX document
+        company_name: Optional company name for the header
+
+    Returns:
+        The path to the created DOCX document
+    """
+    return create_docx_bundle([text_content], output_path, company_name)
+
+
+def create_docx_bundle(text_contents: Iterable[Union[str, Node]], output_path: str,
+                       company_name: Optional[str] = None) -> str:
+    """Create one DOCX document from several term sheets, each starting on a new page.
+
+    The term sheets are rendered and written one at a time, so the bundle can be
+    produced from a generator without holding all of them in memory.
+
+    Args:
+        text_contents: The text contents to convert, or their parsed Markdown trees
         output_path: The path to save the DOCX document
         company_name: Optional company name for the header
 
     Returns:
         The path to the created DOCX document
     """
-    # Create a new Document
-    doc = Document()
-    
-    # Set document margins
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Parse the text content and add to document with formatting
-    lines = text_content.split('\n')
-    current_section = None
-    in_list = False
-    list_indent = 0
-    
-    for line in lines:
-        line = line.rstrip()
-        
-        # Skip empty lines
-        if not line:
-            doc.add_paragraph()
-            continue
-        
-        # Check if line is a header (starts with # or ##)
-        if line.startswith('# '):
-            # Main header
-            p = doc.add_paragraph()
-            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            run = p.add_run(line[2:])
-            run.bold = True
-            run.font.size = Pt(14)
-            current_section = None
-            in_list = False
-        elif line.startswith('## '):
-            # Section header
-            p = doc.add_paragraph()
-            run = p.add_run(line[3:])
-            run.bold = True
-            run.font.size = Pt(12)
-            current_section = line[3:]
-            in_list = False
-        elif line.startswith('### '):
-            # Subsection header
-            p = doc.add_paragraph()
-            run = p.add_run(line[4:])
-            run.bold = True
-            run.italic = True
-            current_section = line[4:]
-            in_list = False
-        elif line.startswith('- ') or line.startswith('* '):
-            # List item
-            p = doc.add_paragraph()
-            p.style = 'List Bullet'
-            p.add_run(line[2:])
-            in_list = True
-        elif line.startswith('  - ') or line.startswith('  * '):
-            # Indented list item
-            p = doc.add_paragraph()
-            p.style = 'List Bullet 2'
-            p.add_run(line[4:])
-            in_list = True
-        elif line.startswith('(') and line[1].isdigit() and line.startswith(') ', 2):
-            # Numbered list detected like (1) Item
-            p = doc.add_paragraph()
-            p.style = 'List Number'
-            p.add_run(line[4:])
-            in_list = True
-        elif line.startswith('---'):
-            # Horizontal line
-            doc.add_paragraph('_' * 50)
-            in_list = False
-        else:
-            # Regular paragraph
-            if in_list and line.startswith('  '):
-                # Continuation of list item
-                last_paragraph = doc.paragraphs[-1]
-                last_paragraph.add_run('\n' + line.strip())
-            else:
-                p = doc.add_paragraph()
-                if '**' in line:
-                    # Handle bold text
-                    parts = line.split('**')
-                    for i, part in enumerate(parts):
-                        if i % 2 == 1:  # Odd parts are inside ** markers
-                            p.add_run(part).bold = True
-                        else:
-                            p.add_run(part)
-                else:
-                    p.add_run(line)
-                in_list = False
-    
     # Ensure the directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     
-    # Save the document
-    doc.save(output_path)
+    # The document only appears at its path once it is complete
+    with atomic_output(output_path) as temporary_path, DocxStreamWriter(temporary_path, company_name) as writer:
+        _write_documents(writer, text_contents)
     
     return output_path
 
 
+def create_docx_bytes(text_content: Union[str, Node], company_name: Optional[str] = None) -> bytes:
+    """Render a DOCX document in memory.
+
+    Args:
+        text_content: The text content to convert to DOCX, or its parsed Markdown tree
+        company_name: Optional company name for the header
+
+    Returns:
+        The content of the DOCX document
+    """
+    buffer = io.BytesIO()
+    with DocxStreamWriter(buffer, company_name) as writer:
+        _write_documents(writer, [text_content])
+    return buffer.getvalue()
+
+
+def _write_documents(writer: DocxStreamWriter, text_contents: Iterable[Union[str, Node]]) -> None:
+    """Render term sheets one after the other, each starting on a new page.
+
+    Args:
+        writer: The writer of the open document
+        text_contents: The text contents to convert, or their parsed Markdown trees
+    """
+    for index, text_content in enumerate(text_contents):
+        if index:
+            writer.add_page_break()
+        document = parse(text_content) if isinstance(text_content, str) else text_content
+        render_docx(document, writer)
+
+
+def extract_company_name(text_content: str) -> Optional[str]:
+    """Find the company name among the first lines of a term sheet.
+
+    Args:
+        text_content: The term sheet text
+
+    Returns:
+        The line naming the company, without Markdown markup, or None
+    """
+    for line in text_content.split('\n', 10)[:10]:  # Check first 10 lines
+        if 'COMPANY NAME' in line.upper() or 'INC.' in line.upper():
+            return line.strip().lstrip('#').strip().strip('*').strip()
+    return None
+
+
 def text_to_docx(text_content: str, output_filename: str = "term_sheet.docx") -> str:
     """Convert text content to a DOCX document.
 
@@ -133,16 +113,7 @@ def text_to_docx(text_content: str, output_filename: str = "term_sheet.docx") ->
     Returns:
         The path to the created DOCX document
     """
-    # Extract company name if present
-    company_name = None
-    lines = text_content.split('\n')
-    for line in lines[:10]:  # Check first 10 lines
-        if 'COMPANY NAME' in line or 'INC.' in line:
-            company_name = line.strip()
-            break
-    
-    # Create the document
-    return create_docx_from_text(text_content, output_filename, company_name)
+    return create_docx_from_text(text_content, output_filename, extract_company_name(text_content))
 
 
 # Example usage
@@ -0,0 +1,371 @@
+"""Streaming DOCX Writer
+
+This module writes DOCX files without building a python-docx object model. A
+pre-styled base template is built once per process from python-docx's default
+template: its heading styles are restyled for term sheets, a code character
+style and a page header are added, and parts a term sheet does not need are
+left out. The base parts are compressed into a zip archive once, and every
+document starts as a byte copy of that archive, to which only the page header
+and the document body are added. The body is written paragraph by paragraph as
+it is produced, and the writer keeps only the paragraph currently being written,
+so rendering time is linear in the length of the document and memory stays
+bounded, however many term sheets go into one file.
+"""
+
+import io
+import os
+import re
+import zipfile
+import threading
+from typing import Any, Dict, IO, Optional, Tuple, Union
+
+import docx
+
+
+BASE_TEMPLATE_PATH = os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+DOCUMENT_PART = "word/document.xml"
+HEADER_PART = "word/header1.xml"
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+)
+
+# Parts of the default template that term sheets do not use, and the
+# relationship and content type entries that refer to them
+UNUSED_PARTS = re.compile(r"stylesWithEffects|customXml|thumbnail")
+UNUSED_ENTRIES = re.compile(r"\s*<(?:Relationship|Override)\b[^>]*(?:stylesWithEffects|customXml|thumbnail)[^>]*/>")
+
+HEADER_RELATIONSHIP = (
+    '<Relationship Id="rIdHeader1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/header" Target="header1.xml"/>'
+)
+HEADER_CONTENT_TYPE = (
+    '<Override PartName="/word/header1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"/>'
+)
+
+# Term sheet heading styles: the title is centered, bold and 14 pt, sections are
+# bold and 12 pt, and lower levels are bold italic at the body size
+HEADING_FORMATS = {1: ('<w:jc w:val="center"/>', "<w:b/><w:sz w:val=\"28\"/>"),
+                   2: ("", "<w:b/><w:sz w:val=\"24\"/>")}
+SUBHEADING_FORMAT = ("", "<w:b/><w:i/>")
+CODE_STYLE = (
+    '<w:style w:type="character" w:customStyle="1" w:styleId="Code"><w:name w:val="Code"/>'
+    '<w:basedOn w:val="DefaultParagraphFont"/><w:qFormat/>'
+    '<w:rPr><w:rFonts w:ascii="Courier New" w:hAnsi="Courier New" w:cs="Courier New"/></w:rPr></w:style>'
+)
+
+# Page size, 1 inch margins (in twentieths of a point) and the page header
+SECTION_PROPERTIES = (
+    '<w:sectPr><w:headerReference w:type="default" r:id="rIdHeader1"/>'
+    '<w:pgSz w:w="12240" w:h="15840"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" '
+    'w:header="720" w:footer="720" w:gutter="0"/>'
+    '<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+)
+DOCUMENT_START = (
+    "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    f"<w:document {NAMESPACES}><w:body>"
+)
+# Width of the text between the margins
+TEXT_WIDTH = 12240 - 2 * 1440
+DOCUMENT_END = SECTION_PROPERTIES + "</w:body></w:document>"
+
+# Characters that are not allowed in XML 1.0
+INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+XML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+# Body XML is compressed in chunks of about this many characters
+FLUSH_SIZE = 64 * 1024
+
+_base_parts: Optional[Dict[str, bytes]] = None
+_base_archive: Optional[bytes] = None
+_base_lock = threading.Lock()
+
+
+def base_parts() -> Dict[str, bytes]:
+    """Return the package parts of the pre-styled base template.
+
+    The document body and page header are not included, since they differ for
+    every document. The template is built once per process.
+
+    Returns:
+        A dictionary mapping part names to their content
+    """
+    global _base_parts
+    with _base_lock:
+        if _base_parts is None:
+            _base_parts = _build_base_parts()
+        return _base_parts
+
+
+def base_archive() -> bytes:
+    """Return the base template parts as a compressed zip archive.
+
+    The archive is built once per process; each document is written by appending
+    its page header and body to a copy of it.
+
+    Returns:
+        The zip archive
+    """
+    global _base_archive
+    parts = base_parts()
+    with _base_lock:
+        if _base_archive is None:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name, content in parts.items():
+                    archive.writestr(name, content)
+            _base_archive = buffer.getvalue()
+        return _base_archive
+
+
+def _build_base_parts() -> Dict[str, bytes]:
+    with zipfile.ZipFile(BASE_TEMPLATE_PATH) as template:
+        parts = {
+            name: template.read(name) for name in template.namelist()
+            if name != DOCUMENT_PART and not UNUSED_PARTS.search(name)
+        }
+    for name in ("[Content_Types].xml", "_rels/.rels", "word/_rels/document.xml.rels"):
+        parts[name] = UNUSED_ENTRIES.sub("", parts[name].decode("utf-8")).encode("utf-8")
+    parts["[Content_Types].xml"] = _insert_before(parts["[Content_Types].xml"], "</Types>", HEADER_CONTENT_TYPE)
+    parts["word/_rels/document.xml.rels"] = _insert_before(
+        parts["word/_rels/document.xml.rels"], "</Relationships>", HEADER_RELATIONSHIP
+    )
+
+    styles = parts["word/styles.xml"].decode("utf-8")
+    for level in range(1, 7):
+        paragraph, run = HEADING_FORMATS.get(level, SUBHEADING_FORMAT)
+        heading = (
+            f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+            f'<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="9"/><w:qFormat/>'
+            f'<w:pPr><w:keepNext/>{paragraph}<w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+            f"<w:rPr>{run}</w:rPr></w:style>"
+        )
+        styles = re.sub(rf'<w:style [^>]*w:styleId="Heading{level}">.*?</w:style>',
+                        lambda _: heading, styles, count=1, flags=re.DOTALL)
+    parts["word/styles.xml"] = _insert_before(styles.encode("utf-8"), "</w:styles>", CODE_STYLE)
+    return parts
+
+
+def _insert_before(content: bytes, closing_tag: str, xml: str) -> bytes:
+    text = content.decode("utf-8")
+    index = text.rindex(closing_tag)
+    return (text[:index] + xml + text[index:]).encode("utf-8")
+
+
+def header_xml(company_name: Optional[str] = None) -> str:
+    """Return the page header part, showing the company name on the right.
+
+    Args:
+        company_name: The company name (an empty header if None)
+
+    Returns:
+        The header XML
+    """
+    run = f'<w:r><w:t xml:space="preserve">{_escape(company_name)}</w:t></w:r>' if company_name else ""
+    return (
+        "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+        f'<w:hdr {NAMESPACES}><w:p><w:pPr><w:pStyle w:val="Header"/><w:jc w:val="right"/></w:pPr>'
+        f"{run}</w:p></w:hdr>"
+    )
+
+
+class DocxStreamWriter:
+    """Writes a DOCX file paragraph by paragraph.
+
+    Start a paragraph with ``add_paragraph`` and add text to it with ``add_run``;
+    the paragraph stays current, so later runs (such as list continuation lines)
+    can still be appended, until the next paragraph starts or the writer closes.
+
+    A table is written between ``start_table`` and ``end_table``: each row starts
+    with ``add_table_row`` and each cell with ``add_table_cell``, which also
+    starts the cell's first paragraph.
+    """
+
+    def __init__(self, output: Union[str, IO[bytes]], company_name: Optional[str] = None):
+        """Open the output and start it with the base template.
+
+        Args:
+            output: Path or writable binary file the DOCX is written to
+            company_name: Company name shown in the page header, if any
+        """
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, "wb") as f:
+                f.write(base_archive())
+            self._zip = zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED)
+        elif _seekable(output):
+            output.write(base_archive())
+            self._zip = zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED)
+        else:
+            # A stream that cannot be read back gets the parts compressed again
+            self._zip = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED)
+            for name, content in base_parts().items():
+                self._zip.writestr(name, content)
+        self._zip.writestr(HEADER_PART, header_xml(company_name))
+        self._body = self._zip.open(DOCUMENT_PART, "w")
+        self._buffer = [DOCUMENT_START]
+        self._buffered = len(DOCUMENT_START)
+        self._paragraph_open = False
+        self._table: Optional[Dict[str, Any]] = None
+        self._run_properties: Dict[Tuple[bool, bool, Optional[float], Optional[str]], str] = {}
+
+    def add_paragraph(self, style: Optional[str] = None, alignment: Optional[str] = None) -> None:
+        """Start a new paragraph, ending the current one.
+
+        Args:
+            style: Style ID of the paragraph, e.g. "ListBullet"
+            alignment: Paragraph alignment, e.g. "center"
+        """
+        self._end_paragraph()
+        properties = ""
+        if style:
+            properties += f'<w:pStyle w:val="{style}"/>'
+        if alignment:
+            properties += f'<w:jc w:val="{alignment}"/>'
+        self._write("<w:p>" + (f"<w:pPr>{properties}</w:pPr>" if properties else ""))
+        self._paragraph_open = True
+
+    def add_run(self, text: str, bold: bool = False, italic: bool = False,
+                size: Optional[float] = None, style: Optional[str] = None) -> None:
+        """Add text to the current paragraph.
+
+        Line breaks in the text become line breaks within the paragraph.
+
+        Args:
+            text: The text
+            bold: Whether the text is bold
+            italic: Whether the text is italic
+            size: Font size in points (the style's size if None)
+            style: Character style ID, e.g. "Code"
+        """
+        if not self._paragraph_open:
+            self.add_paragraph()
+        pieces = []
+        for index, line in enumerate(text.split("\n")):
+            if index:
+                pieces.append("<w:br/>")
+            if line:
+                pieces.append(f'<w:t xml:space="preserve">{_escape(line)}</w:t>')
+        self._write(f"<w:r>{self._properties(bold, italic, size, style)}{''.join(pieces)}</w:r>")
+
+    def add_page_break(self) -> None:
+        """Add a page break, in a paragraph of its own."""
+        self.end_table()
+        self.add_paragraph()
+        self._write('<w:r><w:br w:type="page"/></w:r>')
+
+    def start_table(self, columns: int, style: str = "TableGrid") -> None:
+        """Start a table with columns of equal width, ending the current paragraph.
+
+        Args:
+            columns: Number of columns
+            style: Style ID of the table
+        """
+        self.end_table()
+        self._end_paragraph()
+        width = TEXT_WIDTH // max(columns, 1)
+        grid = f'<w:gridCol w:w="{width}"/>' * columns
+        self._write(f'<w:tbl><w:tblPr><w:tblStyle w:val="{style}"/><w:tblW w:w="0" w:type="auto"/>'
+                    f'</w:tblPr><w:tblGrid>{grid}</w:tblGrid>')
+        self._table = {"width": width, "row": False, "cell": False}
+
+    def add_table_row(self, header: bool = False) -> None:
+        """Start a new row of the current table.
+
+        Args:
+            header: Whether the row is a header row, repeated on every page
+        """
+        self._end_row()
+        self._write("<w:tr><w:trPr><w:tblHeader/></w:trPr>" if header else "<w:tr>")
+        self._table["row"] = True
+
+    def add_table_cell(self, alignment: Optional[str] = None) -> None:
+        """Start a new cell of the current row, and the cell's first paragraph.
+
+        Args:
+            alignment: Alignment of the cell's paragraph, e.g. "center"
+        """
+        self._end_cell()
+        width = self._table["width"]
+        self._write(f'<w:tc><w:tcPr><w:tcW w:w="{width}" w:type="dxa"/></w:tcPr>')
+        self._table["cell"] = True
+        self.add_paragraph(alignment=alignment)
+
+    def end_table(self) -> None:
+        """End the current table, if any."""
+        if self._table is None:
+            return
+        self._end_row()
+        self._write("</w:tbl>")
+        self._table = None
+
+    def close(self) -> None:
+        """Finish the document and close the output."""
+        if self._body is None:
+            return
+        self.end_table()
+        self._end_paragraph()
+        self._write(DOCUMENT_END)
+        self._flush()
+        self._body.close()
+        self._body = None
+        self._zip.close()
+
+    def __enter__(self) -> "DocxStreamWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _properties(self, bold: bool, italic: bool, size: Optional[float], style: Optional[str]) -> str:
+        # Run formatting is built once per combination and reused for every run
+        key = (bold, italic, size, style)
+        properties = self._run_properties.get(key)
+        if properties is None:
+            properties = f'<w:rStyle w:val="{style}"/>' if style else ""
+            properties += ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "")
+            if size:
+                properties += f'<w:sz w:val="{int(size * 2)}"/>'
+            properties = f"<w:rPr>{properties}</w:rPr>" if properties else ""
+            self._run_properties[key] = properties
+        return properties
+
+    def _end_paragraph(self) -> None:
+        if self._paragraph_open:
+            self._write("</w:p>")
+            self._paragraph_open = False
+
+    def _end_cell(self) -> None:
+        if self._table is not None and self._table["cell"]:
+            self._end_paragraph()
+            self._write("</w:tc>")
+            self._table["cell"] = False
+
+    def _end_row(self) -> None:
+        self._end_cell()
+        if self._table is not None and self._table["row"]:
+            self._write("</w:tr>")
+            self._table["row"] = False
+
+    def _write(self, xml: str) -> None:
+        self._buffer.append(xml)
+        self._buffered += len(xml)
+        if self._buffered >= FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        self._body.write("".join(self._buffer).encode("utf-8"))
+        self._buffer = []
+        self._buffered = 0
+
+
+def _seekable(output: IO[bytes]) -> bool:
+    try:
+        return output.seekable() and output.readable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _escape(text: str) -> str:
+    return INVALID_XML_CHARS.sub("", text).translate(XML_ESCAPES)
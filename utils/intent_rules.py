@@ -0,0 +1,232 @@
+"""Rule-Based Intent Extraction
+
+This module extracts term sheet fields from a natural language prompt in a single
+pass. One precompiled pattern tokenizes the prompt into values (amounts,
+percentages, multiples, durations, counts), term keywords and flags; each value
+is then bound to the nearest compatible keyword in the same clause, so phrasings
+such as "$20M pre-money valuation" and "pre-money valuation of $20M" are both
+understood. Every extracted field carries a confidence between 0 and 1.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Fields at or above this confidence are trusted without asking the LLM
+CONFIDENT = 0.8
+
+# Tokens only start at word boundaries; the leading lookarounds reject every
+# other position before any of the alternatives is tried
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?<![\w$])(?=[\w$])
+    (?:
+      (?P<money>\$\s?\d[\d,]*(?:\.\d+)?(?:\s*(?:thousand|million|billion|mm|bn|k|m|b)\b)?)
+    | (?P<percent>\b\d+(?:\.\d+)?\s*(?:%|percent\b))
+    | (?P<multiple>\b\d+(?:\.\d+)?\s*x\b)
+    | (?P<duration>\b\d+\s*-?\s*(?:months?|years?)\b)
+    | (?P<type>\bseries\s+[a-h]\b|\bsafes?\b|\bconvertible\s+(?:promissory\s+)?notes?\b)
+    | (?P<pre_money>\bpre-?\s?money(?:\s+valuation)?\b)
+    | (?P<post_money>\bpost-?\s?money(?:\s+valuation)?\b)
+    | (?P<valuation_cap>\bvaluation\s+cap\b|\bcap(?:ped)?\b)
+    | (?P<valuation>\bvaluation\b|\bvalued\b)
+    | (?P<amount>\bamount\b|\brais(?:e|es|ing)\b|\binvest(?:s|ing|ment)?\b|\bround\s+of\b|\bprincipal\b)
+    | (?P<discount>\bdiscount\b)
+    | (?P<interest_rate>\binterest(?:\s+rate)?\b|\bcoupon\b)
+    | (?P<maturity>\bmatur(?:ity|ing|es|e)\b|\bterm\s+of\b)
+    | (?P<dividend_rate>\bdividends?(?:\s+rate)?\b)
+    | (?P<liquidation_preference>\bliquidation\s+preferences?\b|\bliq(?:uidation)?\s+pref\b)
+    | (?P<board_seats>\bboard\s+seats?\b|\bboard\s+(?:members?|directors?)\b|\bdirectors?\b)
+    | (?P<non_participating>\bnon-?\s?participat(?:ing|ion)\b)
+    | (?P<participating>\bparticipat(?:ing|ion)\b)
+    | (?P<pro_rata>\bpro[\s-]+rata(?:\s+rights?)?\b)
+    | (?P<anti_dilution>\bfull[\s-]+ratchet\b|\b(?:broad|narrow)[\s-]+based(?:\s+weighted[\s-]+average)?\b
+                        |\bweighted[\s-]+average\b)
+    | (?P<count>\b(?:\d{1,2}|one|two|three|four|five)\b)
+    | (?P<company>(?-i:\b(?:for|of|with|by)\s+(?P<company_name>(?:[A-Z][\w&'.-]*\s+){0,4}?[A-Z][\w&'.-]*,?\s+
+                 (?:Inc|LLC|Ltd|Corp|Corporation|Co|PBC|GmbH)\b\.?)))
+    | (?P<named>(?:called|named)\s+(?P<named_company>(?-i:[A-Z][\w&'.-]*(?:\s+[A-Z][\w&'.-]*){0,3})))
+    )
+    """,
+    re.IGNORECASE | re.VERBOSE
+)
+
+VALUE_KINDS = ("money", "percent", "multiple", "duration", "count")
+
+# The value kind each keyword expects, and the field it fills
+KEYWORD_FIELDS = {
+    "type": ("money", "amount"),
+    "amount": ("money", "amount"),
+    "pre_money": ("money", "valuation"),
+    "post_money": ("money", "post_money_valuation"),
+    "valuation_cap": ("money", "valuation_cap"),
+    "valuation": ("money", "valuation"),
+    "discount": ("percent", "discount"),
+    "interest_rate": ("percent", "interest_rate"),
+    "dividend_rate": ("percent", "dividend_rate"),
+    "maturity": ("duration", "maturity"),
+    "liquidation_preference": ("multiple", "liquidation_preference"),
+    "board_seats": ("count", "board_seats"),
+}
+
+# Keyword tokens that may sit between a value and its keyword without breaking the binding
+TRANSPARENT_KINDS = ("non_participating", "participating")
+
+# Text between a value and a keyword that ends the clause
+CLAUSE_BREAK = re.compile(r"[,;:()]|\b(?:and|with|plus|but|or)\b", re.IGNORECASE)
+MAX_GAP = 30
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+MONEY_SUFFIXES = {"k": "K", "thousand": "K", "m": "M", "mm": "M", "million": "M",
+                  "b": "B", "bn": "B", "billion": "B"}
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+MONEY_VALUE = re.compile(r"\$\s?([\d,]+(?:\.\d+)?)\s*([a-z]*)", re.IGNORECASE)
+DURATION_VALUE = re.compile(r"(\d+)\s*-?\s*(month|year)", re.IGNORECASE)
+NEGATION = re.compile(r"\b(?:no|without|excluding|exclude|not)\s+(?:\w+\s+)?$", re.IGNORECASE)
+
+
+def extract_intent(prompt: str) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Extract the structured intent from a prompt.
+
+    Args:
+        prompt: The natural language prompt
+
+    Returns:
+        A tuple of the intent dictionary and the confidence of each of its fields
+    """
+    tokens = _tokenize(prompt)
+    intent: Dict[str, Any] = {}
+    confidence: Dict[str, float] = {}
+
+    def put(field: str, value: Any, score: float) -> None:
+        if field not in intent or score > confidence[field]:
+            intent[field] = value
+            confidence[field] = score
+
+    unbound_money = []
+    for index, token in enumerate(tokens):
+        kind = token["kind"]
+        if kind in VALUE_KINDS:
+            binding = _bind(prompt, tokens, index)
+            if binding is not None:
+                field, score = binding
+                put(field, _normalize_value(kind, token["text"]), score)
+            elif kind == "money":
+                unbound_money.append(token)
+        elif kind == "type":
+            put("type", normalize_type(token["text"]), 0.6 if token["text"] in ("safe", "safes") else 1.0)
+        elif kind == "non_participating":
+            put("participation", False, 0.9)
+        elif kind == "participating" and "participation" not in intent:
+            put("participation", True, 0.85)
+        elif kind == "pro_rata":
+            negated = NEGATION.search(prompt, 0, token["start"]) is not None
+            put("pro_rata", not negated, 0.95)
+        elif kind == "anti_dilution":
+            put("anti_dilution", _normalize_anti_dilution(token["text"]), 0.9)
+        elif kind == "company":
+            put("company_name", token["value"].strip(), 0.9)
+        elif kind == "named":
+            put("company_name", token["value"].strip(), 0.8)
+
+    # A lone dollar amount with no keyword nearby is most likely the investment
+    if "amount" not in intent and unbound_money:
+        put("amount", _normalize_value("money", unbound_money[0]["text"]), 0.6)
+
+    return intent, confidence
+
+
+def normalize_type(text: str) -> str:
+    """Normalize a financing type to the names the templates are selected by.
+
+    Args:
+        text: The type as written, e.g. "series b" or "convertible notes"
+
+    Returns:
+        "Series A" to "Series H", "SAFE", "Convertible Note", or the stripped
+        input if it is none of these
+    """
+    lowered = " ".join(str(text).lower().split())
+    match = re.match(r"series\s+([a-h])\b", lowered)
+    if match:
+        return f"Series {match.group(1).upper()}"
+    if lowered.startswith("safe"):
+        return "SAFE"
+    if "convertible" in lowered or "note" in lowered:
+        return "Convertible Note"
+    return str(text).strip()
+
+
+def _tokenize(prompt: str) -> List[Dict[str, Any]]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(prompt):
+        kind = match.lastgroup
+        token = {"kind": kind, "text": match.group(kind), "start": match.start(), "end": match.end()}
+        if kind == "company":
+            token["value"] = match.group("company_name")
+        elif kind == "named":
+            token["value"] = match.group("named_company")
+        tokens.append(token)
+    return tokens
+
+
+def _bind(prompt: str, tokens: List[Dict[str, Any]], index: int) -> Optional[Tuple[str, float]]:
+    """Bind a value token to a compatible keyword next to it in the same clause.
+
+    Only the nearest non-transparent token on either side can qualify, since any
+    other token between a value and a keyword breaks the binding.
+
+    Returns:
+        The field and confidence, or None if no keyword is close enough
+    """
+    value = tokens[index]
+    best = None
+    for step in (-1, 1):
+        position = index + step
+        while 0 <= position < len(tokens) and tokens[position]["kind"] in TRANSPARENT_KINDS:
+            position += step
+        if not 0 <= position < len(tokens):
+            continue
+        keyword = tokens[position]
+        expected = KEYWORD_FIELDS.get(keyword["kind"])
+        if expected is None or expected[0] != value["kind"]:
+            continue
+        begin, end = (keyword["end"], value["start"]) if step < 0 else (value["end"], keyword["start"])
+        gap = prompt[begin:end]
+        if len(gap) > MAX_GAP or CLAUSE_BREAK.search(gap):
+            continue
+        if best is None or len(gap) < best[0]:
+            best = (len(gap), expected[1])
+
+    if best is None:
+        return None
+    gap_length, field = best
+    return field, 0.95 if gap_length <= 6 else 0.85
+
+
+def _normalize_value(kind: str, text: str) -> Any:
+    text = " ".join(text.split())
+    if kind == "money":
+        number, suffix = MONEY_VALUE.match(text).groups()
+        suffix = suffix.lower()
+        return f"${number}{MONEY_SUFFIXES.get(suffix, '')}"
+    if kind == "percent":
+        return NUMBER.match(text).group(0) + "%"
+    if kind == "multiple":
+        return NUMBER.match(text).group(0) + "x"
+    if kind == "duration":
+        number, unit = DURATION_VALUE.match(text).groups()
+        unit = unit.lower()
+        return f"{number} {unit}" if number == "1" else f"{number} {unit}s"
+    if kind == "count":
+        return NUMBER_WORDS.get(text.lower()) or int(text)
+    return text
+
+
+def _normalize_anti_dilution(text: str) -> str:
+    lowered = " ".join(text.lower().replace("-", " ").split())
+    if lowered.startswith("full"):
+        return "full ratchet"
+    if lowered.startswith("narrow"):
+        return "narrow-based weighted average"
+    return "broad-based weighted average"
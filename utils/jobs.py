@@ -0,0 +1,202 @@
+"""Background Job Queue
+
+This module runs submitted coroutines on a fixed number of asyncio workers,
+behind a bounded queue. The number of workers caps how many jobs call the LLM at
+once; when the queue is full, new jobs are refused with an estimate of when to
+retry instead of piling up, so latency stays predictable under load.
+
+Jobs are plain dictionaries that callers poll by id. Finished jobs, with their
+results, are kept for a retention period, then forgotten; past a maximum number
+of finished jobs the oldest are forgotten early, so the results held in memory
+stay bounded under sustained load.
+"""
+
+import math
+import time
+import uuid
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_QUEUED = 32
+DEFAULT_RETENTION = 3600.0
+DEFAULT_MAX_RETAINED = 256
+
+# Assumed duration of a job until some have finished, in seconds
+DEFAULT_JOB_SECONDS = 10.0
+# Weight of the latest job in the running average of job durations
+DURATION_SMOOTHING = 0.2
+MAX_RETRY_AFTER = 120
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+logger = logging.getLogger("termsheet.jobs")
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+    def __init__(self, retry_after: int):
+        """Initialize the error.
+
+        Args:
+            retry_after: Estimated number of seconds until the queue has room
+        """
+        super().__init__(f"The job queue is full, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """A bounded queue of jobs run by a fixed number of asyncio workers."""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_queued: int = DEFAULT_MAX_QUEUED, retention: float = DEFAULT_RETENTION,
+                 max_retained: int = DEFAULT_MAX_RETAINED):
+        """Initialize the queue.
+
+        Args:
+            max_concurrency: Number of jobs run at once
+            max_queued: Number of jobs that may wait for a worker before new jobs are refused
+            retention: Seconds a finished job is kept for polling
+            max_retained: Number of finished jobs kept; the oldest are forgotten first
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queued = max(1, max_queued)
+        self.retention = retention
+        self.max_retained = max(1, max_retained)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._done: Dict[str, asyncio.Event] = {}
+        self._finished: Deque[Tuple[float, str]] = deque()
+        self._running = 0
+        self._average_seconds = DEFAULT_JOB_SECONDS
+
+    async def start(self) -> None:
+        """Start the workers on the running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(self.max_queued)
+        self._workers = [asyncio.create_task(self._work(), name=f"job-worker-{index}")
+                         for index in range(self.max_concurrency)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued and running jobs are abandoned."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, kind: str, func: Callable[..., Awaitable[Any]], *args: Any,
+               job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a job.
+
+        Args:
+            kind: What the job does, e.g. ``generate``
+            func: The coroutine function the job runs
+            *args: Positional arguments for the function
+            job_id: Identifier of the job (a random id if None)
+
+        Returns:
+            The job, with its ``id``, ``kind``, ``status`` and ``submitted`` time;
+            ``result`` or ``error`` is set when it finishes
+
+        Raises:
+            RuntimeError: If the queue has not been started
+            QueueFullError: If the queue is full
+        """
+        if self._queue is None:
+            raise RuntimeError("The job queue has not been started")
+        self._forget_expired()
+        job = {"id": job_id or uuid.uuid4().hex, "kind": kind, "status": QUEUED,
+               "submitted": time.time(), "started": None, "finished": None,
+               "result": None, "error": None}
+        try:
+            self._queue.put_nowait((job, func, args))
+        except asyncio.QueueFull:
+            raise QueueFullError(self.retry_after()) from None
+        self.jobs[job["id"]] = job
+        self._done[job["id"]] = asyncio.Event()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job by id, or None if it is unknown or was forgotten."""
+        self._forget_expired()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait until a job finishes or the timeout expires.
+
+        Args:
+            job_id: Identifier of the job
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            The job, finished or not, or None if it is unknown
+        """
+        job = self.get(job_id)
+        done = self._done.get(job_id)
+        if job is None or done is None or timeout <= 0:
+            return job
+        try:
+            await asyncio.wait_for(done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until a job submitted now would find room in the queue."""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        # A queue slot frees up each time a worker takes the next job
+        seconds = self._average_seconds * (queued - self.max_queued + 1) / self.max_concurrency
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(seconds)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the numbers of queued, running and retained jobs and the queue limits."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "retained": len(self._finished),
+            "max_queued": self.max_queued,
+            "max_concurrency": self.max_concurrency,
+            "max_retained": self.max_retained,
+            "average_seconds": round(self._average_seconds, 3),
+        }
+
+    async def _work(self) -> None:
+        while True:
+            job, func, args = await self._queue.get()
+            self._running += 1
+            job["status"] = RUNNING
+            job["started"] = time.time()
+            try:
+                job["result"] = await func(*args)
+                job["status"] = SUCCEEDED
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+                job["error"] = str(e)
+                job["status"] = FAILED
+            finally:
+                self._running -= 1
+                job["finished"] = time.time()
+                self._average_seconds += DURATION_SMOOTHING * (
+                    job["finished"] - job["started"] - self._average_seconds
+                )
+                self._finished.append((job["finished"], job["id"]))
+                self._done.pop(job["id"]).set()
+                self._queue.task_done()
+                self._forget_expired()
+
+    def _forget_expired(self) -> None:
+        expiry = time.time() - self.retention
+        while self._finished and (self._finished[0][0] < expiry or len(self._finished) > self.max_retained):
+            _, job_id = self._finished.popleft()
+            self.jobs.pop(job_id, None)
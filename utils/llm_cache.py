@@ -0,0 +1,355 @@
+"""LLM Response Cache
+
+This module provides a content-addressed cache for language model responses that
+is shared by all agents. Entries are keyed by a hash of the model name, the
+temperature and the fully formatted prompt, and live in an in-memory LRU tier
+backed by an optional SQLite tier on disk.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from utils.metrics import record_llm_call, token_usage
+from utils.rate_limit import (CHARS_PER_TOKEN, acall_with_retries, call_with_retries, estimate_prompt_tokens,
+                              estimate_tokens, get_rate_limiter)
+
+
+DEFAULT_CACHE_PATH = os.path.join("output", ".cache", "llm_cache.sqlite")
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) cache of LLM response texts."""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 512,
+                 max_disk_entries: int = 10000, ttl_seconds: Optional[float] = 7 * 24 * 3600):
+        """Initialize the cache.
+
+        Args:
+            db_path: Path of the SQLite database for the disk tier (memory only if None)
+            max_entries: Maximum number of entries kept in memory
+            max_disk_entries: Maximum number of entries kept on disk
+            ttl_seconds: Time after which an entry expires (never if None)
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+        self._db = None
+
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_name: str, temperature: Optional[float],
+                 messages: List[BaseMessage], **extra: Any) -> str:
+        """Build the cache key for a prompt.
+
+        Args:
+            model_name: The name of the language model
+            temperature: The sampling temperature of the model
+            messages: The fully formatted prompt messages
+            **extra: Additional call options that change the response
+
+        Returns:
+            A hex SHA-256 digest identifying the request
+        """
+        payload = {
+            "model": model_name,
+            "temperature": temperature,
+            "messages": [[message.type, message.content] for message in messages],
+            "extra": extra,
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            The cached response text, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at, now):
+                        self._db.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._db.commit()
+                        self._remember(key, created_at, value)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response.
+
+        Args:
+            key: The cache key
+            value: The response text
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                overflow = count - self.max_disk_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                        (overflow,)
+                    )
+                    self._stats["evictions"] += overflow
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Remove all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self) -> None:
+        """Close the disk tier."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit, miss and eviction counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+_default_cache: Optional[LLMResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> LLMResponseCache:
+    """Return the process-wide cache, creating it on first use.
+
+    The disk tier lives at ``DEFAULT_CACHE_PATH`` unless the
+    ``TERM_SHEET_LLM_CACHE`` environment variable points elsewhere.
+
+    Returns:
+        The shared LLMResponseCache instance
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            db_path = os.environ.get("TERM_SHEET_LLM_CACHE", DEFAULT_CACHE_PATH)
+            _default_cache = LLMResponseCache(db_path=db_path)
+        return _default_cache
+
+
+def _llm_identity(llm: Any) -> Tuple[str, Optional[float]]:
+    """Return the model name and temperature of a chat model."""
+    model_name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+    return str(model_name), getattr(llm, "temperature", None)
+
+
+def invoke_llm(llm: Any, messages: List[BaseMessage],
+               cache: Optional[LLMResponseCache] = None, **call_options: Any) -> str:
+    """Call a chat model, serving the response from the cache when possible.
+
+    Calls that miss the cache go through the model's shared rate limiter and are
+    retried with backoff on transient errors. The call is recorded on the active
+    RunMetrics, if any.
+
+    Args:
+        llm: The chat model
+        messages: The fully formatted prompt messages
+        cache: The response cache to use (no caching if None)
+        **call_options: Options passed to the model call, such as ``response_format``;
+            they are part of the cache key
+
+    Returns:
+        The response text
+    """
+    model_name, temperature = _llm_identity(llm)
+    start = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = LLMResponseCache.make_key(model_name, temperature, messages, **call_options)
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_call(model_name, _elapsed_ms(start), cached=True)
+            return cached
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages, call_options)
+    response = call_with_retries(limiter, estimated, lambda: llm.invoke(messages, **call_options))
+    usage = token_usage(response)
+    limiter.settle(estimated, sum(usage.values()))
+    record_llm_call(model_name, _elapsed_ms(start), usage)
+    if key is not None:
+        cache.set(key, response.content)
+    return response.content
+
+
+async def ainvoke_llm(llm: Any, messages: List[BaseMessage],
+                      cache: Optional[LLMResponseCache] = None, **call_options: Any) -> str:
+    """Asynchronously call a chat model, serving the response from the cache when possible.
+
+    Calls that miss the cache go through the model's shared rate limiter and are
+    retried with backoff on transient errors. The call is recorded on the active
+    RunMetrics, if any.
+
+    Args:
+        llm: The chat model
+        messages: The fully formatted prompt messages
+        cache: The response cache to use (no caching if None)
+        **call_options: Options passed to the model call, such as ``response_format``;
+            they are part of the cache key
+
+    Returns:
+        The response text
+    """
+    model_name, temperature = _llm_identity(llm)
+    start = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = LLMResponseCache.make_key(model_name, temperature, messages, **call_options)
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_call(model_name, _elapsed_ms(start), cached=True)
+            return cached
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages, call_options)
+    response = await acall_with_retries(limiter, estimated, lambda: llm.ainvoke(messages, **call_options))
+    usage = token_usage(response)
+    limiter.settle(estimated, sum(usage.values()))
+    record_llm_call(model_name, _elapsed_ms(start), usage)
+    if key is not None:
+        cache.set(key, response.content)
+    return response.content
+
+
+def stream_llm(llm: Any, messages: List[BaseMessage],
+               cache: Optional[LLMResponseCache] = None) -> Iterator[str]:
+    """Stream a chat model response chunk by chunk.
+
+    A cached response is yielded as a single chunk. Otherwise chunks are yielded
+    as the model produces them, and the full response is cached once the stream
+    has been consumed completely. The stream is opened through the model's shared
+    rate limiter, and retried with backoff if it fails before its first chunk. The
+    call is recorded on the active RunMetrics, if any.
+
+    Args:
+        llm: The chat model
+        messages: The fully formatted prompt messages
+        cache: The response cache to use (no caching if None)
+
+    Yields:
+        Pieces of the response text
+    """
+    model_name, temperature = _llm_identity(llm)
+    start = time.perf_counter()
+    key = None
+    if cache is not None:
+        key = LLMResponseCache.make_key(model_name, temperature, messages)
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_call(model_name, _elapsed_ms(start), cached=True)
+            yield cached
+            return
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages, {})
+    chunks = call_with_retries(limiter, estimated, lambda: _open_stream(llm, messages))
+    parts = []
+    usage = {"prompt_tokens": 0, "completion_tokens": 0}
+    try:
+        for chunk in chunks:
+            for name, count in token_usage(chunk).items():
+                usage[name] += count
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+    finally:
+        # Runs when the consumer abandons the stream too; usage is only reported at
+        # the end of a stream, so the tokens of an unfinished one are estimated
+        used = sum(usage.values()) or (
+            estimate_prompt_tokens(messages) + len("".join(parts)) // CHARS_PER_TOKEN
+        )
+        limiter.settle(estimated, used)
+        record_llm_call(model_name, _elapsed_ms(start), usage)
+
+    if key is not None:
+        cache.set(key, "".join(parts))
+
+
+def _open_stream(llm: Any, messages: List[BaseMessage]) -> Iterator[Any]:
+    """Start a streamed call, so errors before the first chunk are raised here."""
+    chunks = iter(llm.stream(messages))
+    first = next(chunks, None)
+    return itertools.chain([first] if first is not None else [], chunks)
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
@@ -0,0 +1,125 @@
+"""LLM Client Pool
+
+This module provides chat model instances that share keep-alive HTTP connection
+pools, so agents reuse TCP/TLS connections across requests instead of opening new
+ones for every prompt.
+
+Async connections belong to the event loop that opened them, so the async client
+keeps a separate connection pool for every running loop. A pipeline can then be
+used from one ``asyncio.run()`` after another.
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+
+class LLMClientPool:
+    """Shared HTTP clients and chat models for all agents of a pipeline."""
+
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 60.0, timeout: float = 120.0):
+        """Initialize the client pool.
+
+        Args:
+            max_connections: Maximum number of concurrent connections to the API
+            max_keepalive_connections: Maximum number of idle connections kept open
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Request timeout in seconds
+        """
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(transport=LoopLocalTransport(limits), timeout=timeout)
+        self._models: Dict[Tuple[str, Optional[float]], Any] = {}
+        self._lock = threading.Lock()
+
+    def chat_model(self, model_name: str, temperature: Optional[float] = None) -> ChatOpenAI:
+        """Return a chat model that uses the shared HTTP clients.
+
+        Models are created once per model name and temperature and reused.
+
+        Args:
+            model_name: The name of the language model
+            temperature: The sampling temperature (model default if None)
+
+        Returns:
+            The chat model
+        """
+        key = (model_name, temperature)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                kwargs = {
+                    "model": model_name,
+                    "http_client": self.http_client,
+                    "http_async_client": self.http_async_client,
+                    # Retries are scheduled by utils.rate_limit, with the shared limiter
+                    "max_retries": 0,
+                }
+                if temperature is not None:
+                    kwargs["temperature"] = temperature
+                model = ChatOpenAI(**kwargs)
+                self._models[key] = model
+            return model
+
+    def close(self) -> None:
+        """Close the synchronous HTTP client."""
+        self.http_client.close()
+        with self._lock:
+            self._models.clear()
+
+    async def aclose(self) -> None:
+        """Close both HTTP clients."""
+        await self.http_async_client.aclose()
+        self.close()
+
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """Async transport with a connection pool of its own for each event loop."""
+
+    def __init__(self, limits: httpx.Limits):
+        """Initialize the transport.
+
+        Args:
+            limits: Connection limits of each loop's pool
+        """
+        self.limits = limits
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """Close the pool of the running loop and forget those of other loops.
+
+        Connections of another loop can only be closed on that loop; they are
+        released when their loop is garbage collected.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.pop(loop, None)
+            self._transports.clear()
+        if transport is not None:
+            await transport.aclose()
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                # Pools of loops that have since closed can no longer be used
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = httpx.AsyncHTTPTransport(limits=self.limits)
+                self._transports[loop] = transport
+            return transport
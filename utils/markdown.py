@@ -0,0 +1,505 @@
+"""Markdown Parsing and Rendering
+
+This module parses the Markdown our term sheets are written in into a small
+block and inline syntax tree, and renders the tree as DOCX, HTML or plain text.
+Every line is classified once by a single compiled pattern and every block's
+text is tokenized once for inline formatting, so parsing is linear in the
+length of the document, and a parsed document can be exported to any number of
+formats without being parsed again.
+
+Supported syntax:
+
+- headings (``#`` to ``######``) and horizontal rules (``---``)
+- paragraphs; consecutive lines of a paragraph are kept as line breaks, since
+  term sheets are laid out line by line (signature blocks, for example)
+- bulleted (``-``, ``*``, ``+``) and numbered (``1.``, ``1)``, ``(1)``) list
+  items, nested by indenting them two spaces per level, with indented
+  continuation lines
+- pipe tables with a separator row under the header, with column alignment
+- ``**bold**``, ``*italic*`` or ``_italic_``, ``***bold italic***``,
+  ```code``` spans and backslash escapes
+
+Nodes are dictionaries with a ``type``. The ``document`` has block
+``children``; ``heading`` (with a ``level``) and ``paragraph`` blocks have
+inline ``children``; ``list`` blocks (``ordered``, ``start``, ``delimiter``)
+have ``items``, whose ``children`` are blocks; ``table`` blocks have the
+``align`` of each column, a ``header`` and ``rows`` of cells, where each cell
+is a list of inline nodes; a ``rule`` has no content. Inline nodes are ``text``
+and ``code`` (with their ``text``), ``strong`` and ``emphasis`` (with
+``children``) and line ``break``.
+"""
+
+import re
+import html
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.docx_writer import DocxStreamWriter
+
+
+Node = Dict[str, Any]
+
+# Each line is one of these kinds; every alternative is wrapped in a group named
+# after its kind, so the match's ``lastgroup`` is the kind
+LINE_PATTERN = re.compile(
+    r"(?P<blank>[ \t]*$)"
+    r"|(?P<rule> {0,3}(?:(?:-[ \t]*){3,}|(?:\*[ \t]*){3,}|(?:_[ \t]*){3,})$)"
+    r"|(?P<heading>(?P<hashes>#{1,6})[ \t]+(?P<heading_text>.*?)(?:[ \t]+#+)?[ \t]*$)"
+    r"|(?P<item>(?P<indent>[ \t]*)(?:(?P<bullet>[-*+])|(?P<number>\d{1,9})(?P<delimiter>[.)])"
+    r"|\((?P<paren>\d{1,9})\))[ \t]+(?P<item_text>.*))"
+    r"|(?P<row>[ \t]*\|.*)"
+    r"|(?P<text>.*)"
+)
+SEPARATOR_PATTERN = re.compile(r"[ \t]*\|(?:[ \t]*:?-+:?[ \t]*\|)*[ \t]*:?-+:?[ \t]*\|?[ \t]*$")
+CELL_DELIMITER = re.compile(r"(?<!\\)\|")
+
+# A nested list item is indented at least this many columns more than its parent
+LIST_INDENT = 2
+
+# The leading lookahead lets the regex engine skip plain text quickly
+INLINE_PATTERN = re.compile(
+    r"(?=[\\`*_\n])(?:"
+    r"(?P<escape>\\[\\`*_{}\[\]()#+\-.!|])"
+    r"|(?P<code>(?P<ticks>`+)(?P<code_text>.+?)(?P=ticks))"
+    r"|(?P<literal>\*{4,}|_{3,})"
+    r"|(?P<delimiter>\*{1,3}|_{1,2})"
+    r"|(?P<newline>\n))"
+)
+# Text without any of these characters has no inline formatting
+INLINE_CHARACTERS = re.compile(r"[\\`*_\n]")
+
+# DOCX style IDs; headings use the styles of levels 1 to 6
+DOCX_HEADING_STYLE = "Heading{level}"
+DOCX_BULLET_STYLES = ("ListBullet", "ListBullet2", "ListBullet3")
+DOCX_NUMBER_STYLES = ("ListNumber", "ListNumber2", "ListNumber3")
+DOCX_CONTINUE_STYLES = ("ListContinue", "ListContinue2", "ListContinue3")
+DOCX_CODE_STYLE = "Code"
+RULE_WIDTH = 50
+
+
+def parse(text: str) -> Node:
+    """Parse Markdown text into a document tree.
+
+    Args:
+        text: The Markdown text
+
+    Returns:
+        The document node
+    """
+    return _BlockParser().parse(text)
+
+
+def parse_inline(text: str) -> List[Node]:
+    """Parse the inline formatting of a block's text.
+
+    Emphasis delimiters that are never closed are kept as literal text, and
+    line breaks in the text become ``break`` nodes.
+
+    Args:
+        text: The text of one block
+
+    Returns:
+        The inline nodes
+    """
+    if not INLINE_CHARACTERS.search(text):
+        return [{"type": "text", "text": text}] if text else []
+
+    # Open emphasis frames: (delimiter, children), with the block itself at the bottom
+    stack: List[Tuple[str, List[Node]]] = [("", [])]
+    position = 0
+    for match in INLINE_PATTERN.finditer(text):
+        children = stack[-1][1]
+        _append_text(children, text[position:match.start()])
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "escape":
+            _append_text(children, match.group()[1])
+        elif kind == "code":
+            children.append({"type": "code", "text": match.group("code_text")})
+        elif kind == "newline":
+            children.append({"type": "break"})
+        elif kind == "literal":
+            _append_text(children, match.group())
+        else:
+            _delimiter(stack, match.group(), text, match.start(), match.end())
+    _append_text(stack[-1][1], text[position:])
+
+    while len(stack) > 1:
+        _unwind(stack)
+    return stack[0][1]
+
+
+def render_docx(document: Node, writer: DocxStreamWriter) -> None:
+    """Write a document tree to an open DOCX writer.
+
+    Top-level blocks are separated by an empty paragraph, as blank lines
+    separate them in the text.
+
+    Args:
+        document: The document node
+        writer: The writer of the open document
+    """
+    for index, block in enumerate(document["children"]):
+        if index:
+            writer.add_paragraph()
+        _docx_block(writer, block, 0)
+
+
+def render_html(document: Node) -> str:
+    """Render a document tree as an HTML fragment.
+
+    Args:
+        document: The document node
+
+    Returns:
+        The HTML
+    """
+    parts: List[str] = []
+    for block in document["children"]:
+        _html_block(parts, block)
+    return "".join(parts)
+
+
+def render_text(document: Node) -> str:
+    """Render a document tree as plain text without markup.
+
+    Args:
+        document: The document node
+
+    Returns:
+        The text, with blocks separated by blank lines
+    """
+    return "\n\n".join("\n".join(_text_block(block)) for block in document["children"]) + "\n"
+
+
+class _BlockParser:
+    """Builds the block tree from the lines of a document in a single pass."""
+
+    def __init__(self):
+        self.blocks: List[Node] = []
+        # The lines of the open paragraph, and the blocks it will be added to
+        self.lines: List[str] = []
+        self.container: List[Node] = self.blocks
+        # Open lists, innermost last, with the indentation of their items
+        self.lists: List[Tuple[int, Node]] = []
+        self.table: Optional[Node] = None
+
+    def parse(self, text: str) -> Node:
+        lines = text.split("\n")
+        index = 0
+        while index < len(lines):
+            line = lines[index].rstrip()
+            match = LINE_PATTERN.match(line)
+            kind = match.lastgroup
+            index += 1
+
+            if kind == "row" and self.table is None:
+                if index < len(lines) and SEPARATOR_PATTERN.match(lines[index]):
+                    self._start_table(line, lines[index])
+                    index += 1
+                    continue
+                kind = "text"
+            elif kind == "row":
+                self.table["rows"].append(self._cells(line))
+                continue
+
+            if kind == "blank":
+                self._close_paragraph()
+                self.table = None
+            elif kind == "heading":
+                self._close_blocks()
+                self.blocks.append({"type": "heading", "level": len(match.group("hashes")),
+                                    "children": parse_inline(match.group("heading_text"))})
+            elif kind == "rule":
+                self._close_blocks()
+                self.blocks.append({"type": "rule"})
+            elif kind == "item":
+                self._add_item(match)
+            elif self.lists and line[:1] in (" ", "\t"):
+                # An indented line continues the current list item
+                if not self.lines:
+                    self.container = self.lists[-1][1]["items"][-1]["children"]
+                self.lines.append(line.strip())
+            else:
+                if self.lists or self.table is not None:
+                    self._close_blocks()
+                self.lines.append(line.strip())
+
+        self._close_blocks()
+        return {"type": "document", "children": self.blocks}
+
+    def _add_item(self, match: re.Match) -> None:
+        self._close_paragraph()
+        self.table = None
+        indent = len(match.group("indent").expandtabs(4))
+        ordered = match.group("bullet") is None
+        delimiter = (match.group("delimiter") or "()") if ordered else None
+        while self.lists and indent < self.lists[-1][0]:
+            self.lists.pop()
+        if (self.lists and indent < self.lists[-1][0] + LIST_INDENT
+                and self.lists[-1][1].get("delimiter") != delimiter):
+            # A different kind of list at the same level starts a new list
+            self.lists.pop()
+
+        if self.lists and indent < self.lists[-1][0] + LIST_INDENT:
+            current = self.lists[-1][1]
+        else:
+            container = self.lists[-1][1]["items"][-1]["children"] if self.lists else self.blocks
+            current = {"type": "list", "ordered": ordered, "items": []}
+            if ordered:
+                current["start"] = int(match.group("number") or match.group("paren"))
+                current["delimiter"] = delimiter
+            container.append(current)
+            self.lists.append((indent, current))
+
+        item = {"type": "item", "children": []}
+        current["items"].append(item)
+        self.container = item["children"]
+        self.lines.append(match.group("item_text"))
+
+    def _start_table(self, header: str, separator: str) -> None:
+        self._close_blocks()
+        align = []
+        for cell in self._split_cells(separator):
+            left, right = cell.startswith(":"), cell.endswith(":")
+            align.append("center" if left and right else "right" if right else "left" if left else None)
+        self.table = {"type": "table", "align": align, "header": [], "rows": []}
+        self.table["header"] = self._cells(header)
+        self.blocks.append(self.table)
+
+    def _cells(self, line: str) -> List[List[Node]]:
+        cells = [parse_inline(cell) for cell in self._split_cells(line)]
+        columns = len(self.table["align"])
+        return (cells + [[] for _ in range(columns - len(cells))])[:columns]
+
+    @staticmethod
+    def _split_cells(line: str) -> List[str]:
+        line = line.strip()
+        if line.startswith("|"):
+            line = line[1:]
+        if line.endswith("|") and not line.endswith("\\|"):
+            line = line[:-1]
+        return [cell.strip() for cell in CELL_DELIMITER.split(line)]
+
+    def _close_paragraph(self) -> None:
+        if self.lines:
+            self.container.append({"type": "paragraph", "children": parse_inline("\n".join(self.lines))})
+            self.lines = []
+        self.container = self.blocks
+
+    def _close_blocks(self) -> None:
+        self._close_paragraph()
+        self.lists = []
+        self.table = None
+
+
+def _append_text(children: List[Node], text: str) -> None:
+    if not text:
+        return
+    if children and children[-1]["type"] == "text":
+        children[-1]["text"] += text
+    else:
+        children.append({"type": "text", "text": text})
+
+
+def _delimiter(stack: List[Tuple[str, List[Node]]], run: str, text: str, start: int, end: int) -> None:
+    """Open or close emphasis for a run of ``*`` or ``_`` characters."""
+    before = text[start - 1] if start else " "
+    after = text[end] if end < len(text) else " "
+    can_open = not after.isspace()
+    can_close = not before.isspace()
+    if run[0] == "_":
+        # Underscores inside a word, as in snake_case, are not emphasis
+        can_open = can_open and not before.isalnum()
+        can_close = can_close and not after.isalnum()
+
+    if len(run) == 3:
+        # Bold italic: close the inner delimiter first, or open bold then italic
+        pieces = [run[:1], run[:2]] if can_close and stack[-1][0] == run[:1] else [run[:2], run[:1]]
+    else:
+        pieces = [run]
+    for piece in pieces:
+        opened = [index for index, (delimiter, _) in enumerate(stack) if delimiter == piece]
+        if can_close and opened:
+            while len(stack) - 1 > opened[-1]:
+                _unwind(stack)
+            _, children = stack.pop()
+            node_type = "strong" if len(piece) == 2 else "emphasis"
+            stack[-1][1].append({"type": node_type, "children": children})
+        elif can_open:
+            stack.append((piece, []))
+        else:
+            _append_text(stack[-1][1], piece)
+
+
+def _unwind(stack: List[Tuple[str, List[Node]]]) -> None:
+    # An emphasis that is never closed was literal text after all
+    delimiter, children = stack.pop()
+    parent = stack[-1][1]
+    _append_text(parent, delimiter)
+    for child in children:
+        if child["type"] == "text":
+            _append_text(parent, child["text"])
+        else:
+            parent.append(child)
+
+
+def _docx_block(writer: DocxStreamWriter, block: Node, depth: int) -> None:
+    kind = block["type"]
+    if kind == "heading":
+        writer.add_paragraph(style=DOCX_HEADING_STYLE.format(level=block["level"]))
+        _docx_inlines(writer, block["children"])
+    elif kind == "paragraph":
+        writer.add_paragraph(style=DOCX_CONTINUE_STYLES[min(depth, 3) - 1] if depth else None)
+        _docx_inlines(writer, block["children"])
+    elif kind == "list":
+        styles = DOCX_NUMBER_STYLES if block["ordered"] else DOCX_BULLET_STYLES
+        style = styles[min(depth, len(styles) - 1)]
+        for item in block["items"]:
+            children = item["children"]
+            writer.add_paragraph(style=style)
+            if children and children[0]["type"] == "paragraph":
+                _docx_inlines(writer, children[0]["children"])
+                children = children[1:]
+            for child in children:
+                _docx_block(writer, child, depth + 1)
+    elif kind == "table":
+        writer.start_table(len(block["align"]))
+        for row_index, row in enumerate([block["header"]] + block["rows"]):
+            writer.add_table_row(header=not row_index)
+            for column, cell in enumerate(row):
+                writer.add_table_cell(alignment=block["align"][column])
+                _docx_inlines(writer, cell, bold=not row_index)
+        writer.end_table()
+    elif kind == "rule":
+        writer.add_paragraph()
+        writer.add_run("_" * RULE_WIDTH)
+
+
+def _docx_inlines(writer: DocxStreamWriter, nodes: List[Node], bold: bool = False, italic: bool = False) -> None:
+    for node in nodes:
+        kind = node["type"]
+        if kind == "text":
+            writer.add_run(node["text"], bold=bold, italic=italic)
+        elif kind == "strong":
+            _docx_inlines(writer, node["children"], True, italic)
+        elif kind == "emphasis":
+            _docx_inlines(writer, node["children"], bold, True)
+        elif kind == "code":
+            writer.add_run(node["text"], bold=bold, italic=italic, style=DOCX_CODE_STYLE)
+        elif kind == "break":
+            writer.add_run("\n")
+
+
+def _html_block(parts: List[str], block: Node) -> None:
+    kind = block["type"]
+    if kind == "heading":
+        parts.append(f"<h{block['level']}>{_html_inlines(block['children'])}</h{block['level']}>\n")
+    elif kind == "paragraph":
+        parts.append(f"<p>{_html_inlines(block['children'])}</p>\n")
+    elif kind == "list":
+        if block["ordered"]:
+            start = f' start="{block["start"]}"' if block["start"] != 1 else ""
+            parts.append(f"<ol{start}>\n")
+        else:
+            parts.append("<ul>\n")
+        for item in block["items"]:
+            children = item["children"]
+            parts.append("<li>")
+            if children and children[0]["type"] == "paragraph":
+                parts.append(_html_inlines(children[0]["children"]))
+                children = children[1:]
+            if children:
+                parts.append("\n")
+                for child in children:
+                    _html_block(parts, child)
+            parts.append("</li>\n")
+        parts.append("</ol>\n" if block["ordered"] else "</ul>\n")
+    elif kind == "table":
+        parts.append("<table>\n<thead>\n")
+        _html_row(parts, block["header"], block["align"], "th")
+        parts.append("</thead>\n<tbody>\n")
+        for row in block["rows"]:
+            _html_row(parts, row, block["align"], "td")
+        parts.append("</tbody>\n</table>\n")
+    elif kind == "rule":
+        parts.append("<hr>\n")
+
+
+def _html_row(parts: List[str], cells: List[List[Node]], align: List[Optional[str]], tag: str) -> None:
+    parts.append("<tr>")
+    for cell, alignment in zip(cells, align):
+        style = f' style="text-align: {alignment}"' if alignment else ""
+        parts.append(f"<{tag}{style}>{_html_inlines(cell)}</{tag}>")
+    parts.append("</tr>\n")
+
+
+def _html_inlines(nodes: List[Node]) -> str:
+    parts = []
+    for node in nodes:
+        kind = node["type"]
+        if kind == "text":
+            parts.append(html.escape(node["text"], quote=False))
+        elif kind == "strong":
+            parts.append(f"<strong>{_html_inlines(node['children'])}</strong>")
+        elif kind == "emphasis":
+            parts.append(f"<em>{_html_inlines(node['children'])}</em>")
+        elif kind == "code":
+            parts.append(f"<code>{html.escape(node['text'], quote=False)}</code>")
+        elif kind == "break":
+            parts.append("<br>\n")
+    return "".join(parts)
+
+
+def _text_block(block: Node) -> List[str]:
+    kind = block["type"]
+    if kind in ("heading", "paragraph"):
+        return _text_inlines(block["children"]).split("\n")
+    if kind == "list":
+        lines = []
+        for number, item in enumerate(block["items"], block.get("start", 1)):
+            if not block["ordered"]:
+                marker = "-"
+            elif block["delimiter"] == "()":
+                marker = f"({number})"
+            else:
+                marker = f"{number}{block['delimiter']}"
+            padding = " " * (len(marker) + 1)
+            item_lines = [line for child in item["children"] for line in _text_block(child)]
+            for index, line in enumerate(item_lines or [""]):
+                lines.append((f"{marker} " if not index else padding) + line if line else line)
+        return lines
+    if kind == "table":
+        rows = [[_text_inlines(cell).replace("\n", " ") for cell in row]
+                for row in [block["header"]] + block["rows"]]
+        widths = [max(len(row[column]) for row in rows) for column in range(len(block["align"]))]
+        lines = [_text_row(row, widths, block["align"]) for row in rows]
+        lines.insert(1, "  ".join("-" * width for width in widths))
+        return lines
+    if kind == "rule":
+        return ["-" * RULE_WIDTH]
+    return []
+
+
+def _text_row(cells: List[str], widths: List[int], align: List[Optional[str]]) -> str:
+    padded = []
+    for cell, width, alignment in zip(cells, widths, align):
+        if alignment == "right":
+            padded.append(cell.rjust(width))
+        elif alignment == "center":
+            padded.append(cell.center(width))
+        else:
+            padded.append(cell.ljust(width))
+    return "  ".join(padded).rstrip()
+
+
+def _text_inlines(nodes: List[Node]) -> str:
+    parts = []
+    for node in nodes:
+        kind = node["type"]
+        if kind in ("text", "code"):
+            parts.append(node["text"])
+        elif kind in ("strong", "emphasis"):
+            parts.append(_text_inlines(node["children"]))
+        elif kind == "break":
+            parts.append("\n")
+    return "".join(parts)
@@ -0,0 +1,279 @@
+"""Pipeline Metrics
+
+This module records per-run timing spans and LLM usage for the generation
+pipeline. The active RunMetrics is held in a context variable, so agents can
+record spans and LLM calls without it being passed through every call. When the
+``opentelemetry`` package is installed, spans are also reported to its tracer.
+"""
+
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # OpenTelemetry is optional
+    otel_trace = None
+
+
+logger = logging.getLogger("termsheet.metrics")
+
+# USD per 1K prompt / completion tokens, used for cost estimates
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+_current_metrics: contextvars.ContextVar = contextvars.ContextVar("current_metrics", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class RunMetrics:
+    """Timing spans and LLM call records for one pipeline run."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        """Initialize the run metrics.
+
+        Args:
+            run_id: Identifier of the run (a random id if None)
+        """
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, duration_ms: float, parent: Optional[str] = None,
+                 error: Optional[str] = None, **attributes: Any) -> None:
+        """Record a finished span.
+
+        Args:
+            name: The span name, e.g. ``refine`` or ``intent.llm``
+            duration_ms: The span duration in milliseconds
+            parent: The name of the enclosing span
+            error: The error message if the span failed
+            **attributes: Additional span attributes
+        """
+        record = {"name": name, "parent": parent, "duration_ms": round(duration_ms, 3)}
+        if error:
+            record["error"] = error
+        if attributes:
+            record["attributes"] = attributes
+        with self._lock:
+            self.spans.append(record)
+
+    def add_llm_call(self, model: str, duration_ms: float, prompt_tokens: int = 0,
+                     completion_tokens: int = 0, cached: bool = False,
+                     stage: Optional[str] = None) -> None:
+        """Record an LLM call.
+
+        Args:
+            model: The model name
+            duration_ms: The call duration in milliseconds
+            prompt_tokens: Number of prompt tokens reported by the API
+            completion_tokens: Number of completion tokens reported by the API
+            cached: Whether the response was served from the response cache
+            stage: The span the call was made in
+        """
+        record = {
+            "model": model,
+            "stage": stage,
+            "duration_ms": round(duration_ms, 3),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached": cached,
+            "cost_usd": 0.0 if cached else estimate_cost(model, prompt_tokens, completion_tokens),
+        }
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the metrics as a JSON-serializable dictionary.
+
+        Returns:
+            The run id, spans, LLM calls and totals
+        """
+        with self._lock:
+            spans = list(self.spans)
+            llm_calls = list(self.llm_calls)
+        live_calls = [call for call in llm_calls if not call["cached"]]
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "spans": spans,
+            "llm_calls": llm_calls,
+            "totals": {
+                "duration_ms": round((time.time() - self.started_at) * 1000, 3),
+                "llm_calls": len(live_calls),
+                "cache_hits": len(llm_calls) - len(live_calls),
+                "prompt_tokens": sum(call["prompt_tokens"] for call in llm_calls),
+                "completion_tokens": sum(call["completion_tokens"] for call in llm_calls),
+                "cost_usd": round(sum(call["cost_usd"] for call in llm_calls), 6),
+            },
+        }
+
+    def emit(self) -> None:
+        """Log the metrics as a single JSON line on the ``termsheet.metrics`` logger."""
+        logger.info(json.dumps(self.to_dict()))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimate the cost of an LLM call in USD.
+
+    Args:
+        model: The model name
+        prompt_tokens: Number of prompt tokens
+        completion_tokens: Number of completion tokens
+
+    Returns:
+        The estimated cost (0 for models without a known price)
+    """
+    # Match dated variants such as gpt-4o-mini-2024-07-18 to their base model
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            prompt_price, completion_price = MODEL_PRICES[name]
+            return round((prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000, 6)
+    return 0.0
+
+
+def current_metrics() -> Optional[RunMetrics]:
+    """Return the RunMetrics active in the current context, if any."""
+    return _current_metrics.get()
+
+
+@contextmanager
+def use_metrics(metrics: Optional[RunMetrics]) -> Iterator[Optional[RunMetrics]]:
+    """Make a RunMetrics the active one for the duration of the block.
+
+    Args:
+        metrics: The metrics to activate (None disables recording)
+
+    Yields:
+        The activated metrics
+    """
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+def metrics_context(metrics: Optional[RunMetrics]) -> contextvars.Context:
+    """Return a copy of the current context in which a RunMetrics is active.
+
+    Useful for generators: running each step with ``context.run(next, generator)``
+    keeps the metrics active in the generator without leaking them to the consumer.
+
+    Args:
+        metrics: The metrics to activate
+
+    Returns:
+        The context
+    """
+    context = contextvars.copy_context()
+    context.run(_current_metrics.set, metrics)
+    context.run(_current_span.set, None)
+    return context
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time a block as a span of the active RunMetrics.
+
+    Does nothing beyond the optional OpenTelemetry span when no RunMetrics is active.
+
+    Args:
+        name: The span name
+        **attributes: Additional span attributes
+    """
+    metrics = _current_metrics.get()
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    otel_span = None
+    if otel_trace is not None:
+        otel_span = otel_trace.get_tracer("termsheet").start_as_current_span(name, attributes=attributes)
+        otel_span.__enter__()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+        if metrics is not None:
+            metrics.add_span(name, duration_ms, parent=parent, error=error, **attributes)
+
+
+def traced(name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Call a function inside a span.
+
+    Args:
+        name: The span name
+        func: The function
+        *args: Positional arguments for the function
+        **kwargs: Keyword arguments for the function
+
+    Returns:
+        The function's result
+    """
+    with span(name):
+        return func(*args, **kwargs)
+
+
+def record_llm_call(model: str, duration_ms: float, usage: Optional[Dict[str, int]] = None,
+                    cached: bool = False) -> None:
+    """Record an LLM call on the active RunMetrics, if any.
+
+    Args:
+        model: The model name
+        duration_ms: The call duration in milliseconds
+        usage: Token usage with ``prompt_tokens`` and ``completion_tokens`` keys
+        cached: Whether the response was served from the response cache
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    usage = usage or {}
+    metrics.add_llm_call(
+        model,
+        duration_ms,
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        cached=cached,
+        stage=_current_span.get()
+    )
+
+
+def token_usage(message: Any) -> Dict[str, int]:
+    """Extract token usage from a chat model message or chunk.
+
+    Args:
+        message: The message returned by the chat model
+
+    Returns:
+        A dictionary with ``prompt_tokens`` and ``completion_tokens``
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0) or 0,
+            "completion_tokens": usage.get("output_tokens", 0) or 0,
+        }
+    token_usage_metadata = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    return {
+        "prompt_tokens": token_usage_metadata.get("prompt_tokens", 0) or 0,
+        "completion_tokens": token_usage_metadata.get("completion_tokens", 0) or 0,
+    }
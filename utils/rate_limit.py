@@ -0,0 +1,366 @@
+"""LLM Rate Limiting
+
+This module keeps the LLM calls of all agents within the provider's rate limits.
+Every call first takes its share from a limiter shared by the whole process for
+its model, which holds two token buckets: one for requests per minute and one
+for tokens per minute. A call's tokens are estimated from its prompt before the
+call and corrected with the reported usage afterwards.
+
+Waiting calls are served by priority lane, then in arrival order, so
+interactive generations go ahead of batch items. The lane is a context variable;
+``llm_priority(BATCH)`` moves the calls made inside it to the batch lane,
+including calls made in worker threads that copy the context.
+
+Calls that are still rate limited, time out or hit a server error are retried
+with jittered exponential backoff. A rate-limit error also pauses the whole
+limiter, as every other call would be refused too.
+"""
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import openai
+from langchain_core.messages import BaseMessage
+
+
+# Priority lanes; waiting calls of a lower lane go first
+INTERACTIVE = 0
+BATCH = 1
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+
+# Completion tokens assumed for a call that does not set ``max_tokens``, until
+# its actual usage is known
+DEFAULT_COMPLETION_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Longest a waiting call sleeps before checking the buckets again, in seconds
+MAX_POLL_INTERVAL = 0.05
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError)
+
+_lane: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority_lane", default=INTERACTIVE)
+
+
+class RateLimiter:
+    """Request and token buckets shared by the LLM calls of one model."""
+
+    def __init__(self, requests_per_minute: Optional[float] = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: Optional[float] = DEFAULT_TOKENS_PER_MINUTE):
+        """Initialize the limiter with full buckets.
+
+        Args:
+            requests_per_minute: Sustained request rate (requests are not limited if None)
+            tokens_per_minute: Sustained token rate (tokens are not limited if None)
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens: int, lane: Optional[int] = None) -> float:
+        """Wait until a call of an estimated number of tokens may be made.
+
+        Args:
+            tokens: Estimated prompt and completion tokens of the call
+            lane: Priority lane (the current ``llm_priority`` lane if None)
+
+        Returns:
+            The number of seconds waited
+        """
+        start = time.monotonic()
+        waiter = self._enqueue(lane)
+        try:
+            with self._condition:
+                while True:
+                    delay = self._try_take(waiter, tokens)
+                    if delay == 0.0:
+                        return time.monotonic() - start
+                    self._condition.wait(delay)
+        finally:
+            self._dequeue(waiter)
+
+    async def aacquire(self, tokens: int, lane: Optional[int] = None) -> float:
+        """Wait without blocking the event loop until a call may be made.
+
+        Args:
+            tokens: Estimated prompt and completion tokens of the call
+            lane: Priority lane (the current ``llm_priority`` lane if None)
+
+        Returns:
+            The number of seconds waited
+        """
+        start = time.monotonic()
+        waiter = self._enqueue(lane)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_take(waiter, tokens)
+                if delay == 0.0:
+                    return time.monotonic() - start
+                await asyncio.sleep(delay)
+        finally:
+            self._dequeue(waiter)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the actual usage of a call is known.
+
+        Args:
+            estimated: The tokens the call was acquired with
+            actual: The tokens the call used
+        """
+        if not self.tokens_per_minute or actual <= 0:
+            return
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens + min(estimated, self.tokens_per_minute) - actual,
+                               float(self.tokens_per_minute))
+            self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back all calls for a number of seconds, e.g. after a rate-limit error."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def sustainable_concurrency(self, seconds_per_call: float, tokens_per_call: int) -> int:
+        """Return how many callers making calls back to back the limits sustain.
+
+        Args:
+            seconds_per_call: Typical duration of a call
+            tokens_per_call: Typical tokens of a call
+
+        Returns:
+            The number of concurrent callers, at least 1
+        """
+        calls_per_minute = [self.requests_per_minute] if self.requests_per_minute else []
+        if self.tokens_per_minute:
+            calls_per_minute.append(self.tokens_per_minute / max(1, tokens_per_call))
+        if not calls_per_minute:
+            return 1 << 16
+        return max(1, int(min(calls_per_minute) * seconds_per_call / 60))
+
+    def _enqueue(self, lane: Optional[int]) -> Tuple[int, int]:
+        waiter = (_lane.get() if lane is None else lane, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiters, waiter)
+        return waiter
+
+    def _dequeue(self, waiter: Tuple[int, int]) -> None:
+        with self._condition:
+            if self._waiters and self._waiters[0] == waiter:
+                heapq.heappop(self._waiters)
+            else:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            self._condition.notify_all()
+
+    def _try_take(self, waiter: Tuple[int, int], tokens: int) -> float:
+        """Take a call's share if it is first in line; otherwise return how long to wait.
+
+        Must be called with the condition held.
+        """
+        if self._waiters[0] != waiter:
+            return MAX_POLL_INTERVAL
+        now = self._refill()
+        if now < self._paused_until:
+            return min(self._paused_until - now, MAX_POLL_INTERVAL * 20)
+        delays = []
+        if self.requests_per_minute and self._requests < 1:
+            delays.append((1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            # A call larger than the bucket waits for a full bucket, not forever
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                delays.append((needed - self._tokens) * 60 / self.tokens_per_minute)
+        if delays:
+            return max(delays)
+        if self.requests_per_minute:
+            self._requests -= 1
+        if self.tokens_per_minute:
+            self._tokens -= min(tokens, self.tokens_per_minute)
+        return 0.0
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self._requests + elapsed * self.requests_per_minute / 60,
+                                 float(self.requests_per_minute))
+        if self.tokens_per_minute:
+            self._tokens = min(self._tokens + elapsed * self.tokens_per_minute / 60,
+                               float(self.tokens_per_minute))
+        return now
+
+
+@contextmanager
+def llm_priority(lane: int) -> Iterator[None]:
+    """Make the LLM calls inside the block wait in a priority lane.
+
+    Args:
+        lane: ``INTERACTIVE`` or ``BATCH``
+    """
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def estimate_tokens(messages: List[BaseMessage], call_options: Dict[str, Any]) -> int:
+    """Estimate the prompt and completion tokens of a call before it is made.
+
+    Args:
+        messages: The prompt messages
+        call_options: The options of the call; ``max_tokens`` bounds the completion
+
+    Returns:
+        The estimated number of tokens
+    """
+    return estimate_prompt_tokens(messages) + (call_options.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def estimate_prompt_tokens(messages: List[BaseMessage]) -> int:
+    """Estimate the tokens of prompt messages from their length.
+
+    Args:
+        messages: The prompt messages
+
+    Returns:
+        The estimated number of tokens
+    """
+    characters = sum(len(message.content) if isinstance(message.content, str) else len(str(message.content))
+                     for message in messages)
+    return characters // CHARS_PER_TOKEN
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """Return the seconds to wait before retrying a failed call.
+
+    The delay is drawn uniformly up to an exponentially growing bound ("full
+    jitter"), so callers that failed together do not retry together. A
+    ``Retry-After`` header on the error's response is honoured as a minimum.
+
+    Args:
+        attempt: The number of the failed attempt, starting at 0
+        error: The error the attempt failed with
+
+    Returns:
+        The delay in seconds
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, _retry_after(error))
+
+
+def call_with_retries(limiter: RateLimiter, tokens: int, call: Callable[[], Any]) -> Any:
+    """Make a call through a limiter, retrying transient failures with backoff.
+
+    Args:
+        limiter: The limiter of the model called
+        tokens: Estimated tokens of the call
+        call: Makes the call
+
+    Returns:
+        The result of the call
+
+    Raises:
+        Exception: The error of the last attempt, once the retries are exhausted
+    """
+    for attempt in itertools.count():
+        limiter.acquire(tokens)
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = _failed(limiter, attempt, e)
+        time.sleep(delay)
+
+
+async def acall_with_retries(limiter: RateLimiter, tokens: int,
+                             call: Callable[[], Awaitable[Any]]) -> Any:
+    """Asynchronously make a call through a limiter, retrying transient failures with backoff.
+
+    Args:
+        limiter: The limiter of the model called
+        tokens: Estimated tokens of the call
+        call: Returns the awaitable of the call
+
+    Returns:
+        The result of the call
+
+    Raises:
+        Exception: The error of the last attempt, once the retries are exhausted
+    """
+    for attempt in itertools.count():
+        await limiter.aacquire(tokens)
+        try:
+            return await call()
+        except RETRYABLE_ERRORS as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = _failed(limiter, attempt, e)
+        await asyncio.sleep(delay)
+
+
+def _failed(limiter: RateLimiter, attempt: int, error: BaseException) -> float:
+    delay = backoff_delay(attempt, error)
+    if isinstance(error, openai.RateLimitError):
+        limiter.pause(delay)
+    return delay
+
+
+def _retry_after(error: Optional[BaseException]) -> float:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str) -> RateLimiter:
+    """Return the process-wide limiter of a model, creating it on first use.
+
+    The limits are read from the ``TERM_SHEET_LLM_RPM`` and ``TERM_SHEET_LLM_TPM``
+    environment variables (0 disables a limit), and default to
+    ``DEFAULT_REQUESTS_PER_MINUTE`` and ``DEFAULT_TOKENS_PER_MINUTE``.
+
+    Args:
+        model_name: The name of the language model
+
+    Returns:
+        The shared RateLimiter of the model
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            limiter = RateLimiter(
+                float(os.environ.get("TERM_SHEET_LLM_RPM", DEFAULT_REQUESTS_PER_MINUTE)) or None,
+                float(os.environ.get("TERM_SHEET_LLM_TPM", DEFAULT_TOKENS_PER_MINUTE)) or None,
+            )
+            _limiters[model_name] = limiter
+        return limiter
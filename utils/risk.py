@@ -0,0 +1,84 @@
+"""Term Sheet Risk Scoring
+
+This module compares a term sheet with the baseline it was generated from (the
+draft rendered from our templates) clause by clause, and scores every section by
+how far it departs from that baseline and by the rule findings in the clauses
+that changed. Only sections that score high enough need an LLM review, and only
+their changed clauses are sent, so the cost of validation scales with how much
+the document differs from standard template text.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.sections import section_title, split_sections
+
+
+# Weight of a rule finding in a changed clause, by severity
+SEVERITY_WEIGHTS = {"high": 3.0, "medium": 2.0, "low": 1.0}
+
+# Weight of a clause that differs from the baseline
+CHANGED_CLAUSE_WEIGHT = 1.0
+
+# A clause is a paragraph: a run of lines without a blank line in between
+CLAUSE_PATTERN = re.compile(r"(?:[^\n]|\n(?!\s*\n))+")
+MARKUP = re.compile(r"[*_`#>]+")
+
+
+def score_sections(term_sheet: str, baseline: Optional[str],
+                   findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score each section of a term sheet against its baseline.
+
+    A clause is a paragraph; it counts as changed when no paragraph of the
+    baseline has the same text, ignoring case, whitespace and Markdown markup.
+    Without a baseline every clause counts as changed.
+
+    Args:
+        term_sheet: The term sheet to score
+        baseline: The known-safe text the term sheet was derived from, if any
+        findings: The rule findings for the term sheet, with their ``locations``
+
+    Returns:
+        For every section, in document order, a dictionary with its ``title``, the
+        ``excerpt`` to review (its header and changed clauses), the number of
+        ``changed`` and total ``clauses``, and its risk ``score``
+    """
+    known = {_normalize(clause) for clause in _clauses(baseline)} if baseline is not None else set()
+    scores = []
+    offset = 0
+    for section in split_sections(term_sheet):
+        title = section_title(section)
+        header = section.split("\n", 1)[0] if title else ""
+        clauses = 0
+        changed = []
+        score = 0.0
+        for match in CLAUSE_PATTERN.finditer(section, len(header)):
+            clause = match.group(0).strip()
+            if not clause:
+                continue
+            clauses += 1
+            if baseline is not None and _normalize(clause) in known:
+                continue
+            changed.append(clause)
+            start, end = offset + match.start(), offset + match.end()
+            score += CHANGED_CLAUSE_WEIGHT + sum(
+                SEVERITY_WEIGHTS.get(finding.get("severity"), 0.0)
+                for finding in findings
+                for location in finding.get("locations", ())
+                if start <= location["span"][0] < end
+            )
+        excerpt = "\n\n".join(([header] if header else []) + changed)
+        scores.append({"title": title, "excerpt": excerpt, "changed": len(changed),
+                       "clauses": clauses, "score": score})
+        offset += len(section)
+    return scores
+
+
+def _clauses(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [match.group(0).strip() for match in CLAUSE_PATTERN.finditer(text) if match.group(0).strip()]
+
+
+def _normalize(clause: str) -> str:
+    return " ".join(MARKUP.sub("", clause).lower().split())
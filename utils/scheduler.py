@@ -0,0 +1,123 @@
+"""Stage Scheduler
+
+This module provides a small dependency-aware scheduler that runs independent
+pipeline stages concurrently. Work submitted to its thread pools runs in a copy
+of the submitting thread's context, so context variables such as the active run
+metrics follow the work into worker threads.
+"""
+
+import contextvars
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+
+def submit_in_context(executor: Executor, func: Callable[..., Any], *args: Any) -> Future:
+    """Submit a callable that runs in a copy of the current context.
+
+    Args:
+        executor: The executor to submit to
+        func: The callable
+        *args: Positional arguments for the callable
+
+    Returns:
+        The future of the call
+    """
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args)
+
+
+def context_map(executor: Executor, func: Callable[..., Any], *iterables: Iterable) -> List[Any]:
+    """Like ``executor.map``, with each call running in a copy of the current context.
+
+    Args:
+        executor: The executor to run the calls on
+        func: The callable
+        *iterables: Iterables of positional arguments, as for ``map``
+
+    Returns:
+        The results, in input order
+    """
+    futures = [submit_in_context(executor, func, *args) for args in zip(*iterables)]
+    return [future.result() for future in futures]
+
+
+class StageScheduler:
+    """Run named stages concurrently while respecting their dependencies.
+
+    Each stage is a callable that receives the results of the stages it depends
+    on as positional arguments, in the order the dependencies were declared.
+    Stages whose dependencies are satisfied run at the same time on a thread
+    pool. Results are returned in registration order regardless of the order in
+    which stages finish, so merging them is deterministic.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """Initialize the scheduler.
+
+        Args:
+            max_workers: Maximum number of stages run at once (defaults to one per stage)
+        """
+        self.max_workers = max_workers
+        self._stages: Dict[str, Callable[..., Any]] = {}
+        self._dependencies: Dict[str, List[str]] = {}
+
+    def add_stage(self, name: str, func: Callable[..., Any],
+                  depends_on: Sequence[str] = ()) -> None:
+        """Register a stage.
+
+        Args:
+            name: Unique name of the stage
+            func: Callable invoked with the results of its dependencies
+            depends_on: Names of previously registered stages this stage needs
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        for dependency in depends_on:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self._stages[name] = func
+        self._dependencies[name] = list(depends_on)
+
+    def run(self) -> Dict[str, Any]:
+        """Run all registered stages.
+
+        Returns:
+            A dictionary mapping stage names to their results, in registration order
+
+        Raises:
+            Exception: The error of the first failed stage, in registration order,
+                once all running stages have finished
+        """
+        results: Dict[str, Any] = {}
+        errors: Dict[str, BaseException] = {}
+        remaining = list(self._stages)
+        if not remaining:
+            return results
+
+        max_workers = self.max_workers or len(remaining)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+            while remaining or running:
+                if not errors:
+                    for name in list(remaining):
+                        dependencies = self._dependencies[name]
+                        if all(dependency in results for dependency in dependencies):
+                            args = [results[dependency] for dependency in dependencies]
+                            running[submit_in_context(executor, self._stages[name], *args)] = name
+                            remaining.remove(name)
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        errors[name] = e
+
+        for name in self._stages:
+            if name in errors:
+                raise errors[name]
+
+        return {name: results[name] for name in self._stages if name in results}
@@ -0,0 +1,69 @@
+"""Term Sheet Sections
+
+This module splits term sheets into sections at their ``##`` headers so that
+agents can work on individual sections instead of the whole document.
+"""
+
+import re
+from typing import List
+
+
+SECTION_HEADER_PATTERN = re.compile(r"^## ", re.MULTILINE)
+
+
+def split_sections(text: str) -> List[str]:
+    """Split a term sheet into sections at its ``##`` headers.
+
+    The first section holds everything before the first header (the title block).
+    Every section keeps its header line and trailing whitespace, so joining the
+    sections with ``join_sections`` gives back the original text exactly.
+
+    Args:
+        text: The term sheet content
+
+    Returns:
+        The list of sections
+    """
+    starts = [match.start() for match in SECTION_HEADER_PATTERN.finditer(text)]
+    boundaries = [0] + [start for start in starts if start > 0] + [len(text)]
+    return [text[begin:end] for begin, end in zip(boundaries, boundaries[1:]) if end > begin]
+
+
+def join_sections(sections: List[str]) -> str:
+    """Join sections produced by ``split_sections`` back into a document.
+
+    Args:
+        sections: The list of sections
+
+    Returns:
+        The term sheet content
+    """
+    return "".join(sections)
+
+
+def section_title(section: str) -> str:
+    """Return the header text of a section, or an empty string for the title block.
+
+    Args:
+        section: A section produced by ``split_sections``
+
+    Returns:
+        The section title
+    """
+    if section.startswith("## "):
+        return section[3:].split("\n", 1)[0].strip()
+    return ""
+
+
+def replace_section_body(original: str, refined: str) -> str:
+    """Keep the trailing whitespace of an original section on its refined version.
+
+    Args:
+        original: The original section
+        refined: The refined section text
+
+    Returns:
+        The refined section, separated from the next section like the original
+    """
+    trailing = original[len(original.rstrip()):]
+    return refined.rstrip() + (trailing or "\n")
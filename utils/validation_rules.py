@@ -0,0 +1,161 @@
+"""Rule-Based Term Sheet Validation
+
+This module loads the declarative rule pack in ``validation_rules.json`` and
+compiles all of its patterns into one scanner. A single pass over the term
+sheet tries the alternation of every rule at each word start, as a zero-width
+lookahead; only at the few positions where some rule matches are the rules'
+own patterns run to tell which ones apply, so overlapping rules are all
+reported. Rule patterns only use bounded gaps that stop at the end of a
+sentence, which keeps each attempt short and the scan linear in the length of
+the document.
+
+A rule has an ``id``, a ``clause`` title, a ``severity``, one or more
+``patterns``, the ``issue`` and ``suggestion`` reported, and optionally an
+``above`` or ``below`` threshold compared against the pattern's ``value`` group.
+The clause title may refer to the value as ``{value}``.
+"""
+
+import os
+import re
+import json
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+
+DEFAULT_RULE_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "validation_rules.json")
+
+SEVERITIES = ("high", "medium", "low")
+
+# Rules are only tried where a word (or a dollar amount) starts
+WORD_START = r"(?<![\w$])(?=[\w$])"
+GROUP_NAME = re.compile(r"\(\?P<(\w+)>")
+
+
+class RuleScanner:
+    """A rule pack compiled into a single multi-pattern scanner."""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """Compile the rules.
+
+        Args:
+            rules: The rule definitions
+
+        Raises:
+            ValueError: If a rule is missing a required key or has an invalid pattern
+        """
+        self.rules = [self._check_rule(rule) for rule in rules]
+        self.patterns: List[Tuple[int, Pattern]] = []
+        try:
+            for index, rule in enumerate(self.rules):
+                for pattern in rule["patterns"]:
+                    self.patterns.append((index, re.compile(pattern, re.IGNORECASE)))
+            # Without capturing groups the alternation is much cheaper to try at every word
+            plain = [GROUP_NAME.sub("(?:", pattern) for rule in self.rules for pattern in rule["patterns"]]
+            self.candidates = re.compile(WORD_START + "(?=" + "|".join(plain) + ")", re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid rule pattern: {e}") from e
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_RULE_PACK) -> "RuleScanner":
+        """Load and compile a JSON rule pack.
+
+        Args:
+            path: Path of the rule pack
+
+        Returns:
+            The compiled scanner
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["rules"])
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """Find every rule match in a document.
+
+        Args:
+            text: The document to scan
+
+        Returns:
+            One finding per matching rule, in order of first occurrence, with the
+            ``line`` (1-based) and character ``span`` of the first match and the
+            locations of all matches
+        """
+        line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+        findings: Dict[int, Dict[str, Any]] = {}
+        for candidate in self.candidates.finditer(text):
+            position = candidate.start()
+            for index, pattern in self.patterns:
+                match = pattern.match(text, position)
+                if match is None:
+                    continue
+                rule = self.rules[index]
+                value = match.group("value") if "value" in pattern.groupindex else None
+                if not _passes_threshold(rule, value):
+                    continue
+
+                location = {"line": bisect.bisect_right(line_starts, position), "span": match.span()}
+                finding = findings.get(index)
+                if finding is None:
+                    findings[index] = _finding(rule, value, match.group(0), location)
+                elif position >= finding["locations"][-1]["span"][1]:
+                    # Later words of an already reported phrase may match the rule again
+                    finding["locations"].append(location)
+        return list(findings.values())
+
+    def _check_rule(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        missing = [key for key in ("id", "clause", "patterns", "issue", "suggestion") if key not in rule]
+        if missing:
+            raise ValueError(f"Rule {rule.get('id', '?')} is missing {', '.join(missing)}")
+        if rule.get("severity", "medium") not in SEVERITIES:
+            raise ValueError(f"Rule {rule['id']} has unknown severity {rule['severity']!r}")
+        patterns = rule["patterns"]
+        return dict(rule, patterns=[patterns] if isinstance(patterns, str) else list(patterns))
+
+
+def _passes_threshold(rule: Dict[str, Any], value: Optional[str]) -> bool:
+    if value is None:
+        return True
+    number = float(value)
+    if "above" in rule and number <= rule["above"]:
+        return False
+    if "below" in rule and number >= rule["below"]:
+        return False
+    return True
+
+
+def _finding(rule: Dict[str, Any], value: Optional[str], text: str,
+             location: Dict[str, Any]) -> Dict[str, Any]:
+    clause = rule["clause"].replace("{value}", value) if value is not None else rule["clause"]
+    return {
+        "clause": clause,
+        "issue": rule["issue"],
+        "suggestion": rule["suggestion"],
+        "rule": rule["id"],
+        "severity": rule.get("severity", "medium"),
+        "text": text,
+        "line": location["line"],
+        "span": location["span"],
+        "locations": [location],
+    }
+
+
+_scanners: Dict[str, RuleScanner] = {}
+_scanners_lock = threading.Lock()
+
+
+def get_rule_scanner(path: Optional[str] = None) -> RuleScanner:
+    """Return the process-wide scanner for a rule pack, compiling it on first use.
+
+    Args:
+        path: Path of the rule pack (the bundled ``validation_rules.json`` if None)
+
+    Returns:
+        The compiled scanner
+    """
+    path = os.path.abspath(path or DEFAULT_RULE_PACK)
+    with _scanners_lock:
+        scanner = _scanners.get(path)
+        if scanner is None:
+            scanner = RuleScanner.from_file(path)
+            _scanners[path] = scanner
+    return scanner
@@ -0,0 +1,261 @@
+"""Output Workspaces
+
+This module gives every run its own output directory inside a workspace root,
+so concurrent runs (Streamlit sessions, interactive mode, batch workers, API
+requests) never write to the same files. Files are written atomically: content
+goes to a temporary file in the target directory, which then replaces the target
+in one rename, so a reader never sees a half-written term sheet or DOCX.
+
+A janitor evicts old runs in the background: runs older than the maximum age
+are removed, and when the workspace grows beyond its maximum size the least
+recently modified runs are removed first. Only directories created as runs are
+ever removed, and runs modified within the last few minutes are left alone, as
+they may still be being written.
+"""
+
+import os
+import re
+import time
+import shutil
+import itertools
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+# Marks a directory as a run created by a workspace, and so safe to evict
+RUN_MARKER = ".run"
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600.0
+DEFAULT_JANITOR_INTERVAL = 600.0
+
+# Permissions of written files
+FILE_MODE = 0o644
+
+# Runs modified more recently than this many seconds ago are never evicted
+GRACE_PERIOD = 300.0
+
+logger = logging.getLogger("termsheet.workspace")
+
+
+class OutputWorkspace:
+    """A directory of per-run output directories, with size and age limits."""
+
+    def __init__(self, root: str, max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+                 max_age: Optional[float] = DEFAULT_MAX_AGE):
+        """Initialize the workspace.
+
+        Args:
+            root: Directory the run directories are created in
+            max_bytes: Total size of the runs above which the oldest are evicted
+                (no size limit if None)
+            max_age: Age in seconds after which a run is evicted (no age limit if None)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._janitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def new_run(self, run_id: str) -> str:
+        """Create the output directory of a run.
+
+        Every run gets a new directory: when the name is taken, for example by an
+        earlier run with the same id, a numeric suffix is added.
+
+        Args:
+            run_id: Identifier of the run; unsafe characters are replaced
+
+        Returns:
+            The path of the run directory
+        """
+        os.makedirs(self.root, exist_ok=True)
+        name = run_name(run_id)
+        for attempt in itertools.count(1):
+            path = os.path.join(self.root, name if attempt == 1 else f"{name}-{attempt}")
+            try:
+                os.mkdir(path)
+                break
+            except FileExistsError:
+                continue
+        with open(os.path.join(path, RUN_MARKER), "a", encoding="utf-8"):
+            pass
+        return path
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """List the runs in the workspace.
+
+        Returns:
+            For every run, its ``path``, ``size`` in bytes and the time it was last
+            ``modified``, least recently modified first
+        """
+        runs = []
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return runs
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if not os.path.exists(os.path.join(entry.path, RUN_MARKER)):
+                continue
+            try:
+                runs.append({"path": entry.path, "size": _directory_size(entry.path),
+                             "modified": entry.stat(follow_symlinks=False).st_mtime})
+            except OSError:
+                continue
+        runs.sort(key=lambda run: run["modified"])
+        return runs
+
+    def cleanup(self, now: Optional[float] = None) -> List[str]:
+        """Evict runs beyond the age and size limits.
+
+        Args:
+            now: The current time (``time.time()`` if None)
+
+        Returns:
+            The paths of the evicted runs
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            runs = self.runs()
+            total = sum(run["size"] for run in runs)
+            evicted = []
+            for run in runs:
+                if now - run["modified"] < GRACE_PERIOD:
+                    continue
+                expired = self.max_age is not None and now - run["modified"] > self.max_age
+                oversized = self.max_bytes is not None and total > self.max_bytes
+                if not expired and not oversized:
+                    continue
+                shutil.rmtree(run["path"], ignore_errors=True)
+                total -= run["size"]
+                evicted.append(run["path"])
+        if evicted:
+            logger.info("Evicted %d runs from %s", len(evicted), self.root)
+        return evicted
+
+    def start_janitor(self, interval: float = DEFAULT_JANITOR_INTERVAL) -> None:
+        """Start evicting runs in a background thread, if it is not running yet.
+
+        Args:
+            interval: Seconds between cleanups
+        """
+        with self._lock:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._stop.clear()
+            self._janitor = threading.Thread(target=self._run_janitor, args=(interval,),
+                                             name=f"workspace-janitor:{self.root}", daemon=True)
+            self._janitor.start()
+
+    def stop_janitor(self) -> None:
+        """Stop the background janitor, if it is running."""
+        self._stop.set()
+        janitor = self._janitor
+        if janitor is not None:
+            janitor.join()
+            self._janitor = None
+
+    def _run_janitor(self, interval: float) -> None:
+        while True:
+            try:
+                self.cleanup()
+            except Exception:
+                logger.exception("Cleaning up %s failed", self.root)
+            if self._stop.wait(interval):
+                return
+
+
+def run_name(run_id: str) -> str:
+    """Turn a run identifier into a safe directory name.
+
+    Args:
+        run_id: Identifier of the run
+
+    Returns:
+        The directory name
+    """
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", run_id).strip("._") or "run"
+
+
+@contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    """Write a file atomically through a temporary path.
+
+    The temporary file is created next to the target; it replaces the target
+    when the block completes, and is removed if the block fails.
+
+    Args:
+        path: The path of the file to write
+
+    Yields:
+        The temporary path to write to
+    """
+    directory = os.path.dirname(path) or "."
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    os.close(descriptor)
+    try:
+        # Temporary files are private to their owner; the output is not
+        os.chmod(temporary, FILE_MODE)
+        yield temporary
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def atomic_write(path: str, content: Union[str, bytes]) -> str:
+    """Write text or binary content to a file atomically.
+
+    Args:
+        path: The path of the file to write
+        content: The content; text is encoded as UTF-8
+
+    Returns:
+        The path of the file
+    """
+    with atomic_output(path) as temporary:
+        with open(temporary, "wb") as f:
+            f.write(content.encode("utf-8") if isinstance(content, str) else content)
+    return path
+
+
+def _directory_size(path: str) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+_workspaces: Dict[str, OutputWorkspace] = {}
+_workspaces_lock = threading.Lock()
+
+
+def get_workspace(root: str = "output") -> OutputWorkspace:
+    """Return the process-wide workspace for a directory, creating it on first use.
+
+    Args:
+        root: The workspace directory
+
+    Returns:
+        The workspace, with the default limits
+    """
+    key = os.path.abspath(root)
+    with _workspaces_lock:
+        workspace = _workspaces.get(key)
+        if workspace is None:
+            workspace = OutputWorkspace(root)
+            _workspaces[key] = workspace
+    return workspace